@@ -0,0 +1,226 @@
+"""
+Метрики запроса: SQL запросы, время БД и рендеринга шаблонов
+
+RequestMetricsMiddleware собирает для каждого запроса количество SQL
+запросов, их суммарное время, повторяющиеся запросы (один и тот же SQL
+несколько раз - обычно N+1) и время рендеринга шаблонов. Метрики
+отдаются заголовком Server-Timing (REQUEST_METRICS_HEADER), пишутся
+строкой JSON в лог backend.instrumentation и сверяются с бюджетом
+запросов представления (QUERY_BUDGETS): превышение - предупреждение в лог.
+
+Запросы перехватываются обработчиком execute_wrappers каждого соединения,
+а метрики текущего запроса хранятся в ContextVar, поэтому учитываются и
+запросы асинхронных представлений, выполненные через sync_to_async.
+Время БД включает запросы, выполненные при рендеринге шаблонов.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.template.backends import django as django_backend
+
+
+logger = logging.getLogger(__name__)
+
+_current = ContextVar('request_metrics', default=None)
+
+# Списки параметров IN (%s, %s, ...) разной длины считаются одним запросом
+_PLACEHOLDERS_RE = re.compile(r'\((?:%s, )+%s\)')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class RequestMetrics:
+    """Метрики одного запроса"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = Counter()
+        self.db_time = 0.0
+        self.template_time = 0.0
+
+    def add_query(self, sql, duration):
+        self.queries[_PLACEHOLDERS_RE.sub('(%s, ...)', sql)] += 1
+        self.db_time += duration
+
+    @property
+    def query_count(self):
+        return sum(self.queries.values())
+
+    def duplicates(self):
+        """Повторяющиеся запросы: {SQL: количество выполнений}, частые первыми"""
+        return {sql: count for sql, count in self.queries.most_common() if count > 1}
+
+    def as_dict(self):
+        duplicates = self.duplicates()
+        return {
+            'duration_ms': round((time.perf_counter() - self.started) * 1000, 2),
+            'queries': self.query_count,
+            'db_ms': round(self.db_time * 1000, 2),
+            'template_ms': round(self.template_time * 1000, 2),
+            # Лишние выполнения: все повторы сверх первого
+            'duplicate_queries': sum(duplicates.values()) - len(duplicates),
+            'duplicates': duplicates,
+        }
+
+
+def current_metrics():
+    """Метрики обрабатываемого запроса (None вне RequestMetricsMiddleware)"""
+    return _current.get()
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.add_query(sql, time.perf_counter() - started)
+
+
+def install(db_connection):
+    """Подключает учет запросов к соединению (один раз)"""
+    if _record_query not in db_connection.execute_wrappers:
+        # В начало списка: обертки connection.execute_wrapper() снимаются pop()
+        db_connection.execute_wrappers.insert(0, _record_query)
+
+
+@receiver(connection_created)
+def _connection_created(sender, connection, **kwargs):
+    install(connection)
+
+
+def query_budget(view_name):
+    """Бюджет SQL запросов представления (QUERY_BUDGETS, иначе QUERY_BUDGET_DEFAULT)"""
+    return _setting('QUERY_BUDGETS', {}).get(view_name, _setting('QUERY_BUDGET_DEFAULT', None))
+
+
+def server_timing(data):
+    """Значение заголовка Server-Timing по метрикам запроса"""
+    return ', '.join([
+        f"db;dur={data['db_ms']};desc=\"{data['queries']} queries, {data['duplicate_queries']} duplicate\"",
+        f"tpl;dur={data['template_ms']};desc=\"templates\"",
+        f"app;dur={data['duration_ms']};desc=\"total\"",
+    ])
+
+
+class RequestMetricsMiddleware:
+    """
+    Метрики запроса в Server-Timing, логе и проверке бюджета запросов
+
+    Стоит первым в MIDDLEWARE, чтобы учитывать и запросы сессии и
+    пользователя. Метрики также доступны тестам как response.request_metrics
+    (backend/testing.py). Выключается REQUEST_METRICS_ENABLED = False.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not _setting('REQUEST_METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        # Соединение потока могло открыться до подключения обработчика connection_created
+        install(connection)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def finish(self, request, response, metrics):
+        match = request.resolver_match
+        data = {
+            'method': request.method,
+            'path': request.path,
+            'view': match.view_name if match else None,
+            'status': response.status_code,
+            **metrics.as_dict(),
+        }
+        response.request_metrics = data
+
+        if _setting('REQUEST_METRICS_HEADER', False):
+            timing = server_timing(data)
+            if response.has_header('Server-Timing'):
+                timing = f"{response['Server-Timing']}, {timing}"
+            response.headers['Server-Timing'] = timing
+
+        if logger.isEnabledFor(logging.INFO):
+            # Текст повторяющихся запросов - только в предупреждении о бюджете
+            line = {key: value for key, value in data.items() if key != 'duplicates'}
+            logger.info(json.dumps(line, ensure_ascii=False))
+
+        budget = query_budget(data['view'])
+        if budget is not None and data['queries'] > budget:
+            worst = next(iter(data['duplicates'].items()), None)
+            logger.warning(
+                'Превышен бюджет SQL запросов %s: %d > %d%s',
+                data['view'] or request.path, data['queries'], budget,
+                f'; чаще всего ({worst[1]} раз): {worst[0][:300]}' if worst else '',
+            )
+        return response
+
+
+class TimedTemplate:
+    """Шаблон бэкенда, время рендеринга которого учитывается в метриках запроса"""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = _current.get()
+        if metrics is None:
+            return self.template.render(context, request)
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - started
+
+
+class DjangoTemplates(django_backend.DjangoTemplates):
+    """
+    Шаблонизатор Django с учетом времени рендеринга
+
+    Учитываются шаблоны верхнего уровня (render, render_to_string);
+    {% include %} и {% extends %} входят во время своего родителя.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
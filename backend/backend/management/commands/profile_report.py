@@ -0,0 +1,86 @@
+"""
+Сводка профилей запросов (backend/profiling.py)
+"""
+import io
+import pstats
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Объединяет профили запросов всех процессов по представлениям и выводит самые затратные функции'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', help='Каталог профилей (по умолчанию PROFILING_DIR)')
+        parser.add_argument('--view', help='Только представление с этим именем маршрута (например blog:index)')
+        parser.add_argument('--limit', type=int, default=15, help='Функций на представление')
+        parser.add_argument('--sort', default='cumulative', help='Сортировка pstats (cumulative, tottime, calls)')
+        parser.add_argument('--output', help='Каталог для объединенных файлов <представление>.prof/.collapsed')
+
+    def handle(self, *args, **options):
+        directory = Path(options['dir'] or getattr(settings, 'PROFILING_DIR', 'profiles'))
+        if not directory.is_dir():
+            raise CommandError(f'Каталог профилей не найден: {directory}')
+
+        # Имя файла: <представление>.<pid>.<формат>
+        files = defaultdict(lambda: defaultdict(list))
+        for path in sorted(directory.iterdir()):
+            if path.suffix in ('.prof', '.collapsed'):
+                view = path.name.rsplit('.', 2)[0]
+                files[view][path.suffix].append(path)
+        if options['view']:
+            view = options['view'].replace(':', '_')
+            files = {view: files[view]} if view in files else {}
+        if not files:
+            raise CommandError('Профилей нет')
+
+        output = Path(options['output']) if options['output'] else None
+        if output:
+            output.mkdir(parents=True, exist_ok=True)
+
+        for view, formats in sorted(files.items()):
+            self.stdout.write(self.style.SUCCESS(f'== {view}'))
+            if formats['.collapsed']:
+                stacks = self.merge_stacks(formats['.collapsed'])
+                self.report_stacks(stacks, options['limit'])
+                if output:
+                    (output / f'{view}.collapsed').write_text(
+                        ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common()), encoding='utf-8'
+                    )
+            if formats['.prof']:
+                stream = io.StringIO()
+                stats = pstats.Stats(*map(str, formats['.prof']), stream=stream)
+                stats.sort_stats(options['sort']).print_stats(options['limit'])
+                self.stdout.write(stream.getvalue())
+                if output:
+                    stats.dump_stats(output / f'{view}.prof')
+
+    @staticmethod
+    def merge_stacks(paths):
+        stacks = Counter()
+        for path in paths:
+            for line in path.read_text(encoding='utf-8').splitlines():
+                stack, _, count = line.rpartition(' ')
+                if stack and count.isdigit():
+                    stacks[stack] += int(count)
+        return stacks
+
+    def report_stacks(self, stacks, limit):
+        """Функции с наибольшей долей снимков: собственное время и вместе с вызванными"""
+        total = sum(stacks.values())
+        own = Counter()
+        inclusive = Counter()
+        for stack, count in stacks.items():
+            frames = stack.split(';')
+            own[frames[-1]] += count
+            # Рекурсивная функция считается один раз на снимок
+            for frame in set(frames):
+                inclusive[frame] += count
+
+        self.stdout.write(f'Снимков стека: {total}')
+        self.stdout.write(f'{"собств.":>8} {"всего":>8}  функция')
+        for frame, count in own.most_common(limit):
+            self.stdout.write(f'{count / total:>8.1%} {inclusive[frame] / total:>8.1%}  {frame}')
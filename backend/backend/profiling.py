@@ -0,0 +1,204 @@
+"""
+Профилирование запросов в рабочем окружении
+
+ProfilingMiddleware профилирует долю запросов (PROFILING_SAMPLE_RATE) и
+запросы с заголовком X-Profile-Token, равным PROFILING_TOKEN. Результаты
+накапливаются по представлениям (имя маршрута) и после каждого
+профилированного запроса записываются в PROFILING_DIR:
+
+- 'sampling' (по умолчанию) - сэмплирующий профилировщик: фоновый поток
+  раз в PROFILING_INTERVAL секунд снимает стек потока запроса, файл
+  <представление>.<pid>.collapsed в формате свернутых стеков
+  (flamegraph.pl, speedscope);
+- 'cprofile' - детерминированный cProfile, файл <представление>.<pid>.prof
+  (pstats, snakeviz). Точнее по числу вызовов, но сам замедляет запрос;
+  одновременно профилируется один запрос процесса.
+
+manage.py profile_report объединяет файлы всех процессов и выводит сводку.
+С PROFILING_ENABLED = False middleware не подключается (MiddlewareNotUsed)
+и не добавляет накладных расходов. Профилируются только синхронные
+представления: под ASGI запросы проходят без профилирования, так как
+один поток цикла событий выполняет много запросов одновременно.
+"""
+import cProfile
+import os
+import pstats
+import random
+import re
+import secrets
+import sys
+import threading
+from collections import Counter
+from functools import lru_cache
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+
+TOKEN_HEADER = 'X-Profile-Token'
+PROFILERS = ('sampling', 'cprofile')
+
+_UNSAFE_NAME_RE = re.compile(r'[^\w.-]+')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+@lru_cache(maxsize=4096)
+def _short_path(filename):
+    """Путь файла относительно каталога из sys.path (самого длинного подходящего)"""
+    prefixes = sorted((path for path in sys.path if path), key=len, reverse=True)
+    for prefix in prefixes:
+        if filename.startswith(prefix.rstrip(os.sep) + os.sep):
+            return filename[len(prefix.rstrip(os.sep)) + 1:]
+    return filename
+
+
+def collapse_stack(frame):
+    """Стек кадра в формате свернутых стеков: от корня к листу через ';'"""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        name = getattr(code, 'co_qualname', code.co_name)
+        names.append(f'{name} ({_short_path(code.co_filename)}:{code.co_firstlineno})'.replace(';', ':'))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler:
+    """
+    Сэмплирующий профилировщик одного потока
+
+    Args:
+        thread_id: Идентификатор профилируемого потока (по умолчанию текущий)
+        interval: Интервал между снимками стека, секунд
+    """
+
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.samples = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[collapse_stack(frame)] += 1
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stopped.set()
+        self._thread.join()
+
+
+class ProfileStore:
+    """Профили процесса, накопленные по представлениям"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stacks = {}
+        self._stats = {}
+
+    def _path(self, view_name, suffix):
+        directory = Path(_setting('PROFILING_DIR', 'profiles'))
+        directory.mkdir(parents=True, exist_ok=True)
+        return directory / f'{_UNSAFE_NAME_RE.sub("_", view_name)}.{os.getpid()}{suffix}'
+
+    def add_samples(self, view_name, samples):
+        with self._lock:
+            stacks = self._stacks.setdefault(view_name, Counter())
+            stacks.update(samples)
+            lines = [f'{stack} {count}\n' for stack, count in stacks.most_common()]
+            self._path(view_name, '.collapsed').write_text(''.join(lines), encoding='utf-8')
+
+    def add_profile(self, view_name, profile):
+        with self._lock:
+            stats = self._stats.get(view_name)
+            if stats is None:
+                stats = self._stats[view_name] = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+            stats.dump_stats(self._path(view_name, '.prof'))
+
+    def clear(self):
+        with self._lock:
+            self._stacks.clear()
+            self._stats.clear()
+
+
+profile_store = ProfileStore()
+
+# cProfile одного потока за раз: начиная с Python 3.12 профилировщик общий для процесса
+_cprofile_lock = threading.Lock()
+
+
+class ProfilingMiddleware:
+    """
+    Профилирование выборки запросов и запросов с токеном
+
+    Ставится первым в MIDDLEWARE, чтобы профиль включал остальные middleware.
+    Профилированный ответ получает заголовок X-Profiled с именем представления.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not _setting('PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.profiler = _setting('PROFILING_PROFILER', 'sampling')
+        if self.profiler not in PROFILERS:
+            raise ValueError(f'PROFILING_PROFILER: ожидается одно из {PROFILERS}, получено {self.profiler!r}')
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async or not self.should_profile(request):
+            return self.get_response(request)
+        if self.profiler == 'cprofile':
+            return self.run_cprofile(request)
+
+        with StackSampler(interval=_setting('PROFILING_INTERVAL', 0.005)) as sampler:
+            response = self.get_response(request)
+        view_name = self.view_name(request)
+        profile_store.add_samples(view_name, sampler.samples)
+        response.headers['X-Profiled'] = view_name
+        return response
+
+    def run_cprofile(self, request):
+        if not _cprofile_lock.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            profile = cProfile.Profile()
+            profile.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profile.disable()
+        finally:
+            _cprofile_lock.release()
+        view_name = self.view_name(request)
+        profile_store.add_profile(view_name, profile)
+        response.headers['X-Profiled'] = view_name
+        return response
+
+    def should_profile(self, request):
+        token = _setting('PROFILING_TOKEN', '')
+        supplied = request.headers.get(TOKEN_HEADER)
+        if token and supplied is not None and secrets.compare_digest(supplied.encode(), token.encode()):
+            return True
+        return random.random() < _setting('PROFILING_SAMPLE_RATE', 0.0)
+
+    @staticmethod
+    def view_name(request):
+        match = request.resolver_match
+        return match.view_name if match else 'unresolved'
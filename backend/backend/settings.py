@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -42,10 +43,14 @@ INSTALLED_APPS = [
     
     'users',
     'blog',
+    # Команды проекта (профилирование запросов: backend/profiling.py)
+    'backend',
 
 ]
 
 MIDDLEWARE = [
+    'backend.profiling.ProfilingMiddleware',
+    'backend.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,7 +64,8 @@ ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с учетом времени рендеринга в метриках запроса
+        'BACKEND': 'backend.instrumentation.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -83,10 +89,27 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Транзакции сразу берут блокировку записи (BEGIN IMMEDIATE), а занятая БД
+        # ожидается до timeout секунд: иначе при одновременной записи SQLite
+        # отвечает "database is locked" без ожидания
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
     }
 }
 
 
+# Пользователь сессии загружается вместе с профилем и настройками (users/backends.py).
+# ModelBackend оставлен для сессий, созданных до UserStateBackend: get_user берет
+# бэкенд из сессии и без него разлогинил бы их; при следующем входе они перейдут
+# на UserStateBackend
+AUTHENTICATION_BACKENDS = [
+    'users.backends.UserStateBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -127,6 +150,20 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static',
 ]
 
+# Без DEBUG collectstatic записывает хэшированные, минифицированные и сжатые (.gz/.br)
+# файлы, а backend.staticfiles.serve отдает их с кэшированием на год
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+            else 'backend.staticfiles.CompressedManifestStaticFilesStorage'
+        ),
+    },
+}
+
 # Media files (uploads)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -155,3 +192,103 @@ EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
 DEFAULT_FROM_EMAIL = 'TechBlog <noreply@techblog.com>'
 SITE_URL = 'http://127.0.0.1:8000'  # Для production измените на реальный URL
+
+# Буферизация счетчика просмотров: фоновая запись в БД после N просмотров
+# или через N секунд после первого незаписанного просмотра
+VIEW_COUNTER_FLUSH_THRESHOLD = 100
+VIEW_COUNTER_FLUSH_INTERVAL = 10
+
+# Очередь email уведомлений (manage.py send_notifications)
+OUTBOX_MAX_ATTEMPTS = 5  # после N неудачных попыток запись помечается как ошибочная
+OUTBOX_RETRY_BACKOFF = 30  # задержка первой повторной попытки, секунд (далее удваивается)
+OUTBOX_RETRY_MAX_DELAY = 3600
+OUTBOX_LEASE_SECONDS = 300  # время, на которое воркер захватывает пачку
+
+# Рассылка о новом посте: размер пачки подписчиков и количество потоков отправки
+NOTIFY_FANOUT_CHUNK_SIZE = 500
+NOTIFY_FANOUT_WORKERS = 4
+
+# Лента подписок (fan-out on write)
+TIMELINE_MAX_LENGTH = 1000  # максимальная длина ленты одного читателя
+TIMELINE_FANOUT_CHUNK_SIZE = 1000  # подписчиков на один INSERT при раскладке поста
+TIMELINE_BIG_AUTHOR_FOLLOWERS = 10000  # посты авторов с таким числом подписчиков подмешиваются при чтении
+TIMELINE_BACKFILL_POSTS = 100  # постов автора, добавляемых в ленту при подписке
+TIMELINE_TRIM_EVERY = 50  # ленты подписчиков обрезаются при раскладке каждого N-го поста автора
+
+# Посты тега с числом постов не больше N выбираются по индексу тега и сортируются,
+# посты более популярных тегов - обходом индекса постов по дате (Post.objects.with_tag)
+TAG_POSTS_SORT_LIMIT = 1000
+
+# Кэш пользователя сессии с профилем и настройками, секунд (0 - без кэша, только JOIN).
+# Включать только с общим для всех процессов кэшем (Redis, Memcached)
+USER_STATE_CACHE_TIMEOUT = 0
+
+# Миниатюры аватаров: потоков генерации (0 - сразу после коммита, в текущем потоке)
+AVATAR_THUMBNAIL_WORKERS = 2
+
+# Условные GET для списков постов: время жизни версии списка в кэше, секунд
+# (с локальным кэшем процесса - предельное запаздывание ответа 304)
+LISTING_VERSION_TIMEOUT = 60
+
+# Общий для всех процессов кэш (страницы, блокировки их перестроения, версии списков):
+# DJANGO_REDIS_URL, например redis://127.0.0.1:6379/0 (нужен пакет redis).
+# Без него - LocMemCache, у каждого процесса свой
+REDIS_URL = os.environ.get('DJANGO_REDIS_URL', '')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+# Кэш страниц для анонимных читателей (blog/page_cache.py), секунд; 0 - выключен.
+# В разработке выключен, чтобы изменения шаблонов были видны сразу. Работает только
+# с общим кэшем: с LocMemCache блокировка перестроения и сброс страниц не действуют
+# на соседние процессы (проверка blog.E001)
+PAGE_CACHE_TIMEOUT = 60 if REDIS_URL and not DEBUG else 0
+PAGE_CACHE_GRACE = 30  # сколько еще отдавать устаревшую страницу, пока ее перестраивает другой процесс
+PAGE_CACHE_LOCK_TIMEOUT = 10  # блокировка перестроения страницы
+PAGE_CACHE_LOCK_WAIT = 2  # ожидание чужого перестроения при полном промахе
+
+# Страницы постов как общая оболочка и для авторизованных пользователей: данные
+# пользователя (шапка, тема, лайки, подписки, CSRF токен) загружаются из /api/viewer/
+PAGE_SHELL_ENABLED = False
+
+# Асинхронные представления страниц чтения (blog/async_views.py, users/async_views.py).
+# Включаются переменной окружения DJANGO_ASYNC_VIEWS=1, которую задает backend/asgi.py
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS') == '1'
+
+# Метрики запросов (backend/instrumentation.py): SQL запросы, время БД и шаблонов
+# пишутся в лог backend.instrumentation; заголовок Server-Timing раскрывает
+# детали работы сервера, поэтому по умолчанию только в разработке
+REQUEST_METRICS_ENABLED = True
+REQUEST_METRICS_HEADER = DEBUG
+
+# Бюджет SQL запросов представления (по имени маршрута), включая сессию и пользователя;
+# превышение - предупреждение в лог, в тестах - assertQueryBudget (backend/testing.py)
+QUERY_BUDGET_DEFAULT = 30
+QUERY_BUDGETS = {
+    'blog:index': 6,
+    'blog:posts_list': 6,
+    'blog:post_detail': 10,  # с отправкой комментария
+    'blog:tag_posts': 6,
+    'blog:search': 6,
+    'blog:feed': 8,
+    'blog:posts_api': 4,
+    'blog:feed_api': 8,
+    'blog:viewer_api': 5,
+    'blog:toggle_like': 8,
+    'users:profile': 6,
+}
+
+# Профилирование запросов (backend/profiling.py, отчет - manage.py profile_report).
+# Профилируется доля запросов и запросы с заголовком X-Profile-Token, равным PROFILING_TOKEN;
+# без DJANGO_PROFILING=1 middleware не подключается
+PROFILING_ENABLED = os.environ.get('DJANGO_PROFILING') == '1'
+PROFILING_SAMPLE_RATE = float(os.environ.get('DJANGO_PROFILING_SAMPLE_RATE', '0'))
+PROFILING_TOKEN = os.environ.get('DJANGO_PROFILING_TOKEN', '')
+PROFILING_PROFILER = 'sampling'  # 'sampling' - свернутые стеки для flamegraph, 'cprofile' - pstats
+PROFILING_INTERVAL = 0.005  # интервал снимков стека, секунд
+PROFILING_DIR = BASE_DIR / 'profiles'
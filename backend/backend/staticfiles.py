@@ -0,0 +1,359 @@
+"""
+Сборка и раздача статики
+
+manage.py collectstatic (при DEBUG = False) записывает файлы с хэшем
+содержимого в имени и манифест, минифицирует CSS и JS и создает рядом
+сжатые копии .gz и .br (brotli - если установлен пакет brotli).
+Представление serve отдает их с учетом Accept-Encoding и, для хэшированных
+имен, с кэшированием на год (immutable).
+"""
+import gzip
+import mimetypes
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Сжимаются только текстовые форматы не меньше этого размера
+COMPRESS_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.map', '.txt', '.xml', '.html', '.ico')
+COMPRESS_MIN_SIZE = 256
+
+# Имя вида base.3f2a9c1d0b7e.css (хэш ManifestStaticFilesStorage - 12 hex символов)
+HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+# Строки CSS (копируются как есть) и комментарии (удаляются, кроме /*! ... */)
+_CSS_TOKEN_RE = re.compile(r""""(?:\\[\s\S]|[^"\\])*"|'(?:\\[\s\S]|[^'\\])*'|/\*(?!!)[\s\S]*?\*/""")
+_CSS_SPACE_RE = re.compile(r'\s+')
+_CSS_PUNCTUATION_RE = re.compile(r'\s*([{};,])\s*')
+# Пробел после ":" убирается только в объявлении "свойство: значение" (сразу после "{" или ";"):
+# в селекторе "a :hover" и "a:hover" - разные выборки
+_CSS_DECLARATION_RE = re.compile(r'([{;][-\w]+):\s+')
+
+# После этих символов и слов "/" начинает регулярное выражение, а не деление
+_JS_REGEX_AFTER = set('(,=:[!&|?{};+-*%<>~^')
+_JS_REGEX_KEYWORDS = {
+    'return', 'typeof', 'instanceof', 'in', 'of', 'new', 'delete', 'void',
+    'throw', 'case', 'do', 'else', 'yield', 'await',
+}
+# После ")" условия этих операторов начинается оператор: "/" - регулярное выражение
+_JS_CONTROL_KEYWORDS = {'if', 'while', 'for', 'with'}
+_JS_SPACE = ' \t\r\n\f\v'
+
+
+def _minify_css_code(code):
+    code = _CSS_SPACE_RE.sub(' ', code)
+    code = _CSS_PUNCTUATION_RE.sub(r'\1', code)
+    code = _CSS_DECLARATION_RE.sub(r'\1:', code)
+    return code.replace(';}', '}')
+
+
+def minify_css(text):
+    """Удаляет комментарии и лишние пробелы вне строк (значения и селекторы не меняются)"""
+    pieces = []
+    code = []
+    position = 0
+    for match in _CSS_TOKEN_RE.finditer(text):
+        code.append(text[position:match.start()])
+        position = match.end()
+        if match.group().startswith('/*'):
+            code.append(' ')
+            continue
+        pieces.append(_minify_css_code(''.join(code)))
+        pieces.append(match.group())
+        code = []
+    code.append(text[position:])
+    pieces.append(_minify_css_code(''.join(code)))
+    return ''.join(pieces).strip()
+
+
+def _skip_js_string(text, start):
+    """Конец строкового литерала, начинающегося с кавычки text[start]"""
+    quote = text[start]
+    index = start + 1
+    while index < len(text):
+        char = text[index]
+        if char == '\\':
+            index += 2
+            continue
+        if char == quote:
+            return index + 1
+        if char == '\n':
+            break
+        index += 1
+    return index
+
+
+def _skip_js_regex(text, start):
+    """Конец литерала регулярного выражения (с флагами) или None, если это не он"""
+    index = start + 1
+    in_class = False
+    while index < len(text):
+        char = text[index]
+        if char == '\\':
+            index += 2
+            continue
+        if char == '\n':
+            return None
+        if char == '[':
+            in_class = True
+        elif char == ']':
+            in_class = False
+        elif char == '/' and not in_class:
+            index += 1
+            while index < len(text) and (text[index].isalnum() or text[index] in '_$'):
+                index += 1
+            return index
+        index += 1
+    return None
+
+
+def minify_js(text):
+    """
+    Минификация JS без изменения кода: комментарии, отступы и пустые строки
+
+    Текст разбирается на лексемы: строки, шаблонные строки (вместе с
+    вложенными ${...}) и регулярные выражения копируются как есть.
+    Пробелы между лексемами сжимаются до одного, а последовательность
+    с переводом строки - до одного перевода строки: на них опирается
+    автоматическая вставка точек с запятой.
+    """
+    out = []
+    space = ''
+    # Глубина фигурных скобок внутри каждой открытой подстановки ${...}
+    templates = []
+    # Для каждой открытой "(" - открыта ли она после if/while/for/with
+    parens = []
+    last = ''
+    last_word = ''
+    index = 0
+    length = len(text)
+
+    def emit(chunk):
+        nonlocal space
+        if space and out:
+            out.append(space)
+        space = ''
+        out.append(chunk)
+
+    while index < length:
+        char = text[index]
+
+        if char in _JS_SPACE:
+            end = index
+            while end < length and text[end] in _JS_SPACE:
+                end += 1
+            if '\n' in text[index:end] or space == '\n':
+                space = '\n'
+            else:
+                space = ' '
+            index = end
+            continue
+
+        if text.startswith('//', index):
+            end = text.find('\n', index)
+            index = length if end < 0 else end
+            continue
+
+        if text.startswith('/*', index):
+            end = text.find('*/', index + 2)
+            end = length if end < 0 else end + 2
+            if text.startswith('/*!', index):
+                emit(text[index:end])
+            elif '\n' in text[index:end] or space == '\n':
+                space = '\n'
+            else:
+                space = space or ' '
+            index = end
+            continue
+
+        if char in '\'"':
+            end = _skip_js_string(text, index)
+            emit(text[index:end])
+            last, last_word, index = char, '', end
+            continue
+
+        if char == '`' or (char == '}' and templates and templates[-1] == 0):
+            # Шаблонная строка: от ` (или от } закрывающей подстановки) до ` или ${
+            if char == '}':
+                templates.pop()
+            end = index + 1
+            while end < length:
+                if text[end] == '\\':
+                    end += 2
+                    continue
+                if text[end] == '`':
+                    end += 1
+                    last = '`'
+                    break
+                if text.startswith('${', end):
+                    end += 2
+                    templates.append(0)
+                    last = '{'
+                    break
+                end += 1
+            emit(text[index:end])
+            last_word, index = '', end
+            continue
+
+        if char == '/' and (not last or last in _JS_REGEX_AFTER or last_word in _JS_REGEX_KEYWORDS):
+            end = _skip_js_regex(text, index)
+            if end is not None:
+                emit(text[index:end])
+                # После литерала "/" снова означает деление
+                last, last_word, index = 'a', '', end
+                continue
+
+        if char.isalnum() or char in '_$' or ord(char) > 127:
+            end = index + 1
+            while end < length and (text[end].isalnum() or text[end] in '_$' or ord(text[end]) > 127):
+                end += 1
+            word = text[index:end]
+            emit(word)
+            last, last_word, index = word[-1], word, end
+            continue
+
+        if char == '(':
+            parens.append(last_word in _JS_CONTROL_KEYWORDS)
+        elif char == ')' and parens and parens.pop():
+            emit(char)
+            # "if (x) /re/.test(s)": ")" закрывает условие, дальше не деление
+            last, last_word, index = ';', '', index + 1
+            continue
+
+        if templates:
+            if char == '{':
+                templates[-1] += 1
+            elif char == '}':
+                templates[-1] -= 1
+        emit(char)
+        last, last_word, index = char, '', index + 1
+
+    return ''.join(out) + '\n'
+
+
+MINIFIERS = {
+    '.css': minify_css,
+    '.js': minify_js,
+}
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage с минификацией и предварительным сжатием
+
+    Отсутствующий файл (например, favicon.ico, на который ссылается шаблон)
+    не ломает страницу: {% static %} вернет URL без хэша.
+    """
+    manifest_strict = False
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
+
+    def _save(self, name, content):
+        suffix = Path(name).suffix
+        if suffix in MINIFIERS and '.min.' not in name:
+            content.seek(0)
+            text = content.read()
+            if isinstance(text, bytes):
+                text = text.decode('utf-8')
+            content = ContentFile(MINIFIERS[suffix](text).encode('utf-8'))
+        return super()._save(name, content)
+
+    def post_process(self, paths, dry_run=False, **options):
+        names = set()
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception):
+                names.update((name, hashed_name))
+            yield name, hashed_name, processed
+
+        if not dry_run:
+            for name in sorted(names):
+                self.compress(name)
+
+    def compress(self, name):
+        """Создает сжатые копии .gz и .br рядом с файлом"""
+        if not name.endswith(COMPRESS_EXTENSIONS):
+            return
+        with self.open(name) as file:
+            data = file.read()
+        if len(data) < COMPRESS_MIN_SIZE:
+            return
+
+        variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['.br'] = brotli.compress(data, quality=11)
+        for extension, compressed in variants.items():
+            # Сжатие, почти не уменьшающее файл, не окупается распаковкой
+            if len(compressed) < len(data) * 0.95:
+                if self.exists(name + extension):
+                    self.delete(name + extension)
+                super()._save(name + extension, ContentFile(compressed))
+
+
+def _accepted_encodings(request):
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        encoding, _, params = part.strip().partition(';')
+        if params.replace(' ', '') not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            accepted.add(encoding.strip().lower())
+    return accepted
+
+
+def serve(request, path):
+    """
+    Раздача собранной статики из STATIC_ROOT
+
+    Если клиент принимает br или gzip и рядом есть сжатая копия, отдается она
+    (Vary: Accept-Encoding). Хэшированные имена кэшируются на год.
+    """
+    try:
+        full_path = Path(safe_join(settings.STATIC_ROOT, path))
+    except SuspiciousFileOperation:
+        raise Http404('Файл не найден')
+    if not full_path.is_file():
+        raise Http404('Файл не найден')
+
+    stat = full_path.stat()
+    if not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime):
+        response = HttpResponseNotModified()
+    else:
+        content_type, _ = mimetypes.guess_type(full_path.name)
+        accepted = _accepted_encodings(request)
+        chosen, encoding = full_path, None
+        for name, extension in (('br', '.br'), ('gzip', '.gz')):
+            candidate = full_path.with_name(full_path.name + extension)
+            if name in accepted and candidate.is_file():
+                chosen, encoding = candidate, name
+                break
+
+        response = FileResponse(chosen.open('rb'), content_type=content_type or 'application/octet-stream')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        response.headers['Last-Modified'] = http_date(stat.st_mtime)
+
+    patch_vary_headers(response, ('Accept-Encoding',))
+    if HASHED_NAME_RE.search(path):
+        patch_cache_control(response, public=True, max_age=IMMUTABLE_MAX_AGE, immutable=True)
+    else:
+        # Имя без хэша может указывать на новое содержимое: проверка при каждом запросе
+        patch_cache_control(response, public=True, no_cache=True)
+    return response
@@ -0,0 +1,69 @@
+"""
+Помощники тестов
+"""
+from importlib import import_module, reload
+
+from django.conf import settings
+from django.test.utils import override_settings
+from django.urls import clear_url_caches
+
+from .instrumentation import query_budget
+
+
+class override_async_views(override_settings):
+    """
+    Переключение ASYNC_VIEWS с пересборкой маршрутов (тесты и bench_asgi)
+
+    blog.urls и users.urls выбирают представления при импорте, поэтому
+    одного override_settings недостаточно. Декоратор класса TestCase сводится
+    к обычному override_settings, поэтому в тестах - через enterClassContext.
+    """
+
+    def __init__(self, enabled=True):
+        super().__init__(ASYNC_VIEWS=enabled)
+
+    def enable(self):
+        super().enable()
+        self.reload_urlconfs()
+
+    def disable(self):
+        super().disable()
+        self.reload_urlconfs()
+
+    @staticmethod
+    def reload_urlconfs():
+        # Корневой URLconf хранит разобранные include(), поэтому перезагружается последним
+        for module in ('blog.urls', 'users.urls', settings.ROOT_URLCONF):
+            reload(import_module(module))
+        clear_url_caches()
+
+
+class QueryBudgetMixin:
+    """
+    Проверка бюджета SQL запросов представления для TestCase
+
+    Количество запросов берется из метрик ответа (RequestMetricsMiddleware),
+    бюджет - из QUERY_BUDGETS по имени маршрута.
+    """
+
+    def assertQueryBudget(self, response, budget=None):
+        """
+        Проверяет, что обработка запроса уложилась в бюджет SQL запросов
+
+        Args:
+            response: Ответ тестового клиента
+            budget: Бюджет (по умолчанию - из настроек для представления ответа)
+        """
+        metrics = getattr(response, 'request_metrics', None)
+        if metrics is None:
+            self.fail('В ответе нет метрик запроса: RequestMetricsMiddleware не подключен')
+        if budget is None:
+            budget = query_budget(metrics['view'])
+        if budget is None:
+            self.fail(f"Для представления {metrics['view']} не задан бюджет SQL запросов")
+        if metrics['queries'] > budget:
+            duplicates = '\n'.join(f'  {count} x {sql}' for sql, count in metrics['duplicates'].items())
+            self.fail(
+                f"{metrics['view']}: {metrics['queries']} SQL запросов при бюджете {budget}"
+                + (f'\nПовторяющиеся запросы:\n{duplicates}' if duplicates else '')
+            )
@@ -7,19 +7,20 @@ from .models import Post, Comment, Tag, Like, Subscribe
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
-    list_display = ['name', 'slug', 'created_at']
+    list_display = ['name', 'slug', 'post_count', 'created_at']
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ['name']
+    readonly_fields = ['post_count']
 
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
-    list_display = ['title', 'author', 'created_at', 'views', 'total_likes']
+    list_display = ['title', 'author', 'created_at', 'views', 'like_count', 'comment_count']
     list_filter = ['created_at', 'author', 'tags']
     search_fields = ['title', 'content']
     filter_horizontal = ['tags']
     date_hierarchy = 'created_at'
-    readonly_fields = ['views', 'created_at', 'updated_at']
+    readonly_fields = ['views', 'like_count', 'comment_count', 'created_at', 'updated_at']
 
 
 @admin.register(Comment)
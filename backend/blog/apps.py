@@ -8,3 +8,4 @@ class BlogConfig(AppConfig):
     
     def ready(self):
         import blog.signals  # Импортируем сигналы
+        import blog.checks  # Регистрируем системные проверки
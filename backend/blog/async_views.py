@@ -0,0 +1,152 @@
+"""
+Асинхронные представления страниц чтения (ASGI)
+
+Используются вместо blog.views при ASYNC_VIEWS (backend/asgi.py включает
+их по умолчанию). Данные загружаются асинхронным ORM, шаблоны рендерятся
+в потоке: движок шаблонов и фильтры (markdown, аватары) синхронные.
+Просмотры записываются в БД фоновым потоком, уведомления и так уходят
+в очередь (users/outbox.py), поэтому запись не задерживает ответ.
+"""
+from asgiref.sync import sync_to_async
+from django.shortcuts import aget_object_or_404, render
+
+from users.backends import with_user
+
+from . import page_cache, views
+from .conditional import POSTS, listing_version, make_etag, not_modified, post_validators, set_validators, viewer_state
+from .forms import CommentForm, SearchForm
+from .models import Post, Tag
+from .pagination import KeysetPaginator, RankedPaginator
+from .search import search_posts
+from .view_counter import view_counter
+
+
+async def _render(request, template_name, context):
+    return await sync_to_async(render)(request, template_name, context)
+
+
+@with_user
+@page_cache.anonymous_page_cache(lambda request: [page_cache.LISTINGS])
+async def index(request):
+    """Главная страница"""
+    recent_posts = (
+        Post.objects.select_related('author__profile').prefetch_related('tags').defer('content')
+        .with_viewer_state(request.user)[:10]
+    )
+    context = {
+        'recent_posts': [post async for post in recent_posts],
+        'popular_tags': [tag async for tag in Tag.objects.order_by('-post_count', 'name')[:10]],
+    }
+    return await _render(request, 'blog/index.html', context)
+
+
+@with_user
+@page_cache.anonymous_page_cache(lambda request: [page_cache.LISTINGS])
+async def posts_list(request):
+    """Список всех постов с пагинацией"""
+    version = await sync_to_async(listing_version)(POSTS)
+    state = await sync_to_async(viewer_state)(request)
+    etag = make_etag('posts_list', version, request.GET.get('cursor'), state)
+    response = await sync_to_async(not_modified)(request, etag)
+    if response is not None:
+        return response
+
+    posts = (
+        Post.objects.select_related('author__profile').prefetch_related('tags').defer('content')
+        .with_viewer_state(request.user)
+    )
+    context = {
+        'page_obj': await KeysetPaginator(posts, 10).aget_page(request.GET.get('cursor')),
+    }
+    return set_validators(request, await _render(request, 'blog/posts_list.html', context), etag)
+
+
+@with_user
+@page_cache.anonymous_page_cache(
+    lambda request, pk: [page_cache.post_group(pk)],
+    on_hit=lambda request, pk: view_counter.incr(pk),
+)
+async def post_detail(request, pk):
+    """
+    Детальная страница поста (только GET)
+
+    Отправка комментария (POST) обрабатывается синхронным blog.views.post_detail.
+    """
+    if request.method not in ('GET', 'HEAD'):
+        return await sync_to_async(views.post_detail)(request, pk)
+
+    etag, last_modified = await sync_to_async(post_validators)(request, pk)
+    response = await sync_to_async(not_modified)(request, etag, last_modified)
+    if response is not None:
+        view_counter.incr(pk)
+        return response
+
+    post = await aget_object_or_404(
+        Post.objects.select_related('author__profile', 'render').prefetch_related('tags', 'comments__author__profile')
+        .with_viewer_state(request.user),
+        pk=pk
+    )
+
+    view_counter.incr(post.pk)
+    post.views += 1
+
+    context = {
+        'post': post,
+        'comment_form': CommentForm(),
+        'user_liked': post.viewer_liked,
+    }
+    response = await _render(request, 'blog/post_detail.html', context)
+    return set_validators(request, response, etag, last_modified)
+
+
+@with_user
+@page_cache.anonymous_page_cache(lambda request, slug: [page_cache.tag_group(slug)])
+async def tag_posts(request, slug):
+    """Посты по тегу"""
+    version = await sync_to_async(listing_version)(POSTS)
+    state = await sync_to_async(viewer_state)(request)
+    etag = make_etag('tag_posts', slug, version, request.GET.get('cursor'), state)
+    response = await sync_to_async(not_modified)(request, etag)
+    if response is not None:
+        return response
+
+    tag = await aget_object_or_404(Tag, slug=slug)
+    posts = (
+        Post.objects.with_tag(tag).select_related('author__profile').prefetch_related('tags').defer('content')
+        .with_viewer_state(request.user)
+    )
+    paginator = KeysetPaginator(posts, 10, count=tag.post_count)
+    context = {
+        'tag': tag,
+        'page_obj': await paginator.aget_page(request.GET.get('cursor')),
+    }
+    return set_validators(request, await _render(request, 'blog/tag_posts.html', context), etag)
+
+
+@with_user
+async def search(request):
+    """Поиск по постам"""
+    form = SearchForm(request.GET)
+    posts = Post.objects.none()
+    query = None
+    ranked_ids = None
+
+    if form.is_valid():
+        query = form.cleaned_data.get('q')
+        if query:
+            ranked_ids, posts = await sync_to_async(search_posts)(query)
+
+    cards = Post.objects.all() if ranked_ids is not None else posts
+    cards = cards.select_related('author__profile').prefetch_related('tags').defer('content').with_viewer_state(request.user)
+    if ranked_ids is not None:
+        paginator = RankedPaginator(ranked_ids, cards, 10)
+    else:
+        paginator = KeysetPaginator(cards, 10)
+
+    context = {
+        'form': form,
+        'page_obj': await paginator.aget_page(request.GET.get('cursor')),
+        'query': query,
+    }
+    return await _render(request, 'blog/search.html', context)
+
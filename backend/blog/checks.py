@@ -0,0 +1,21 @@
+"""
+Системные проверки настроек блога
+"""
+from django.conf import settings
+from django.core import checks
+
+
+@checks.register(checks.Tags.caches)
+def check_page_cache_backend(app_configs, **kwargs):
+    """Кэш страниц требует общего для процессов кэша"""
+    if getattr(settings, 'PAGE_CACHE_TIMEOUT', 0) <= 0:
+        return []
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if backend == 'django.core.cache.backends.locmem.LocMemCache':
+        return [checks.Error(
+            'PAGE_CACHE_TIMEOUT > 0 с LocMemCache: у каждого процесса свой кэш, поэтому '
+            'блокировка перестроения страницы и сброс страниц не действуют на другие процессы.',
+            hint='Задайте общий кэш (DJANGO_REDIS_URL) или PAGE_CACHE_TIMEOUT = 0.',
+            id='blog.E001',
+        )]
+    return []
@@ -0,0 +1,164 @@
+"""
+Условные GET запросы (ETag / Last-Modified) для страниц постов и списков
+
+Валидаторы вычисляются без рендеринга: для поста - одним запросом
+(updated_at, счетчики, время последнего комментария и лайка, состояние
+читателя), для списков - по версии списка в кэше, которую сбрасывают
+сигналы изменения постов, лайков, комментариев и подписок. При совпадении
+клиенту отдается 304 без рендеринга шаблона.
+
+Версия списка живет LISTING_VERSION_TIMEOUT секунд: с кэшем, общим для всех
+процессов, сброс виден сразу, с локальным кэшем процесса ответ может
+устареть не больше чем на это время.
+"""
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery
+from django.http import Http404
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from users.models import UserSettings
+
+from .models import Comment, Like, Post
+
+# Версия общих списков постов (все посты, посты по тегу)
+POSTS = 'posts'
+
+
+def _version_key(name):
+    return f'blog:listing-version:{name}'
+
+
+def listing_version(name):
+    """Текущая версия списка (создается при первом обращении)"""
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        fresh = uuid.uuid4().hex
+        cache.add(key, fresh, getattr(settings, 'LISTING_VERSION_TIMEOUT', 60))
+        # Кэш не сохранил версию (DummyCache, вытеснение): новая случайная версия
+        # на каждый запрос - ответа 304 со старыми данными быть не может
+        version = cache.get(key) or fresh
+    return version
+
+
+def bump_listing_version(*names):
+    """
+    Сбрасывает версии списков после коммита: следующие запросы получат новый ETag
+
+    Сброс до коммита позволил бы параллельному запросу закрепить новую
+    версию за старыми данными.
+    """
+    keys = [_version_key(name) for name in names or (POSTS,)]
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def viewer_state(request):
+    """
+    Часть валидатора, зависящая от читателя
+
+    Для авторизованного пользователя учитываются id и настройки, которые
+    выводит base.html (они уже загружены вместе с пользователем сессии).
+    """
+    user = request.user
+    if not user.is_authenticated:
+        return ('anonymous',)
+    try:
+        user_settings = user.settings
+    except UserSettings.DoesNotExist:
+        return (user.pk,)
+    return (user.pk, user_settings.theme, user_settings.sound_enabled)
+
+
+def make_etag(*parts):
+    return hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+def _latest(model, field='created_at'):
+    return Subquery(model.objects.filter(post=OuterRef('pk')).order_by(f'-{field}').values(field)[:1])
+
+
+def _commenters_updated():
+    """Последнее изменение профилей комментаторов поста (их аватары выводятся на странице)"""
+    return Subquery(
+        Comment.objects.filter(post=OuterRef('pk')).order_by().values('post')
+        .annotate(latest=Max('author__profile__updated_at')).values('latest')
+    )
+
+
+def post_validators(request, post_id):
+    """
+    ETag и Last-Modified страницы поста (один запрос, без загрузки содержания)
+
+    Просмотры в валидатор не входят: иначе страница менялась бы при каждом запросе.
+
+    Raises:
+        Http404: Поста нет
+    """
+    row = (
+        Post.objects.filter(pk=post_id)
+        .with_viewer_state(request.user)
+        .annotate(last_comment=_latest(Comment), last_like=_latest(Like), commenters_updated=_commenters_updated())
+        .values_list(
+            'updated_at', 'like_count', 'comment_count', 'author__profile__updated_at', 'commenters_updated',
+            'last_comment', 'last_like', 'viewer_liked', 'viewer_follows_author',
+        )
+        .first()
+    )
+    if row is None:
+        raise Http404('Пост не найден')
+
+    updated_at, _, _, author_updated, commenters_updated, last_comment, last_like, _, _ = row
+    last_modified = max(
+        value for value in (updated_at, author_updated, commenters_updated, last_comment, last_like)
+        if value is not None
+    )
+    return make_etag('post', post_id, row, viewer_state(request)), last_modified
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    Ответ 304 (или 412), если валидаторы клиента совпадают, иначе None
+
+    Неотображенные сообщения (messages) выводятся в base.html, поэтому
+    с ними страница всегда рендерится заново.
+    """
+    if request.method not in ('GET', 'HEAD') or len(get_messages(request)):
+        return None
+    if request.user.is_authenticated:
+        last_modified = None
+    response = get_conditional_response(
+        request,
+        etag=quote_etag(etag),
+        # Last-Modified передается с точностью до секунды
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None:
+        set_validators(request, response, etag, last_modified)
+    return response
+
+
+def set_validators(request, response, etag, last_modified=None):
+    """
+    Заголовки валидаторов и кэширования
+
+    Страница зависит от сессии (Vary: Cookie); ответы авторизованным
+    пользователям не сохраняются общими кэшами (private).
+    Last-Modified отдается только анонимным: состояние читателя (подписка)
+    не отражается во времени изменения.
+    """
+    response.headers['ETag'] = quote_etag(etag)
+    if last_modified and not request.user.is_authenticated:
+        response.headers['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_vary_headers(response, ('Cookie',))
+    if request.user.is_authenticated:
+        patch_cache_control(response, no_cache=True, private=True)
+    else:
+        patch_cache_control(response, no_cache=True)
+    return response
@@ -0,0 +1,119 @@
+"""
+Денормализованные счетчики: лайки и комментарии постов, посты тегов
+"""
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import Post, Like, Comment, Tag
+
+
+def adjust_post_counters(post_id, **deltas):
+    """
+    Атомарно изменяет счетчики поста
+
+    Уменьшение не опускает счетчик ниже нуля, даже если он уже разошелся с данными.
+    Пример: adjust_post_counters(post.pk, like_count=1)
+    """
+    Post.objects.filter(pk=post_id).update(
+        **{field: _shifted(field, delta) for field, delta in deltas.items()}
+    )
+
+
+def _shifted(field, delta):
+    """F(field) + delta с ограничением снизу нулем для уменьшения"""
+    if delta >= 0:
+        return F(field) + delta
+    return Greatest(F(field) + delta, Value(0))
+
+
+def increment_each(field, amounts):
+    """
+    Выражение UPDATE, увеличивающее поле каждой строки на свою величину
+
+    Один UPDATE вместо запроса на каждую величину прироста:
+    Post.objects.filter(pk__in=amounts).update(views=increment_each('views', amounts))
+
+    Args:
+        field: Имя поля
+        amounts: Словарь {pk: прирост}
+    """
+    return F(field) + Case(
+        *[When(pk=pk, then=Value(amount)) for pk, amount in amounts.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+
+def _count_subquery(model):
+    """Подзапрос с количеством связанных записей для каждого поста"""
+    counts = (
+        model.objects.filter(post=OuterRef('pk'))
+        .order_by()
+        .values('post')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def reconcile_post_counters(queryset=None):
+    """
+    Пересчитывает счетчики лайков и комментариев одним UPDATE
+
+    Args:
+        queryset: Посты для пересчета (по умолчанию все)
+
+    Returns:
+        Количество обновленных постов
+    """
+    if queryset is None:
+        queryset = Post.objects.all()
+
+    return queryset.update(
+        like_count=_count_subquery(Like),
+        comment_count=_count_subquery(Comment),
+    )
+
+
+def adjust_tag_counts(tag_ids, delta):
+    """
+    Атомарно изменяет количество постов у тегов
+
+    Args:
+        tag_ids: id тегов; повторяющиеся id учитываются несколько раз
+        delta: Изменение для каждого вхождения (+1 или -1)
+    """
+    by_amount = {}
+    for tag_id in tag_ids:
+        by_amount[tag_id] = by_amount.get(tag_id, 0) + delta
+
+    # Один UPDATE на каждую величину изменения
+    groups = {}
+    for tag_id, amount in by_amount.items():
+        if amount:
+            groups.setdefault(amount, []).append(tag_id)
+    for amount, ids in groups.items():
+        Tag.objects.filter(pk__in=ids).update(post_count=_shifted('post_count', amount))
+
+
+def reconcile_tag_counts(queryset=None):
+    """
+    Пересчитывает количество постов у тегов одним UPDATE
+
+    Args:
+        queryset: Теги для пересчета (по умолчанию все)
+
+    Returns:
+        Количество обновленных тегов
+    """
+    if queryset is None:
+        queryset = Tag.objects.all()
+
+    counts = (
+        Post.tags.through.objects.filter(tag=OuterRef('pk'))
+        .order_by()
+        .values('tag')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    return queryset.update(post_count=Coalesce(Subquery(counts), Value(0)))
@@ -40,13 +40,18 @@ class PostForm(forms.ModelForm):
             # Обрабатываем новые теги после сохранения
             new_tags_str = self.cleaned_data.get('new_tags', '')
             if new_tags_str:
-                new_tag_names = [tag.strip() for tag in new_tags_str.split(',') if tag.strip()]
+                new_tag_names = list(dict.fromkeys(tag.strip() for tag in new_tags_str.split(',') if tag.strip()))
+                tags = list(Tag.objects.filter(name__in=new_tag_names))
+                existing = {tag.name for tag in tags}
                 for tag_name in new_tag_names:
-                    tag, created = Tag.objects.get_or_create(
-                        name=tag_name,
-                        defaults={'slug': slugify(tag_name)}
-                    )
-                    instance.tags.add(tag)
+                    if tag_name not in existing:
+                        tag, created = Tag.objects.get_or_create(
+                            name=tag_name,
+                            defaults={'slug': slugify(tag_name)}
+                        )
+                        tags.append(tag)
+                # Одно добавление: один INSERT и одно обновление счетчиков тегов
+                instance.tags.add(*tags)
         
         return instance
 
@@ -0,0 +1,151 @@
+"""
+Общие утилиты для команд-бенчмарков
+
+Бенчмарки работают во временной БД (как тестовый раннер Django),
+поэтому рабочая БД не затрагивается.
+"""
+import random
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+
+from blog.models import Post, Tag
+from blog.view_counter import view_counter
+
+
+WORDS = [
+    'python', 'django', 'javascript', 'web', 'backend', 'frontend', 'api', 'rest',
+    'database', 'sqlite', 'postgres', 'cache', 'index', 'query', 'template', 'view',
+    'model', 'form', 'test', 'deploy', 'docker', 'server', 'client', 'async',
+    'performance', 'security', 'markdown', 'css', 'html', 'react', 'tutorial', 'guide',
+    'код', 'функция', 'класс', 'модуль', 'проект', 'пример', 'ошибка', 'решение',
+    'запрос', 'данные', 'сервер', 'страница', 'пользователь', 'список', 'поиск', 'файл',
+    'настройка', 'приложение', 'разработка', 'скорость', 'память', 'строка', 'объект',
+    'тест', 'сборка', 'шаблон', 'форма', 'база', 'индекс', 'кэш', 'очередь', 'поток',
+]
+
+# Zipf-подобное распределение: частые слова встречаются намного чаще редких
+WORD_WEIGHTS = [1 / (rank + 1) for rank in range(len(WORDS))]
+
+
+@contextmanager
+def benchmark_database(path=None, stdout=None):
+    """
+    Создает временную БД со всеми миграциями и удаляет ее после бенчмарка
+
+    Args:
+        path: Путь к файлу БД (по умолчанию файл во временном каталоге)
+        stdout: Поток для сообщений
+    """
+    tmpdir = None
+    if path is None:
+        tmpdir = tempfile.TemporaryDirectory(prefix='blog-bench-')
+        path = Path(tmpdir.name) / 'bench.sqlite3'
+
+    connection.settings_dict.setdefault('TEST', {})['NAME'] = str(path)
+    if stdout:
+        stdout.write(f'Временная БД: {path}')
+    # create_test_db возвращает имя новой БД, исходное сохраняем сами
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield path
+        # Просмотры, посчитанные страницами бенчмарка, относятся к временной БД
+        view_counter.flush()
+    finally:
+        view_counter.clear()
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        if tmpdir is not None:
+            tmpdir.cleanup()
+
+
+def measure(func, repeat=5):
+    """
+    Замеряет время выполнения функции
+
+    Returns:
+        Словарь с медианой, минимумом и максимумом в миллисекундах
+    """
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        'median_ms': round(statistics.median(samples), 3),
+        'min_ms': round(min(samples), 3),
+        'max_ms': round(max(samples), 3),
+    }
+
+
+def make_text(rng, words_count):
+    """Случайный текст из словаря с Zipf-распределением слов"""
+    return ' '.join(rng.choices(WORDS, weights=WORD_WEIGHTS, k=words_count))
+
+
+def create_users(count, prefix='bench'):
+    """
+    Создает пользователей вместе с профилями, настройками и статистикой
+
+    Пароль у всех одинаковый ('password'), хэш считается один раз.
+    """
+    from users.models import AuthorStats, Profile, UserSettings
+
+    password = make_password('password')
+    User.objects.bulk_create([
+        User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com', password=password)
+        for i in range(count)
+    ], batch_size=1000)
+    users = list(User.objects.filter(username__startswith=prefix).order_by('pk'))
+    Profile.objects.bulk_create([Profile(user=user) for user in users], batch_size=1000, ignore_conflicts=True)
+    UserSettings.objects.bulk_create([UserSettings(user=user) for user in users], batch_size=1000, ignore_conflicts=True)
+    AuthorStats.objects.bulk_create([AuthorStats(user=user) for user in users], batch_size=1000, ignore_conflicts=True)
+    return users
+
+
+def create_tags(names):
+    """Создает теги (уже существующие пропускаются)"""
+    Tag.objects.bulk_create(
+        [Tag(name=name, slug=name) for name in names],
+        ignore_conflicts=True,
+    )
+    return list(Tag.objects.filter(name__in=names).order_by('pk'))
+
+
+def create_posts(count, rng, authors, tags, batch_size=5000, content_words=80):
+    """
+    Создает посты пачками вместе с привязкой тегов
+
+    Сигналы не срабатывают: денормализованные данные и индексы
+    нужно перестроить отдельно.
+    """
+    through = Post.tags.through
+    created = 0
+    while created < count:
+        size = min(batch_size, count - created)
+        posts = Post.objects.bulk_create([
+            Post(
+                title=make_text(rng, 6).capitalize(),
+                content=make_text(rng, content_words),
+                author=rng.choice(authors),
+            )
+            for _ in range(size)
+        ])
+        through.objects.bulk_create([
+            through(post_id=post.pk, tag_id=tag.pk)
+            for post in posts
+            for tag in rng.sample(tags, k=rng.randint(0, min(3, len(tags))))
+        ], ignore_conflicts=True)
+        created += size
+    return created
+
+
+def seeded_random(seed=42):
+    """Генератор случайных чисел с фиксированным зерном"""
+    return random.Random(seed)
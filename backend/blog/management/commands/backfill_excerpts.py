@@ -0,0 +1,18 @@
+"""
+Заполнение текстовых анонсов постов
+"""
+from django.core.management.base import BaseCommand
+
+from blog.rendering import backfill_excerpts
+
+
+class Command(BaseCommand):
+    help = 'Заполняет Post.excerpt (текст без разметки Markdown) для постов без анонса'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пачки')
+        parser.add_argument('--force', action='store_true', help='Пересчитать анонсы всех постов')
+
+    def handle(self, *args, **options):
+        updated = backfill_excerpts(batch_size=options['batch_size'], force=options['force'])
+        self.stdout.write(self.style.SUCCESS(f'Обновлено анонсов: {updated}'))
@@ -0,0 +1,270 @@
+"""
+Бенчмарк страниц чтения: WSGI (синхронные представления) против ASGI
+(асинхронные представления) при одинаковом числе одновременных запросов
+
+С установленным uvicorn оба приложения запускаются как HTTP серверы в этом
+процессе (WSGI - многопоточный wsgiref), иначе обработчики Django
+вызываются напрямую: WSGI из пула потоков, ASGI из задач asyncio.
+"""
+import asyncio
+import json
+import socket
+import socketserver
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection
+from contextlib import contextmanager
+from io import BytesIO, StringIO
+from itertools import cycle, islice
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from django.contrib.auth.models import User
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import override_settings
+
+from backend.testing import override_async_views
+from blog.models import Like, Post, Tag
+from users.stats import repair_author_stats
+
+from ._bench import benchmark_database, create_posts, create_tags, create_users, seeded_random
+
+try:
+    import uvicorn
+except ImportError:
+    uvicorn = None
+
+
+HOST = '127.0.0.1'
+
+
+class ThreadingWSGIServer(socketserver.ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def summarize(samples, elapsed):
+    """Пропускная способность и перцентили задержки по списку (статус, секунды)"""
+    latencies = sorted(duration * 1000 for _, duration in samples)
+    percentiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for status, _ in samples if status != 200),
+        'rps': round(len(samples) / elapsed, 1),
+        'p50_ms': round(percentiles[49], 2),
+        'p99_ms': round(percentiles[98], 2),
+    }
+
+
+def _timed(func, *args):
+    started = time.perf_counter()
+    status = func(*args)
+    return status, time.perf_counter() - started
+
+
+def _wsgi_call(application, path):
+    path, _, query = path.partition('?')
+    environ = {
+        'REQUEST_METHOD': 'GET', 'PATH_INFO': path, 'QUERY_STRING': query, 'SCRIPT_NAME': '',
+        'SERVER_NAME': HOST, 'SERVER_PORT': '80', 'HTTP_HOST': HOST, 'SERVER_PROTOCOL': 'HTTP/1.1',
+        'wsgi.input': BytesIO(), 'wsgi.errors': sys.stderr, 'wsgi.url_scheme': 'http',
+        'wsgi.multithread': True, 'wsgi.multiprocess': False, 'wsgi.run_once': False,
+    }
+    statuses = []
+    response = application(environ, lambda status, headers, exc_info=None: statuses.append(int(status[:3])))
+    for _ in response:
+        pass
+    # close() отправляет request_finished (закрытие соединения с БД)
+    response.close()
+    return statuses[0]
+
+
+async def _asgi_call(application, path):
+    path, _, query = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+        'scheme': 'http', 'path': path, 'raw_path': path.encode(), 'query_string': query.encode(),
+        'root_path': '', 'headers': [(b'host', HOST.encode())], 'server': (HOST, 80), 'client': (HOST, 50000),
+    }
+    received = False
+    status = None
+
+    async def receive():
+        nonlocal received
+        if not received:
+            received = True
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+        # Клиент не отключается: Django отменит ожидание после ответа
+        await asyncio.Future()
+
+    async def send(message):
+        nonlocal status
+        if message['type'] == 'http.response.start':
+            status = message['status']
+
+    await application(scope, receive, send)
+    return status
+
+
+def _http_call(port, path):
+    connection = HTTPConnection(HOST, port, timeout=30)
+    try:
+        connection.request('GET', path)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+    finally:
+        connection.close()
+
+
+def run_threads(call, paths, concurrency):
+    """Запросы из пула потоков; возвращает (samples, секунды)"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(lambda path: _timed(call, path), paths))
+    return samples, time.perf_counter() - started
+
+
+def run_asgi_in_process(application, paths, concurrency):
+    """Запросы к ASGI обработчику из concurrency задач asyncio"""
+    async def main():
+        queue = iter(paths)
+        samples = []
+
+        async def worker():
+            for path in queue:
+                started = time.perf_counter()
+                status = await _asgi_call(application, path)
+                samples.append((status, time.perf_counter() - started))
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return samples, time.perf_counter() - started
+
+    return asyncio.run(main())
+
+
+@contextmanager
+def serve(deployment, application=None):
+    """
+    HTTP сервер развертывания в фоновом потоке; возвращает порт
+
+    Args:
+        application: WSGI приложение (по умолчанию обработчик Django)
+    """
+    if deployment == 'wsgi':
+        server = make_server(HOST, 0, application or WSGIHandler(), ThreadingWSGIServer, QuietHandler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            yield server.server_port
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+        return
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind((HOST, 0))
+    config = uvicorn.Config(ASGIHandler(), log_level='warning', lifespan='off', access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, kwargs={'sockets': [sock]}, daemon=True)
+    thread.start()
+    while not server.started and thread.is_alive():
+        time.sleep(0.01)
+    try:
+        yield sock.getsockname()[1]
+    finally:
+        server.should_exit = True
+        thread.join()
+        sock.close()
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает пропускную способность и p99 страниц чтения под WSGI и ASGI (uvicorn)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=2_000, help='Количество постов')
+        parser.add_argument('--requests', type=int, default=600, help='Запросов на каждое развертывание')
+        parser.add_argument('--concurrency', type=int, default=16, help='Одновременных запросов')
+        parser.add_argument('--server', choices=['auto', 'uvicorn', 'in-process'], default='auto',
+                            help='HTTP серверы (uvicorn) или прямой вызов обработчиков')
+        parser.add_argument('--json', action='store_true', help='Вывести результаты в JSON')
+
+    def handle(self, *args, **options):
+        server = options['server']
+        if server == 'auto':
+            server = 'uvicorn' if uvicorn is not None else 'in-process'
+        if server == 'uvicorn' and uvicorn is None:
+            raise CommandError('Для --server uvicorn установите uvicorn (pip install uvicorn)')
+
+        quiet = options['json']
+        results = {'server': server, 'concurrency': options['concurrency']}
+
+        # Без DEBUG: запросы не копятся в connection.queries, как в рабочем развертывании
+        with benchmark_database(stdout=None if quiet else self.stdout), \
+                override_settings(DEBUG=False, ALLOWED_HOSTS=[HOST], PAGE_CACHE_TIMEOUT=0):
+            paths = self.seed(options['posts'])
+            paths = list(islice(cycle(paths), options['requests']))
+            # Соединение основного потока не должно держать блокировку SQLite
+            connections.close_all()
+
+            for deployment, async_views in (('wsgi', False), ('asgi', True)):
+                with override_async_views(async_views):
+                    samples, elapsed = self.run(deployment, server, paths, options['concurrency'])
+                results[deployment] = summarize(samples, elapsed)
+                if not quiet:
+                    row = results[deployment]
+                    self.stdout.write(
+                        f"{deployment.upper():<5} {row['rps']:>8.1f} запр/с   p50 {row['p50_ms']:>8.2f} мс   "
+                        f"p99 {row['p99_ms']:>8.2f} мс   ошибок: {row['errors']}"
+                    )
+
+        if quiet:
+            self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
+
+    def seed(self, posts_count):
+        """Данные для страниц чтения; возвращает список путей"""
+        rng = seeded_random()
+        authors = create_users(50, prefix='author')
+        tags = create_tags(['python', 'django', 'async', 'sqlite', 'web'])
+        create_posts(posts_count, rng, authors, tags, content_words=200)
+        post_ids = list(Post.objects.values_list('pk', flat=True))
+        Like.objects.bulk_create([
+            Like(post_id=post_id, user=rng.choice(authors)) for post_id in rng.sample(post_ids, k=len(post_ids) // 4)
+        ], ignore_conflicts=True)
+        for command in ('reconcile_counters', 'rebuild_tag_counts', 'rebuild_post_html', 'rebuild_search_index'):
+            call_command(command, stdout=StringIO())
+        repair_author_stats()
+
+        sample_posts = rng.sample(post_ids, k=min(20, len(post_ids)))
+        return [
+            '/', '/posts/', '/search/?q=django',
+            *(f'/post/{post_id}/' for post_id in sample_posts),
+            *(f'/tag/{tag.slug}/' for tag in Tag.objects.all()),
+            *(f'/users/profile/{username}/' for username in User.objects.values_list('username', flat=True)[:5]),
+        ]
+
+    def run(self, deployment, server, paths, concurrency):
+        if server == 'in-process':
+            if deployment == 'wsgi':
+                application = WSGIHandler()
+                run_threads(lambda path: _wsgi_call(application, path), paths[:concurrency], concurrency)
+                return run_threads(lambda path: _wsgi_call(application, path), paths, concurrency)
+            application = ASGIHandler()
+            run_asgi_in_process(application, paths[:concurrency], concurrency)
+            return run_asgi_in_process(application, paths, concurrency)
+
+        with serve(deployment) as port:
+            run_threads(lambda path: _http_call(port, path), paths[:concurrency], concurrency)
+            return run_threads(lambda path: _http_call(port, path), paths, concurrency)
@@ -0,0 +1,86 @@
+"""
+Бенчмарк карточек постов: полный content + фильтры шаблона против хранимого анонса
+"""
+import json
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.template import Context, Template
+
+from blog.models import Post
+from blog.rendering import backfill_excerpts
+
+from ._bench import benchmark_database, create_posts, create_tags, create_users, measure, seeded_random
+
+
+LEGACY_CARD = Template('{% for post in posts %}<p>{{ post.content|truncatewords:50|striptags }}</p>{% endfor %}')
+EXCERPT_CARD = Template('{% for post in posts %}<p>{{ post.excerpt }}</p>{% endfor %}')
+
+
+def legacy_cards(per_page):
+    """Прежняя реализация: загружается весь content, анонс режется в шаблоне"""
+    posts = list(Post.objects.select_related('author')[:per_page])
+    return LEGACY_CARD.render(Context({'posts': posts}))
+
+
+def excerpt_cards(per_page):
+    """Текущая реализация: content не загружается, выводится хранимый анонс"""
+    posts = list(Post.objects.select_related('author').defer('content')[:per_page])
+    return EXCERPT_CARD.render(Context({'posts': posts}))
+
+
+def peak_memory(func):
+    """Пиковое выделение памяти при вызове функции, в КиБ"""
+    tracemalloc.start()
+    try:
+        func()
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает память и время рендера страницы карточек до и после хранимых анонсов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=1_000, help='Количество постов')
+        parser.add_argument('--words', type=int, nargs='+', default=[200, 2_000, 10_000],
+                            help='Длина постов в словах')
+        parser.add_argument('--per-page', type=int, default=10, help='Постов на странице')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов на каждый замер')
+        parser.add_argument('--json', action='store_true', help='Вывести результаты в JSON')
+
+    def handle(self, *args, **options):
+        results = []
+        rng = seeded_random()
+        per_page = options['per_page']
+
+        with benchmark_database(stdout=None if options['json'] else self.stdout):
+            authors = create_users(20)
+            tags = create_tags(['python', 'django', 'web'])
+
+            for words in options['words']:
+                Post.objects.all().delete()
+                create_posts(options['posts'], rng, authors, tags, content_words=words)
+                backfill_excerpts()
+
+                row = {'words': words}
+                for name, func in [
+                    ('legacy', lambda: legacy_cards(per_page)),
+                    ('excerpt', lambda: excerpt_cards(per_page)),
+                ]:
+                    row[name] = measure(func, options['repeat'])
+                    row[name]['peak_kib'] = peak_memory(func)
+                row['memory_ratio'] = round(row['legacy']['peak_kib'] / max(row['excerpt']['peak_kib'], 0.1), 1)
+                results.append(row)
+
+                if not options['json']:
+                    self.stdout.write(
+                        f"{words:>6} слов  "
+                        f"прежние {row['legacy']['median_ms']:>8.2f} мс {row['legacy']['peak_kib']:>9.1f} КиБ   "
+                        f"анонсы {row['excerpt']['median_ms']:>7.2f} мс {row['excerpt']['peak_kib']:>8.1f} КиБ   "
+                        f"память x{row['memory_ratio']}"
+                    )
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
@@ -0,0 +1,85 @@
+"""
+Бенчмарк ленты подписок: наивный запрос по author__in против таблицы лент
+"""
+import json
+
+from django.core.management.base import BaseCommand
+
+from blog.models import Post, Subscribe
+from blog.timeline import FeedPaginator, rebuild_timeline
+from users.stats import repair_author_stats
+
+from ._bench import benchmark_database, create_posts, create_users, measure, seeded_random
+
+
+def naive_feed(user, per_page, before=None):
+    """Наивная лента: посты всех авторов из подписок с сортировкой по дате"""
+    posts = Post.objects.filter(
+        author__in=Subscribe.objects.filter(user=user).values('author')
+    ).select_related('author').order_by('-created_at', '-pk')
+    if before is not None:
+        posts = posts.filter(pk__lt=before)
+    return list(posts[:per_page])
+
+
+def timeline_feed(user, per_page, cursor=None):
+    """Лента из таблицы лент (с подмешиванием больших авторов)"""
+    return FeedPaginator(user, Post.objects.select_related('author'), per_page).get_page(cursor)
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает ленту подписок из таблицы лент с наивным запросом по author__in'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=100_000, help='Количество постов')
+        parser.add_argument('--authors', type=int, default=1_000, help='Количество авторов')
+        parser.add_argument('--following', type=int, nargs='+', default=[10, 100, 500],
+                            help='Количество подписок у читателя')
+        parser.add_argument('--per-page', type=int, default=20, help='Постов на странице')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов на каждый замер')
+        parser.add_argument('--json', action='store_true', help='Вывести результаты в JSON')
+
+    def handle(self, *args, **options):
+        results = []
+        rng = seeded_random()
+        per_page = options['per_page']
+
+        with benchmark_database(stdout=None if options['json'] else self.stdout):
+            authors = create_users(options['authors'], prefix='author')
+            readers = create_users(len(options['following']), prefix='reader')
+            create_posts(options['posts'], rng, authors, [], content_words=20)
+
+            for reader, following in zip(readers, options['following']):
+                Subscribe.objects.bulk_create([
+                    Subscribe(user=reader, author=author)
+                    for author in rng.sample(authors, k=min(following, len(authors)))
+                ])
+            repair_author_stats()
+            for reader in readers:
+                rebuild_timeline(reader.pk)
+
+            for reader, following in zip(readers, options['following']):
+                first = timeline_feed(reader, per_page)
+                before = naive_feed(reader, per_page)[-1].pk
+                row = {
+                    'following': following,
+                    'naive': measure(lambda: naive_feed(reader, per_page), options['repeat']),
+                    'timeline': measure(lambda: timeline_feed(reader, per_page), options['repeat']),
+                    'naive_page2': measure(lambda: naive_feed(reader, per_page, before), options['repeat']),
+                    'timeline_page2': measure(
+                        lambda: timeline_feed(reader, per_page, first.next_cursor), options['repeat']
+                    ),
+                }
+                row['speedup'] = round(row['naive']['median_ms'] / max(row['timeline']['median_ms'], 0.001), 1)
+                results.append(row)
+
+                if not options['json']:
+                    self.stdout.write(
+                        f"{following:>5} подписок  "
+                        f"author__in {row['naive']['median_ms']:>9.2f} мс (стр. 2: {row['naive_page2']['median_ms']:.2f})   "
+                        f"лента {row['timeline']['median_ms']:>7.2f} мс (стр. 2: {row['timeline_page2']['median_ms']:.2f})   "
+                        f"x{row['speedup']}"
+                    )
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
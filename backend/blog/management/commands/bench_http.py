@@ -0,0 +1,331 @@
+"""
+Нагрузочный бенчмарк всех маршрутов по HTTP
+
+Во временной БД создается набор данных (generate_data), в этом процессе
+запускается многопоточный WSGI сервер, и клиенты с заданной
+конкурентностью выполняют смесь запросов: чтение анонимно и с входом,
+лайки, комментарии, подписки, создание постов. План запросов
+детерминирован (--seed). Для каждого маршрута выводятся пропускная
+способность, перцентили задержки и число SQL запросов на запрос;
+JSON (--json, --output) удобно сравнивать между релизами.
+
+SQL запросы считаются на стороне сервера (execute_wrapper соединения
+потока запроса) и передаются клиенту заголовком X-Bench-Queries.
+"""
+import json
+import secrets
+import statistics
+import time
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from http.client import HTTPConnection
+from io import StringIO
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import override_settings
+
+from blog.models import Post, Tag
+
+from ._bench import WORDS, benchmark_database, make_text, seeded_random
+from .bench_asgi import HOST, serve
+
+
+QUERIES_HEADER = 'X-Bench-Queries'
+
+
+@dataclass(frozen=True)
+class Route:
+    """Сценарий запроса: метод, нужен ли вход и вес в смеси по умолчанию"""
+    method: str
+    auth: bool
+    weight: int
+
+
+ROUTES = {
+    # Чтение без входа
+    'index': Route('GET', False, 10),
+    'posts_list': Route('GET', False, 8),
+    'post_detail': Route('GET', False, 20),
+    'tag_posts': Route('GET', False, 6),
+    'search': Route('GET', False, 4),
+    'profile': Route('GET', False, 4),
+    'posts_api': Route('GET', False, 3),
+    # Чтение с входом
+    'index_auth': Route('GET', True, 6),
+    'post_detail_auth': Route('GET', True, 10),
+    'feed': Route('GET', True, 6),
+    'feed_api': Route('GET', True, 2),
+    'viewer_api': Route('GET', True, 3),
+    'settings': Route('GET', True, 1),
+    'my_subscriptions': Route('GET', True, 1),
+    # Запись
+    'like': Route('POST', True, 8),
+    'comment': Route('POST', True, 4),
+    'subscribe': Route('POST', True, 2),
+    'create_post': Route('POST', True, 2),
+}
+
+
+@dataclass(frozen=True)
+class PlannedRequest:
+    route: str
+    method: str
+    path: str
+    body: bytes = b''
+    session: str = ''
+
+
+class QueryCountingApplication:
+    """WSGI обертка: число SQL запросов обработки в заголовке ответа"""
+
+    def __init__(self, application):
+        self.application = application
+
+    def __call__(self, environ, start_response):
+        queries = 0
+
+        def count(execute, sql, params, many, context):
+            nonlocal queries
+            queries += 1
+            return execute(sql, params, many, context)
+
+        def start(status, headers, exc_info=None):
+            return start_response(status, [*headers, (QUERIES_HEADER, str(queries))], exc_info)
+
+        # Соединения с БД у каждого потока свои: считаются только запросы этого запроса
+        with connection.execute_wrapper(count):
+            return self.application(environ, start)
+
+
+def parse_mix(value):
+    """
+    Веса маршрутов из строки вида 'index=10,like=0'
+
+    Returns:
+        Словарь весов всех маршрутов (неуказанные - по умолчанию)
+    """
+    weights = {name: route.weight for name, route in ROUTES.items()}
+    for item in filter(None, (part.strip() for part in value.split(','))):
+        name, _, weight = item.partition('=')
+        if name not in ROUTES or not weight.isdigit():
+            raise CommandError(f'Неверный элемент --mix: {item!r} (маршруты: {", ".join(ROUTES)})')
+        weights[name] = int(weight)
+    if not any(weights.values()):
+        raise CommandError('В смеси --mix нет ни одного маршрута с ненулевым весом')
+    return weights
+
+
+def percentile(sorted_values, fraction):
+    """Перцентиль (ближайший ранг) по отсортированному списку"""
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, elapsed):
+    """
+    Сводка по списку (статус, секунды, SQL запросы)
+
+    Ошибкой считается статус 400 и выше (перенаправление после POST - успех).
+    """
+    latencies = sorted(duration * 1000 for _, duration, _ in samples)
+    queries = [count for _, _, count in samples if count is not None]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for status, _, _ in samples if status >= 400),
+        'statuses': dict(sorted(Counter(str(status) for status, _, _ in samples).items())),
+        'rps': round(len(samples) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p90_ms': round(percentile(latencies, 0.90), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(latencies[-1], 2),
+        'queries_mean': round(statistics.fmean(queries), 2) if queries else None,
+        'queries_max': max(queries, default=None),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Нагрузочный HTTP бенчмарк всех маршрутов: запр/с, перцентили задержки и SQL запросы на запрос'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200, help='Пользователей в наборе данных')
+        parser.add_argument('--posts', type=int, default=2_000, help='Постов в наборе данных')
+        parser.add_argument('--requests', type=int, default=2_000, help='Количество запросов')
+        parser.add_argument('--concurrency', type=int, default=8, help='Одновременных запросов')
+        parser.add_argument('--sessions', type=int, default=20, help='Пользователей, выполняющих запросы с входом')
+        parser.add_argument('--mix', default='',
+                            help=f'Веса маршрутов, например index=10,like=0 (маршруты: {", ".join(ROUTES)})')
+        parser.add_argument('--page-cache', type=int, default=0, metavar='SECONDS',
+                            help='PAGE_CACHE_TIMEOUT на время бенчмарка (0 - без кэша страниц)')
+        parser.add_argument('--seed', type=int, default=42, help='Зерно набора данных и плана запросов')
+        parser.add_argument('--json', action='store_true', help='Вывести результаты в JSON')
+        parser.add_argument('--output', help='Сохранить результаты в JSON файл')
+
+    def handle(self, *args, **options):
+        weights = parse_mix(options['mix'])
+        if options['sessions'] < 0:
+            raise CommandError('--sessions не может быть отрицательным')
+        auth_routes = [name for name, route in ROUTES.items() if route.auth and weights[name]]
+        if auth_routes and min(options['sessions'], options['users']) == 0:
+            raise CommandError(
+                f'Маршрутам с входом ({", ".join(auth_routes)}) нужны сессии: задайте --sessions и --users '
+                f'больше 0 или отключите их в --mix'
+            )
+        # Секрет CSRF (без маскирования) в cookie и заголовке X-CSRFToken всех POST запросов
+        self.csrf_token = secrets.token_hex(16)
+        quiet = options['json']
+        concurrency = options['concurrency']
+
+        # Без DEBUG: запросы не копятся в connection.queries, как в рабочем развертывании
+        with benchmark_database(stdout=None if quiet else self.stdout), \
+                override_settings(DEBUG=False, ALLOWED_HOSTS=[HOST], PAGE_CACHE_TIMEOUT=options['page_cache']):
+            call_command(
+                'generate_data', users=options['users'], posts=options['posts'],
+                comments=options['posts'] * 3, likes=options['posts'] * 10, render_html=True,
+                prefix='bench', seed=options['seed'], stdout=StringIO(), verbosity=0,
+            )
+            plan = self.plan(options['requests'] + concurrency, weights, options['sessions'], options['seed'])
+            warmup, plan = plan[:concurrency], plan[concurrency:]
+            # Соединение основного потока не должно держать блокировку SQLite
+            connections.close_all()
+
+            with serve('wsgi', QueryCountingApplication(WSGIHandler())) as port:
+                self.run(port, warmup, concurrency)
+                samples, elapsed = self.run(port, plan, concurrency)
+
+        by_route = defaultdict(list)
+        for route, status, duration, queries in samples:
+            by_route[route].append((status, duration, queries))
+        results = {
+            'config': {
+                name: options[name]
+                for name in ('users', 'posts', 'requests', 'concurrency', 'sessions', 'page_cache', 'seed')
+            },
+            'mix': {name: weight for name, weight in weights.items() if weight},
+            'total': summarize([sample[1:] for sample in samples], elapsed),
+            'routes': {name: summarize(by_route[name], elapsed) for name in ROUTES if by_route[name]},
+        }
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(results, file, ensure_ascii=False, indent=2)
+        if quiet:
+            self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
+            return
+
+        self.stdout.write(
+            f"{'маршрут':<18} {'запросов':>8} {'запр/с':>8} {'p50 мс':>8} {'p90 мс':>8} "
+            f"{'p99 мс':>8} {'SQL':>6} {'ошибок':>6}"
+        )
+        for name, row in [*results['routes'].items(), ('ВСЕГО', results['total'])]:
+            self.stdout.write(
+                f"{name:<18} {row['requests']:>8} {row['rps']:>8.1f} {row['p50_ms']:>8.2f} {row['p90_ms']:>8.2f} "
+                f"{row['p99_ms']:>8.2f} {row['queries_mean']:>6.1f} {row['errors']:>6}"
+            )
+
+    def sessions(self, count):
+        """
+        Сессии читателей с наибольшим числом подписок (непустые ленты)
+
+        Returns:
+            Список (имя пользователя, заголовок Cookie)
+        """
+        users = (
+            User.objects.filter(username__startswith='bench').annotate(following=Count('subscribes'))
+            .order_by('-following', 'pk')[:count]
+        )
+        result = []
+        for user in users:
+            client = Client()
+            client.force_login(user)
+            session_id = client.cookies[settings.SESSION_COOKIE_NAME].value
+            result.append((
+                user.username,
+                f'{settings.SESSION_COOKIE_NAME}={session_id}; {settings.CSRF_COOKIE_NAME}={self.csrf_token}',
+            ))
+        return result
+
+    def plan(self, count, weights, sessions_count, seed):
+        """Детерминированный план запросов по весам маршрутов"""
+        rng = seeded_random(seed)
+        posts = list(Post.objects.order_by('pk').values_list('pk', 'views'))
+        post_ids = [pk for pk, _ in posts]
+        # Популярные посты читают и лайкают чаще
+        post_weights = [views + 1 for _, views in posts]
+        tags = list(Tag.objects.order_by('pk').values_list('pk', 'slug'))
+        tag_slugs = [slug for _, slug in tags]
+        usernames = list(User.objects.filter(username__startswith='bench').order_by('pk')
+                         .values_list('username', flat=True))
+        sessions = self.sessions(sessions_count)
+        search_words = [word for word in WORDS if word.isascii()]
+        names = [name for name in ROUTES if weights[name]]
+
+        def post_id():
+            return rng.choices(post_ids, weights=post_weights)[0]
+
+        def build(name):
+            username, cookie = rng.choice(sessions) if ROUTES[name].auth else ('', '')
+            path, data = {
+                'index': lambda: ('/', None),
+                'index_auth': lambda: ('/', None),
+                'posts_list': lambda: ('/posts/', None),
+                'post_detail': lambda: (f'/post/{post_id()}/', None),
+                'post_detail_auth': lambda: (f'/post/{post_id()}/', None),
+                'tag_posts': lambda: (f'/tag/{rng.choice(tag_slugs)}/', None),
+                'search': lambda: (f'/search/?q={rng.choice(search_words)}', None),
+                'profile': lambda: (f'/users/profile/{rng.choice(usernames)}/', None),
+                'posts_api': lambda: ('/api/posts/', None),
+                'feed': lambda: ('/feed/', None),
+                'feed_api': lambda: ('/api/feed/', None),
+                'viewer_api': lambda: ('/api/viewer/?' + urlencode({
+                    'posts': ','.join(str(post_id()) for _ in range(10)),
+                }), None),
+                'settings': lambda: ('/users/settings/', None),
+                'my_subscriptions': lambda: ('/users/subscriptions/', None),
+                'like': lambda: (f'/post/{post_id()}/like/', {}),
+                'comment': lambda: (f'/post/{post_id()}/', {'content': make_text(rng, 12)}),
+                'subscribe': lambda: (
+                    f'/user/{rng.choice([name for name in usernames[:50] if name != username])}/subscribe/', {}
+                ),
+                'create_post': lambda: ('/post/create/', {
+                    'title': make_text(rng, 6), 'content': make_text(rng, 120), 'tags': rng.choice(tags)[0],
+                }),
+            }[name]()
+            body = urlencode(data).encode() if data is not None else b''
+            return PlannedRequest(name, ROUTES[name].method, path, body, cookie)
+
+        return [build(name) for name in rng.choices(names, weights=[weights[name] for name in names], k=count)]
+
+    def request(self, port, planned):
+        """Выполняет запрос; возвращает (маршрут, статус, секунды, SQL запросы)"""
+        headers = {'Host': HOST}
+        if planned.session:
+            headers['Cookie'] = planned.session
+        if planned.method == 'POST':
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            headers['X-CSRFToken'] = self.csrf_token
+        started = time.perf_counter()
+        http = HTTPConnection(HOST, port, timeout=30)
+        try:
+            http.request(planned.method, planned.path, body=planned.body or None, headers=headers)
+            response = http.getresponse()
+            response.read()
+        finally:
+            http.close()
+        duration = time.perf_counter() - started
+        queries = response.getheader(QUERIES_HEADER)
+        return planned.route, response.status, duration, int(queries) if queries is not None else None
+
+    def run(self, port, plan, concurrency):
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = list(executor.map(lambda planned: self.request(port, planned), plan))
+        return samples, time.perf_counter() - started
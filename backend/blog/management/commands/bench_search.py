@@ -0,0 +1,81 @@
+"""
+Бенчмарк поиска: FTS5 против прежнего icontains
+"""
+import json
+
+from django.core.paginator import Paginator
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from blog.models import Post
+from blog.search import fts_enabled, rebuild_index, reset_fts_state, search_post_ids
+
+from ._bench import benchmark_database, create_posts, create_tags, create_users, measure, seeded_random
+
+
+def legacy_search(query):
+    """Прежняя реализация views.search: icontains + distinct + COUNT"""
+    posts = Post.objects.filter(
+        Q(title__icontains=query) |
+        Q(content__icontains=query) |
+        Q(tags__name__icontains=query)
+    ).select_related('author').prefetch_related('tags').distinct()
+    page = Paginator(posts, 10).get_page(1)
+    return list(page)
+
+
+def fts_search(query):
+    """Текущая реализация: ранжированные id из FTS5 + загрузка одной страницы"""
+    page = Paginator(search_post_ids(query), 10).get_page(1)
+    posts = Post.objects.select_related('author').prefetch_related('tags').in_bulk(page.object_list)
+    return [posts[pk] for pk in page.object_list if pk in posts]
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость FTS5-поиска и прежнего icontains на наборах разного размера'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                            help='Количество постов для замеров')
+        parser.add_argument('--queries', nargs='+', default=['django', 'python api', 'кэш', 'performance tutorial'],
+                            help='Поисковые запросы')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов на каждый замер')
+        parser.add_argument('--db-file', help='Файл временной БД (по умолчанию во временном каталоге)')
+        parser.add_argument('--json', action='store_true', help='Вывести результаты в JSON')
+
+    def handle(self, *args, **options):
+        results = []
+        rng = seeded_random()
+
+        with benchmark_database(options['db_file'], stdout=None if options['json'] else self.stdout):
+            reset_fts_state()
+            if not fts_enabled():
+                self.stderr.write('FTS5 недоступен в этой сборке SQLite')
+                return
+
+            authors = create_users(100)
+            tags = create_tags(['python', 'django', 'javascript', 'web', 'tutorial', 'backend', 'frontend'])
+            total = 0
+
+            for size in sorted(options['sizes']):
+                total += create_posts(size - total, rng, authors, tags)
+                rebuild_index()
+
+                for query in options['queries']:
+                    row = {
+                        'posts': size,
+                        'query': query,
+                        'legacy': measure(lambda: legacy_search(query), options['repeat']),
+                        'fts5': measure(lambda: fts_search(query), options['repeat']),
+                    }
+                    row['speedup'] = round(row['legacy']['median_ms'] / max(row['fts5']['median_ms'], 0.001), 1)
+                    results.append(row)
+                    if not options['json']:
+                        self.stdout.write(
+                            f"{size:>9} постов  {query!r:<24} "
+                            f"icontains {row['legacy']['median_ms']:>10.2f} мс   "
+                            f"fts5 {row['fts5']['median_ms']:>8.2f} мс   x{row['speedup']}"
+                        )
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
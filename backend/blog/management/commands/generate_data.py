@@ -0,0 +1,272 @@
+"""
+Генерация синтетических данных для нагрузочного тестирования
+
+Данные детерминированы (--seed) и распределены неравномерно, как в рабочей
+базе: число подписчиков и постов у авторов подчиняется степенному закону,
+лайки и комментарии сосредоточены на "горячих" постах. Записи создаются
+bulk_create пачками, поэтому сигналы (уведомления, счетчики, ленты,
+поисковый индекс) не срабатывают; производные данные затем
+пересчитываются командами rebuild_* и reconcile_*.
+"""
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from io import StringIO
+from itertools import accumulate
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import Truncator
+
+from blog.models import Comment, Like, Post, Subscribe
+from blog.utils import EXCERPT_WORDS
+
+from ._bench import WORDS, create_tags, create_users, make_text, seeded_random
+
+
+# Команды пересчета производных данных (в порядке запуска)
+REBUILD_COMMANDS = (
+    ('reconcile_counters', {}),
+    ('rebuild_tag_counts', {}),
+    ('repair_author_stats', {}),
+    ('rebuild_timelines', {}),
+    ('rebuild_search_index', {}),
+)
+
+
+def power_law_weights(count, skew, rng):
+    """
+    Веса степенного распределения (1 / rank^skew) в случайном порядке
+
+    Returns:
+        Список весов длины count
+    """
+    weights = [1 / (rank + 1) ** skew for rank in range(count)]
+    rng.shuffle(weights)
+    return weights
+
+
+def tag_names(count):
+    """Имена тегов: латинские слова словаря, при нехватке - с номером"""
+    words = [word for word in WORDS if word.isascii()]
+    return [words[i % len(words)] + (f'-{i // len(words)}' if i >= len(words) else '') for i in range(count)]
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Отключает auto_now / auto_now_add: даты создания задаются генератором"""
+    saved = []
+    for model in models:
+        for field in model._meta.concrete_fields:
+            if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False):
+                saved.append((field, field.auto_now, field.auto_now_add))
+                field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Генерирует пользователей, посты, теги, комментарии, лайки и подписки для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000, help='Количество пользователей')
+        parser.add_argument('--posts', type=int, default=10_000, help='Количество постов')
+        parser.add_argument('--tags', type=int, default=30, help='Количество тегов')
+        parser.add_argument('--comments', type=int, default=30_000, help='Количество комментариев')
+        parser.add_argument('--likes', type=int, default=100_000,
+                            help='Количество лайков (повторы пар пост-пользователь отбрасываются)')
+        parser.add_argument('--following', type=int, default=20, help='Среднее число подписок пользователя')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Показатель степенного распределения популярности авторов и постов')
+        parser.add_argument('--days', type=int, default=365, help='За сколько дней распределены посты')
+        parser.add_argument('--content-words', type=int, default=120, help='Слов в посте')
+        parser.add_argument('--prefix', default='user', help='Префикс имен пользователей')
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора случайных чисел')
+        parser.add_argument('--batch-size', type=int, default=5_000, help='Размер пачки bulk_create')
+        parser.add_argument('--skip-rebuild', action='store_true',
+                            help='Не пересчитывать счетчики, ленты и поисковый индекс')
+        parser.add_argument('--render-html', action='store_true',
+                            help='Сразу сохранить HTML постов (иначе он рендерится при первом просмотре)')
+
+    def handle(self, *args, **options):
+        if options['users'] < 2:
+            raise CommandError('Нужно не меньше двух пользователей')
+        if User.objects.filter(username__startswith=options['prefix']).exists():
+            raise CommandError(
+                f"Пользователи с префиксом '{options['prefix']}' уже есть: укажите другой --prefix"
+            )
+
+        self.verbosity = options['verbosity']
+        self.counts = {}
+        self.rng = seeded_random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+
+        with explicit_timestamps(Post, Comment, Like, Subscribe):
+            users = self.step('Пользователи', lambda: create_users(options['users'], prefix=options['prefix']))
+            self.user_ids = [user.pk for user in users]
+            # Популярность автора: от нее зависят и подписчики, и число постов
+            self.author_weights = list(accumulate(power_law_weights(len(users), options['skew'], self.rng)))
+
+            self.tags = self.step('Теги', lambda: create_tags(tag_names(options['tags'])))
+            self.step('Посты', lambda: self.create_posts(options['posts'], options['days'],
+                                                         options['content_words'], options['skew']))
+            self.step('Подписки', lambda: self.create_subscriptions(options['following']))
+            self.step('Лайки', lambda: self.create_likes(options['likes']))
+            self.step('Комментарии', lambda: self.create_comments(options['comments']))
+
+        commands = [] if options['skip_rebuild'] else list(REBUILD_COMMANDS)
+        if options['render_html']:
+            commands.append(('rebuild_post_html', {}))
+        for name, kwargs in commands:
+            self.step(name, lambda: call_command(name, stdout=StringIO(), **kwargs))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: пользователей {len(self.user_ids)}, постов {len(self.post_ids)}, '
+            f'подписок {self.counts["subscriptions"]}, лайков {self.counts["likes"]}, '
+            f'комментариев {self.counts["comments"]}'
+        ))
+
+    def step(self, title, func):
+        """Выполняет шаг в транзакции и выводит время"""
+        started = time.perf_counter()
+        with transaction.atomic():
+            result = func()
+        if self.verbosity > 0:
+            self.stdout.write(f'{title}: {time.perf_counter() - started:.1f} с')
+        return result
+
+    def batches(self, total):
+        """Размеры пачек для total записей"""
+        for start in range(0, total, self.batch_size):
+            yield min(self.batch_size, total - start)
+
+    def random_time_after(self, created_at, max_days=30):
+        """Момент после created_at (но не позже текущего)"""
+        span = min((self.now - created_at).total_seconds(), max_days * 86400)
+        return created_at + timedelta(seconds=self.rng.random() * span)
+
+    def create_posts(self, count, days, content_words, skew):
+        """
+        Посты авторов пропорционально их популярности, равномерно по времени
+
+        Популярность поста (вес для лайков, комментариев и просмотров) тоже
+        степенная: небольшая доля постов собирает большую часть реакций.
+        """
+        rng = self.rng
+        weights = power_law_weights(count, skew, rng)
+        top = max(weights, default=1)
+        start = self.now - timedelta(days=days)
+        span = (self.now - start).total_seconds()
+        tag_weights = list(accumulate(power_law_weights(len(self.tags), 1.0, rng)))
+        through = Post.tags.through
+
+        self.post_ids, self.post_times = [], []
+        index = 0
+        for size in self.batches(count):
+            posts = []
+            authors = rng.choices(self.user_ids, cum_weights=self.author_weights, k=size)
+            for author_id in authors:
+                created_at = start + timedelta(seconds=span * (index + rng.random()) / count)
+                first, heading, second = (
+                    make_text(rng, content_words // 2),
+                    make_text(rng, 3).capitalize(),
+                    make_text(rng, content_words - content_words // 2),
+                )
+                posts.append(Post(
+                    title=make_text(rng, 6).capitalize(),
+                    content=f'{first}\n\n## {heading}\n\n{second}',
+                    # Слова без разметки: анонс совпадает с make_excerpt без рендеринга Markdown
+                    excerpt=Truncator(f'{first} {heading} {second}').words(EXCERPT_WORDS),
+                    author_id=author_id,
+                    created_at=created_at,
+                    updated_at=created_at,
+                    views=int(5_000 * weights[index] / top * rng.uniform(0.5, 1.5)) + rng.randint(0, 20),
+                ))
+                index += 1
+            Post.objects.bulk_create(posts)
+            self.post_ids.extend(post.pk for post in posts)
+            self.post_times.extend(post.created_at for post in posts)
+
+            links = set()
+            for post in posts:
+                for tag in rng.choices(self.tags, cum_weights=tag_weights, k=rng.randint(0, 3)):
+                    links.add((post.pk, tag.pk))
+            through.objects.bulk_create(
+                [through(post_id=post_id, tag_id=tag_id) for post_id, tag_id in links],
+                ignore_conflicts=True,
+            )
+
+        self.post_weights = list(accumulate(weights))
+
+    def create_subscriptions(self, following):
+        """
+        Подписки: число подписок у читателя экспоненциальное со средним following,
+        автор выбирается пропорционально популярности (степенной закон подписчиков)
+        """
+        rng = self.rng
+        created = 0
+        batch = []
+        max_following = len(self.user_ids) - 1
+        for user_id in self.user_ids:
+            wanted = min(int(rng.expovariate(1 / following)) if following else 0, max_following)
+            authors = set()
+            # Выборка с весами без повторов: лишние попытки ограничены
+            for _ in range(wanted * 3):
+                if len(authors) >= wanted:
+                    break
+                author_id = rng.choices(self.user_ids, cum_weights=self.author_weights)[0]
+                if author_id != user_id:
+                    authors.add(author_id)
+            for author_id in authors:
+                created_at = self.now - timedelta(seconds=rng.random() * 365 * 86400)
+                batch.append(Subscribe(user_id=user_id, author_id=author_id, created_at=created_at))
+            if len(batch) >= self.batch_size:
+                Subscribe.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        Subscribe.objects.bulk_create(batch)
+        self.counts['subscriptions'] = created + len(batch)
+
+    def pick_posts(self, count):
+        """Индексы постов с учетом их популярности"""
+        return self.rng.choices(range(len(self.post_ids)), cum_weights=self.post_weights, k=count)
+
+    def create_likes(self, count):
+        if not self.post_ids:
+            self.counts['likes'] = 0
+            return
+        rng = self.rng
+        for size in self.batches(count):
+            pairs = {}
+            for index, user_id in zip(self.pick_posts(size), rng.choices(self.user_ids, k=size)):
+                pairs[(self.post_ids[index], user_id)] = self.random_time_after(self.post_times[index])
+            Like.objects.bulk_create(
+                [Like(post_id=post_id, user_id=user_id, created_at=created_at)
+                 for (post_id, user_id), created_at in pairs.items()],
+                ignore_conflicts=True,
+            )
+        self.counts['likes'] = Like.objects.filter(user_id__in=self.user_ids).count()
+
+    def create_comments(self, count):
+        if not self.post_ids:
+            self.counts['comments'] = 0
+            return
+        rng = self.rng
+        for size in self.batches(count):
+            Comment.objects.bulk_create([
+                Comment(
+                    post_id=self.post_ids[index],
+                    author_id=rng.choice(self.user_ids),
+                    content=make_text(rng, rng.randint(3, 40)).capitalize(),
+                    created_at=self.random_time_after(self.post_times[index]),
+                )
+                for index in self.pick_posts(size)
+            ])
+        self.counts['comments'] = count
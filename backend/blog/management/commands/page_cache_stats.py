@@ -0,0 +1,26 @@
+"""
+Статистика кэша страниц для анонимных читателей
+"""
+import json
+
+from django.core.management.base import BaseCommand
+
+from blog import page_cache
+
+
+class Command(BaseCommand):
+    help = 'Выводит попадания и промахи кэша страниц и долю ответов из кэша'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Обнулить счетчики после вывода')
+        parser.add_argument('--json', action='store_true', help='Вывод в JSON')
+
+    def handle(self, *args, **options):
+        stats = page_cache.stats()
+        if options['json']:
+            self.stdout.write(json.dumps(stats))
+        else:
+            self.stdout.write(f'Из кэша: {stats["hit"]}, устаревших: {stats["stale"]}, промахов: {stats["miss"]}')
+            self.stdout.write(self.style.SUCCESS(f'Доля ответов из кэша: {stats["hit_ratio"]:.1%}'))
+        if options['reset']:
+            page_cache.reset_stats()
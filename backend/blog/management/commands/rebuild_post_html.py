@@ -0,0 +1,21 @@
+"""
+Массовая перерисовка сохраненного HTML постов
+"""
+from django.core.management.base import BaseCommand
+
+from blog.rendering import rebuild_post_html
+from blog.utils import RENDERER_VERSION
+
+
+class Command(BaseCommand):
+    help = 'Перерисовывает сохраненный HTML постов (после изменения расширений Markdown или allowlist санитайзера)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Размер пачки')
+        parser.add_argument('--force', action='store_true', help='Перерисовать даже актуальные записи')
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_post_html(batch_size=options['batch_size'], force=options['force'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Перерисовано постов: {rebuilt} (версия рендерера {RENDERER_VERSION})'
+        ))
@@ -0,0 +1,19 @@
+"""
+Перестроение полнотекстового индекса постов
+"""
+from django.core.management.base import BaseCommand
+
+from blog.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Полностью перестраивает FTS5-индекс постов'
+
+    def handle(self, *args, **options):
+        indexed = rebuild_index()
+        if indexed is None:
+            self.stdout.write(self.style.WARNING(
+                'FTS5-индекс недоступен для текущей БД, поиск работает через icontains'
+            ))
+            return
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано постов: {indexed}'))
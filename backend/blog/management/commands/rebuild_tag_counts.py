@@ -0,0 +1,14 @@
+"""
+Пересчет количества постов у тегов
+"""
+from django.core.management.base import BaseCommand
+
+from blog.counters import reconcile_tag_counts
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает post_count всех тегов по фактическим связям с постами'
+
+    def handle(self, *args, **options):
+        updated = reconcile_tag_counts()
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано тегов: {updated}'))
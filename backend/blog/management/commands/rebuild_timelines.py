@@ -0,0 +1,31 @@
+"""
+Пересборка и обрезка лент подписок
+"""
+from django.core.management.base import BaseCommand
+
+from blog.models import Subscribe, TimelineEntry
+from blog.timeline import rebuild_timeline, trim_timelines
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает ленты подписок всех читателей по их подпискам (или только обрезает их)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--trim-only', action='store_true',
+                            help='Только обрезать ленты до TIMELINE_MAX_LENGTH')
+
+    def handle(self, *args, **options):
+        if options['trim_only']:
+            deleted = trim_timelines()
+            self.stdout.write(self.style.SUCCESS(f'Удалено записей: {deleted}'))
+            return
+
+        readers = Subscribe.objects.order_by().values_list('user_id', flat=True).distinct()
+        # Ленты читателей без подписок больше не нужны
+        TimelineEntry.objects.exclude(user_id__in=readers).delete()
+        entries = 0
+        count = 0
+        for user_id in readers.iterator():
+            entries += rebuild_timeline(user_id)
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Пересобрано лент: {count}, записей: {entries}'))
@@ -0,0 +1,14 @@
+"""
+Пересчет денормализованных счетчиков лайков и комментариев
+"""
+from django.core.management.base import BaseCommand
+
+from blog.counters import reconcile_post_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает like_count и comment_count всех постов по фактическим данным'
+
+    def handle(self, *args, **options):
+        updated = reconcile_post_counters()
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано постов: {updated}'))
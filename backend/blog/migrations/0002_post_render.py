@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostRender',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='render', serialize=False, to='blog.post', verbose_name='Пост')),
+                ('content_hash', models.CharField(max_length=64, verbose_name='Хэш содержимого')),
+                ('html', models.TextField(verbose_name='HTML')),
+                ('rendered_at', models.DateTimeField(auto_now=True, verbose_name='Дата рендеринга')),
+            ],
+            options={
+                'verbose_name': 'Отрендеренный пост',
+                'verbose_name_plural': 'Отрендеренные посты',
+            },
+        ),
+    ]
@@ -0,0 +1,52 @@
+from django.db import migrations, OperationalError
+
+
+FTS_TABLE = 'blog_post_fts'
+
+
+def create_fts_index(apps, schema_editor):
+    """Создает FTS5-индекс постов (только SQLite с поддержкой FTS5)"""
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        try:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                "title, body, tags, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+        except OperationalError:
+            # SQLite собран без FTS5: поиск будет работать через icontains
+            return
+
+        cursor.execute(f"""
+            INSERT INTO {FTS_TABLE} (rowid, title, body, tags)
+            SELECT p.id, p.title, p.content, COALESCE((
+                SELECT group_concat(t.name, ' ')
+                FROM blog_tag t
+                JOIN blog_post_tags pt ON pt.tag_id = t.id
+                WHERE pt.post_id = p.id
+            ), '')
+            FROM blog_post p
+        """)
+
+
+def drop_fts_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0003_post_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:28
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_post_count(apps, schema_editor):
+    Tag = apps.get_model('blog', 'Tag')
+    through = apps.get_model('blog', 'Post').tags.through
+
+    counts = (
+        through.objects.filter(tag=OuterRef('pk'))
+        .order_by()
+        .values('tag')
+        .annotate(total=Count('pk'))
+        .values('total')
+    )
+    Tag.objects.update(post_count=Coalesce(Subquery(counts), Value(0)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0004_post_fts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tag',
+            name='post_count',
+            field=models.PositiveIntegerField(db_index=True, default=0, verbose_name='Постов'),
+        ),
+        migrations.RunPython(fill_post_count, migrations.RunPython.noop),
+    ]
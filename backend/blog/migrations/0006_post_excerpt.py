@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:33
+
+import html
+
+import markdown
+from django.db import migrations, models
+from django.utils.html import strip_tags
+from django.utils.text import Truncator
+
+
+def make_excerpt(md_text, words=50):
+    """Копия blog.utils.make_excerpt на момент миграции (не меняется вместе с ней)"""
+    if not md_text:
+        return ''
+
+    html_text = markdown.markdown(md_text, extensions=['fenced_code', 'tables', 'sane_lists'])
+    text = ' '.join(html.unescape(strip_tags(html_text)).split())
+    return Truncator(text).words(words)
+
+
+def fill_excerpts(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    batch = []
+    for post in Post.objects.only('pk', 'content').order_by('pk').iterator(chunk_size=500):
+        post.excerpt = make_excerpt(post.content)
+        batch.append(post)
+        if len(batch) >= 500:
+            Post.objects.bulk_update(batch, ['excerpt'])
+            batch = []
+    if batch:
+        Post.objects.bulk_update(batch, ['excerpt'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0005_tag_post_count'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='excerpt',
+            field=models.TextField(blank=True, editable=False, verbose_name='Анонс'),
+        ),
+        migrations.RunPython(fill_excerpts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:43
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_timelines(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    Subscribe = apps.get_model('blog', 'Subscribe')
+    TimelineEntry = apps.get_model('blog', 'TimelineEntry')
+
+    for user_id in Subscribe.objects.values_list('user_id', flat=True).distinct():
+        posts = (
+            Post.objects.filter(author__subscribers__user_id=user_id)
+            .order_by('-created_at', '-pk')
+            .values_list('pk', 'author_id', 'created_at')[:1000]
+        )
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(user_id=user_id, post_id=pk, author_id=author_id, created_at=created_at)
+            for pk, author_id, created_at in posts
+        ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0006_post_excerpt'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(verbose_name='Дата публикации поста')),
+                ('author', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='blog.post', verbose_name='Пост')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Читатель')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты',
+                'verbose_name_plural': 'Записи лент',
+                'indexes': [models.Index(fields=['user', '-created_at', '-post'], name='blog_timeline_feed_idx'), models.Index(fields=['user', 'author'], name='blog_timeline_author_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'post'), name='blog_timeline_user_post_uniq')],
+            },
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,11 @@
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models import Sum
+from django.db.models import BooleanField, Exists, OuterRef, Sum, Value
 from django.urls import reverse
 
+from .utils import make_excerpt
+
 
 # Create your models here.
 
@@ -12,12 +15,17 @@ class Tag(models.Model):
     name = models.CharField(max_length=50, unique=True, verbose_name='Название тега')
     slug = models.SlugField(max_length=50, unique=True, verbose_name='URL')
     created_at = models.DateTimeField(auto_now_add=True)
+    post_count = models.PositiveIntegerField(default=0, verbose_name='Постов')
 
     def __str__(self):
         return self.name
 
     class Meta:
         ordering = ['name']
+        indexes = [
+            # Популярные теги: ORDER BY post_count DESC, name
+            models.Index(fields=['-post_count', 'name'], name='blog_tag_popular_idx'),
+        ]
         verbose_name = 'Тег'
         verbose_name_plural = 'Теги'
 
@@ -25,21 +33,77 @@ class Tag(models.Model):
         return reverse('blog:tag_posts', kwargs={'slug': self.slug})
 
 
+class PostQuerySet(models.QuerySet):
+    """QuerySet постов"""
+
+    def with_viewer_state(self, user):
+        """
+        Добавляет флаги viewer_liked и viewer_follows_author для пользователя
+
+        Флаги считаются подзапросами EXISTS в том же SELECT, поэтому
+        страница постов не требует отдельного запроса на каждую карточку.
+        """
+        if not user.is_authenticated:
+            return self.annotate(
+                viewer_liked=Value(False, output_field=BooleanField()),
+                viewer_follows_author=Value(False, output_field=BooleanField()),
+            )
+        return self.annotate(
+            viewer_liked=Exists(Like.objects.filter(post=OuterRef('pk'), user=user)),
+            viewer_follows_author=Exists(Subscribe.objects.filter(author=OuterRef('author'), user=user)),
+        )
+
+    def with_tag(self, tag):
+        """
+        Посты с тегом для списка в порядке публикации
+
+        Посты популярного тега обходятся по индексу blog_post_recent_idx с
+        проверкой тега (EXISTS по уникальному индексу post_id, tag_id):
+        страница читается без сортировки всех постов тега. Постов редкого
+        тега (не больше TAG_POSTS_SORT_LIMIT) мало, поэтому они выбираются
+        по индексу тега и сортируются - обход всех постов ради них дороже.
+        """
+        if tag.post_count <= getattr(settings, 'TAG_POSTS_SORT_LIMIT', 1000):
+            return self.filter(tags=tag)
+        return self.filter(Exists(self.model.tags.through.objects.filter(post=OuterRef('pk'), tag=tag)))
+
+
 class Post(models.Model):
     """Посты блога с поддержкой Markdown"""
     title = models.CharField(max_length=200, verbose_name='Заголовок')
     content = models.TextField(verbose_name='Содержание (Markdown)')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
-    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts', verbose_name='Автор')
+    # Индекс по автору - первый столбец blog_post_author_recent_idx
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts', db_index=False, verbose_name='Автор')
     tags = models.ManyToManyField(Tag, related_name='posts', blank=True, verbose_name='Теги')
     views = models.PositiveIntegerField(default=0, verbose_name='Просмотры')
+    like_count = models.PositiveIntegerField(default=0, verbose_name='Лайки')
+    comment_count = models.PositiveIntegerField(default=0, verbose_name='Комментарии')
+    excerpt = models.TextField(blank=True, editable=False, verbose_name='Анонс')
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # Анонс пересчитывается при каждом изменении содержимого
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content' in update_fields:
+            self.excerpt = make_excerpt(self.content)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'excerpt'}
+        super().save(*args, **kwargs)
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Списки постов и курсорная пагинация: ORDER BY created_at DESC, id DESC
+            models.Index(fields=['-created_at', '-id'], name='blog_post_recent_idx'),
+            # Посты автора (профиль, лента, дополнение ленты при подписке)
+            models.Index(fields=['author', '-created_at', '-id'], name='blog_post_author_recent_idx'),
+        ]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
@@ -47,18 +111,19 @@ class Post(models.Model):
         return reverse('blog:post_detail', kwargs={'pk': self.pk})
 
     def total_likes(self):
-        """Общее количество лайков"""
-        return self.likes.count()
+        """Общее количество лайков (хранимый счетчик)"""
+        return self.like_count
     
     def increment_views(self):
-        """Увеличить счетчик просмотров"""
+        """Увеличить счетчик просмотров (запись в БД буферизуется)"""
+        from .view_counter import view_counter
+        view_counter.incr(self.pk)
         self.views += 1
-        self.save(update_fields=['views'])
 
 
 class Comment(models.Model):
     """Комментарии к постам (без Markdown)"""
-    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments', verbose_name='Пост')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments', db_index=False, verbose_name='Пост')
     content = models.TextField(verbose_name='Содержание')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments', verbose_name='Автор')
@@ -68,13 +133,18 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ['created_at']
+        indexes = [
+            # Комментарии поста по порядку и время последнего (валидаторы условного GET)
+            models.Index(fields=['post', 'created_at'], name='blog_comment_post_idx'),
+        ]
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
 
 
 class Like(models.Model):
     """Лайки к постам"""
-    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='likes', verbose_name='Пост')
+    # Подсчет лайков поста - по уникальному индексу (post, user)
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='likes', db_index=False, verbose_name='Пост')
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='likes', verbose_name='Пользователь')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
 
@@ -84,13 +154,18 @@ class Like(models.Model):
     class Meta:
         unique_together = ['post', 'user']
         ordering = ['-created_at']
+        indexes = [
+            # Время последнего лайка поста (валидаторы условного GET)
+            models.Index(fields=['post', '-created_at'], name='blog_like_post_recent_idx'),
+        ]
         verbose_name = 'Лайк'
         verbose_name_plural = 'Лайки'
 
 
 class Subscribe(models.Model):
     """Подписки на авторов"""
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='subscribes', verbose_name='Подписчик')
+    # Поиск по подписчику - по индексам (user, author) и (user, created_at)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='subscribes', db_index=False, verbose_name='Подписчик')
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='subscribers', verbose_name='Автор')
     created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата подписки')
 
@@ -100,6 +175,49 @@ class Subscribe(models.Model):
     class Meta:
         unique_together = ['user', 'author']
         ordering = ['-created_at']
+        indexes = [
+            # Мои подписки и мои подписчики по дате. Индекс внешнего ключа author
+            # остается: раскладка поста по лентам обходит подписчиков по id
+            models.Index(fields=['user', '-created_at'], name='blog_subscribe_user_idx'),
+            models.Index(fields=['author', '-created_at'], name='blog_subscribe_author_idx'),
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
 
+
+class PostRender(models.Model):
+    """Сохраненный HTML поста (кэш рендеринга Markdown)"""
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='render', verbose_name='Пост')
+    content_hash = models.CharField(max_length=64, verbose_name='Хэш содержимого')
+    html = models.TextField(verbose_name='HTML')
+    rendered_at = models.DateTimeField(auto_now=True, verbose_name='Дата рендеринга')
+
+    def __str__(self):
+        return f'HTML для "{self.post.title}"'
+
+    class Meta:
+        verbose_name = 'Отрендеренный пост'
+        verbose_name_plural = 'Отрендеренные посты'
+
+
+class TimelineEntry(models.Model):
+    """Запись персональной ленты подписок (fan-out on write, см. blog/timeline.py)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline', verbose_name='Читатель')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='+', verbose_name='Пост')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+', db_index=False, verbose_name='Автор')
+    created_at = models.DateTimeField(verbose_name='Дата публикации поста')
+
+    def __str__(self):
+        return f'Пост {self.post_id} в ленте {self.user_id}'
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'post'], name='blog_timeline_user_post_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='blog_timeline_feed_idx'),
+            # Удаление автора (CASCADE по author_id) и отписка (author_id, user_id)
+            models.Index(fields=['author', 'user'], name='blog_timeline_author_idx'),
+        ]
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
@@ -0,0 +1,339 @@
+"""
+Кэш страниц для анонимных читателей
+
+Страница кэшируется целиком по пути и параметрам запроса. Ключ включает
+поколения групп, от которых она зависит (пост, тег, списки постов, все
+страницы), поэтому сброс группы точечно делает недействительными все ее
+страницы, включая варианты с ?cursor=.
+
+Защита от одновременной перегенерации (stampede): после PAGE_CACHE_TIMEOUT
+запись еще PAGE_CACHE_GRACE секунд отдается как устаревшая, пока один
+процесс (захвативший блокировку) строит новую. При полном промахе
+остальные запросы недолго ждут результата этого процесса.
+
+Блокировка и поколения хранятся в кэше Django, поэтому кэш страниц
+включается только с общим для процессов кэшем (DJANGO_REDIS_URL):
+с LocMemCache системная проверка blog.E001 не даст запустить проект.
+
+При PAGE_SHELL_ENABLED страница рендерится как общая оболочка и для
+авторизованных пользователей: шаблоны выводят ее как для анонимного
+читателя (request.page_shell), а данные пользователя (шапка, тема, лайки,
+подписки, CSRF токен) подставляет static/js/viewer.js из /api/viewer/.
+Все читатели получают одну запись кэша.
+"""
+import asyncio
+import functools
+import hashlib
+import time
+import uuid
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response
+
+from .models import Tag
+
+# Группы страниц
+ALL_PAGES = 'pages'
+LISTINGS = 'listings'
+
+STATS_KEYS = {
+    'hit': 'page-cache:stats:hit',
+    'stale': 'page-cache:stats:stale',
+    'miss': 'page-cache:stats:miss',
+}
+
+# Заголовки, сохраняемые вместе со страницей
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified', 'Cache-Control', 'Vary')
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def post_group(post_id):
+    return f'post:{post_id}'
+
+
+def tag_group(slug):
+    return f'tag:{slug}'
+
+
+def _generation_key(group):
+    return f'page-cache:generation:{group}'
+
+
+def _generations(groups):
+    """Текущие поколения групп (недостающие создаются)"""
+    keys = {group: _generation_key(group) for group in groups}
+    stored = cache.get_many(keys.values())
+    missing = {key: uuid.uuid4().hex[:12] for key in keys.values() if key not in stored}
+    if missing:
+        # Поколение живет дольше любой страницы, которая на него ссылается
+        timeout = (_setting('PAGE_CACHE_TIMEOUT', 60) + _setting('PAGE_CACHE_GRACE', 30)) * 10
+        for key, value in missing.items():
+            cache.add(key, value, timeout)
+        stored.update(cache.get_many(missing.keys()))
+    return [stored.get(keys[group], '') for group in groups]
+
+
+def purge(*groups):
+    """
+    Сбрасывает страницы групп сразу и еще раз после коммита
+
+    Повторный сброс убирает страницу, которую параллельный запрос мог
+    построить по данным до коммита.
+    """
+    keys = [_generation_key(group) for group in groups]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def purge_post(post_id, tag_slugs=None):
+    """
+    Сбрасывает страницу поста, страницы его тегов и списки постов
+
+    Args:
+        tag_slugs: Теги поста (по умолчанию читаются из БД)
+    """
+    if tag_slugs is None:
+        tag_slugs = Tag.objects.filter(posts=post_id).values_list('slug', flat=True)
+    purge(post_group(post_id), LISTINGS, *(tag_group(slug) for slug in tag_slugs))
+
+
+def purge_post_counters(post_id):
+    """
+    Сбрасывает страницы после изменения лайков и комментариев поста
+
+    Страницы тегов не сбрасываются (для этого понадобился бы запрос тегов
+    поста на каждый лайк): счетчики на них отстают не больше PAGE_CACHE_TIMEOUT.
+    """
+    purge(post_group(post_id), LISTINGS)
+
+
+def _record(outcome):
+    key = STATS_KEYS[outcome]
+    if not cache.add(key, 1, None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def stats():
+    """Счетчики попаданий и доля ответов из кэша"""
+    values = cache.get_many(STATS_KEYS.values())
+    result = {outcome: values.get(key, 0) for outcome, key in STATS_KEYS.items()}
+    total = sum(result.values())
+    result['hit_ratio'] = (result['hit'] + result['stale']) / total if total else 0.0
+    return result
+
+
+def reset_stats():
+    cache.delete_many(STATS_KEYS.values())
+
+
+def _cacheable_request(request):
+    return (
+        _setting('PAGE_CACHE_TIMEOUT', 60) > 0
+        and request.method in ('GET', 'HEAD')
+        and not request.user.is_authenticated
+        # Сообщения выводятся в base.html один раз и не должны попасть в кэш
+        and not len(get_messages(request))
+    )
+
+
+def _shell_request(request):
+    return (
+        _setting('PAGE_SHELL_ENABLED', False)
+        and request.method in ('GET', 'HEAD')
+        # Страница с сообщениями рендерится для конкретного пользователя
+        and not len(get_messages(request))
+    )
+
+
+def _cacheable_response(response):
+    return (
+        response.status_code == 200
+        and not response.streaming
+        and not response.cookies
+        and 'private' not in response.get('Cache-Control', '')
+    )
+
+
+def _page_key(request, groups):
+    generations = _generations([ALL_PAGES, *groups])
+    digest = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'page-cache:page:{digest}:{":".join(generations)}'
+
+
+def _serve(request, entry, outcome):
+    """Ответ из записи кэша (с учетом условного GET клиента)"""
+    _record(outcome)
+    response = HttpResponse(entry['content'], status=200)
+    for name, value in entry['headers'].items():
+        response.headers[name] = value
+    response.headers['X-Page-Cache'] = outcome.upper()
+    return get_conditional_response(request, etag=response.get('ETag'), response=response)
+
+
+def _store(key, response):
+    now = time.time()
+    entry = {
+        'content': response.content,
+        'headers': {name: response[name] for name in STORED_HEADERS if response.has_header(name)},
+        'fresh_until': now + _setting('PAGE_CACHE_TIMEOUT', 60),
+    }
+    cache.set(key, entry, _setting('PAGE_CACHE_TIMEOUT', 60) + _setting('PAGE_CACHE_GRACE', 30))
+
+
+def _lock_key(key):
+    return f'{key}:lock'
+
+
+def _serve_hit(request, entry, outcome, on_hit, kwargs):
+    if on_hit is not None:
+        on_hit(request, **kwargs)
+    return _serve(request, entry, outcome)
+
+
+def _lookup(request, groups, on_hit, kwargs):
+    """
+    Поиск страницы в кэше
+
+    Returns:
+        Кортеж (key, response, locked): key - None, если запрос не кэшируется;
+        response - ответ из кэша или None; locked - запрос захватил
+        блокировку и строит страницу сам
+    """
+    if not _cacheable_request(request):
+        return None, None, False
+
+    key = _page_key(request, groups(request, **kwargs))
+    lock_timeout = _setting('PAGE_CACHE_LOCK_TIMEOUT', 10)
+    entry = cache.get(key)
+    if entry is None:
+        return key, None, cache.add(_lock_key(key), 1, lock_timeout)
+
+    fresh = entry['fresh_until'] > time.time()
+    # Устаревшую запись перестраивает один процесс, остальные отдают ее
+    if fresh or not cache.add(_lock_key(key), 1, lock_timeout):
+        return key, _serve_hit(request, entry, 'hit' if fresh else 'stale', on_hit, kwargs), False
+    return key, None, True
+
+
+def _finish(key, response):
+    """Сохраняет построенную страницу"""
+    _record('miss')
+    if _cacheable_response(response):
+        _store(key, response)
+        response.headers['X-Page-Cache'] = 'MISS'
+    return response
+
+
+# Интервал проверки кэша при ожидании чужого перестроения, секунд
+WAIT_STEP = 0.05
+
+
+@contextmanager
+def _as_shell(request):
+    """Рендеринг общей оболочки: на время запроса пользователь анонимный"""
+    request.page_shell = True
+    user, request.user = request.user, AnonymousUser()
+    try:
+        yield
+    finally:
+        request.user = user
+
+
+def anonymous_page_cache(groups, on_hit=None):
+    """
+    Декоратор представления: кэш страницы для анонимных читателей
+
+    С PAGE_SHELL_ENABLED авторизованные пользователи получают ту же
+    страницу-оболочку: на время рендеринга request.user заменяется анонимным.
+    Подходит и для асинхронных представлений (обращения к кэшу выполняются
+    в потоке, ожидание - через asyncio.sleep).
+
+    Args:
+        groups: Функция (request, **kwargs) -> список групп страницы
+        on_hit: Функция (request, **kwargs), выполняемая при ответе из кэша
+            (например, учет просмотра)
+    """
+    def decorator(view):
+        if iscoroutinefunction(view):
+            return _async_decorator(view, groups, on_hit)
+
+        def cached(request, *args, **kwargs):
+            key, response, locked = _lookup(request, groups, on_hit, kwargs)
+            if key is None:
+                return view(request, *args, **kwargs)
+            if response is not None:
+                return response
+
+            if not locked:
+                # Страницу уже строит другой процесс: ждем его результат
+                deadline = time.monotonic() + _setting('PAGE_CACHE_LOCK_WAIT', 2)
+                while time.monotonic() < deadline:
+                    time.sleep(WAIT_STEP)
+                    entry = cache.get(key)
+                    if entry is not None:
+                        return _serve_hit(request, entry, 'hit', on_hit, kwargs)
+                _record('miss')
+                return view(request, *args, **kwargs)
+
+            try:
+                return _finish(key, view(request, *args, **kwargs))
+            finally:
+                cache.delete(_lock_key(key))
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not _shell_request(request):
+                return cached(request, *args, **kwargs)
+            with _as_shell(request):
+                return cached(request, *args, **kwargs)
+
+        return wrapper
+    return decorator
+
+
+def _async_decorator(view, groups, on_hit):
+    """anonymous_page_cache для асинхронного представления"""
+    async def cached(request, *args, **kwargs):
+        key, response, locked = await sync_to_async(_lookup)(request, groups, on_hit, kwargs)
+        if key is None:
+            return await view(request, *args, **kwargs)
+        if response is not None:
+            return response
+
+        if not locked:
+            deadline = time.monotonic() + _setting('PAGE_CACHE_LOCK_WAIT', 2)
+            while time.monotonic() < deadline:
+                await asyncio.sleep(WAIT_STEP)
+                entry = await cache.aget(key)
+                if entry is not None:
+                    return await sync_to_async(_serve_hit)(request, entry, 'hit', on_hit, kwargs)
+            await sync_to_async(_record)('miss')
+            return await view(request, *args, **kwargs)
+
+        try:
+            response = await view(request, *args, **kwargs)
+            return await sync_to_async(_finish)(key, response)
+        finally:
+            await cache.adelete(_lock_key(key))
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await sync_to_async(_shell_request)(request):
+            return await cached(request, *args, **kwargs)
+        with _as_shell(request):
+            return await cached(request, *args, **kwargs)
+
+    return wrapper
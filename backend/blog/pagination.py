@@ -0,0 +1,269 @@
+"""
+Курсорная (keyset) пагинация
+
+Вместо OFFSET и COUNT(*) страница выбирается условием по ключу сортировки
+(по умолчанию created_at, id), поэтому глубокие страницы открываются так же
+быстро, как первая. Курсоры непрозрачны для клиента: это base64 от JSON.
+"""
+import base64
+import binascii
+import json
+from collections import namedtuple
+
+from django.db.models import Q
+
+
+# Курсор последней страницы (выбирается с конца списка)
+LAST_PAGE = 'last'
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class EstimatedCount(namedtuple('EstimatedCount', ['count', 'exact'])):
+    """Приблизительное количество (при превышении предела выводится с плюсом: 1000+)"""
+
+    def __str__(self):
+        return str(self.count) if self.exact else f'{self.count}+'
+
+
+def encode_cursor(values, direction):
+    """Упаковывает значения ключа и направление в непрозрачный курсор"""
+    data = json.dumps({'v': values, 'd': direction}, separators=(',', ':'), default=str)
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size=None):
+    """
+    Распаковывает курсор
+
+    Args:
+        cursor: Строка курсора
+        size: Ожидаемое число значений ключа (число полей сортировки)
+
+    Returns:
+        Кортеж (values, direction) или None для некорректного курсора
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values, direction = data['v'], data['d']
+    except (ValueError, TypeError, KeyError, binascii.Error):
+        return None
+
+    if direction not in (NEXT, PREVIOUS) or not isinstance(values, list) or not values:
+        return None
+    if size is not None and len(values) != size:
+        return None
+    # Значения ключа - только скаляры, null в ключе сортировки не бывает
+    if not all(isinstance(value, (str, int, float)) for value in values):
+        return None
+    return values, direction
+
+
+class KeysetPage:
+    """Страница курсорной пагинации"""
+
+    def __init__(self, object_list, paginator, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<KeysetPage of {len(self.object_list)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    @property
+    def estimated_count(self):
+        return self.paginator.estimated_count
+
+
+class KeysetPaginator:
+    """
+    Курсорная пагинация QuerySet
+
+    Args:
+        queryset: Исходный QuerySet
+        per_page: Количество объектов на странице
+        ordering: Поля сортировки; последнее должно быть уникальным
+        estimate_limit: Предел подсчета для приблизительного общего количества
+        count: Заранее известное количество (например, хранимый счетчик)
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-pk'), estimate_limit=1000, count=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = list(ordering)
+        self.estimate_limit = estimate_limit
+        self._estimated_count = EstimatedCount(count, True) if count is not None else None
+
+    def _fields(self):
+        """Список (имя поля, по убыванию)"""
+        return [(name.lstrip('-'), name.startswith('-')) for name in self.ordering]
+
+    def _key(self, obj):
+        return [getattr(obj, name) for name, _ in self._fields()]
+
+    def _to_python(self, values):
+        """Восстанавливает типы значений ключа из JSON"""
+        model = self.queryset.model
+        result = []
+        for (name, _), value in zip(self._fields(), values):
+            field = model._meta.pk if name == 'pk' else model._meta.get_field(name)
+            result.append(field.to_python(value))
+        return result
+
+    def _seek(self, values, forward):
+        """
+        Условие "после ключа" (forward) или "до ключа" для лексикографической сортировки
+        """
+        condition = Q()
+        fields = self._fields()
+        for index, (name, descending) in enumerate(fields):
+            lookup = 'lt' if descending == forward else 'gt'
+            term = Q(**{f'{name}__{lookup}': values[index]})
+            # Все предыдущие поля ключа равны
+            for prev_index in range(index):
+                term &= Q(**{fields[prev_index][0]: values[prev_index]})
+            condition |= term
+        return condition
+
+    def _reversed_ordering(self):
+        return [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+
+    def get_page(self, cursor=None):
+        """
+        Возвращает страницу по курсору
+
+        Некорректный или пустой курсор открывает первую страницу,
+        курсор LAST_PAGE - последнюю.
+        """
+        queryset, direction = self._page_query(cursor)
+        return self._build_page(list(queryset), direction)
+
+    async def aget_page(self, cursor=None):
+        """Асинхронный вариант get_page"""
+        queryset, direction = self._page_query(cursor)
+        return self._build_page([row async for row in queryset], direction)
+
+    def _page_query(self, cursor):
+        """
+        Запрос строк страницы
+
+        Returns:
+            Кортеж (queryset, direction); direction - None для первой
+            страницы, LAST_PAGE, NEXT или PREVIOUS
+        """
+        limit = self.per_page + 1
+
+        if cursor == LAST_PAGE:
+            return self.queryset.order_by(*self._reversed_ordering())[:limit], LAST_PAGE
+
+        decoded = decode_cursor(cursor, len(self.ordering)) if cursor else None
+        if decoded is not None:
+            try:
+                values = self._to_python(decoded[0])
+            except Exception:
+                decoded = None
+
+        queryset = self.queryset.order_by(*self.ordering)
+        if decoded is None:
+            return queryset[:limit], None
+
+        if decoded[1] == NEXT:
+            return queryset.filter(self._seek(values, forward=True))[:limit], NEXT
+
+        queryset = self.queryset.filter(self._seek(values, forward=False)).order_by(*self._reversed_ordering())
+        return queryset[:limit], PREVIOUS
+
+    def _build_page(self, rows, direction):
+        """Страница из строк запроса _page_query (лишняя строка означает, что есть еще)"""
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction in (LAST_PAGE, PREVIOUS):
+            # Строки выбраны в обратном порядке
+            return self._page(rows[::-1], has_next=direction == PREVIOUS, has_previous=more)
+        return self._page(rows, has_next=more, has_previous=direction == NEXT)
+
+    def _page(self, rows, has_next, has_previous):
+        next_cursor = encode_cursor(self._key(rows[-1]), NEXT) if rows and has_next else None
+        previous_cursor = encode_cursor(self._key(rows[0]), PREVIOUS) if rows and has_previous else None
+        return KeysetPage(rows, self, has_next, has_previous, next_cursor, previous_cursor)
+
+    @property
+    def estimated_count(self):
+        """
+        Приблизительное общее количество без полного COUNT(*)
+
+        Returns:
+            EstimatedCount: считается не больше estimate_limit строк
+        """
+        if self._estimated_count is None:
+            count = self.queryset.order_by()[:self.estimate_limit + 1].count()
+            self._estimated_count = EstimatedCount(min(count, self.estimate_limit), count <= self.estimate_limit)
+        return self._estimated_count
+
+
+class RankedPaginator(KeysetPaginator):
+    """
+    Курсорная пагинация заранее ранжированного списка id (например, результатов поиска)
+
+    Курсор хранит id граничного объекта, страница вырезается из списка
+    по его позиции; из БД загружается только текущая страница.
+    """
+
+    def __init__(self, ranked_ids, queryset, per_page):
+        super().__init__(queryset, per_page, ordering=('pk',), estimate_limit=len(ranked_ids))
+        self.ranked_ids = list(ranked_ids)
+        self._positions = {pk: index for index, pk in enumerate(self.ranked_ids)}
+
+    def get_page(self, cursor=None):
+        ids, has_next, has_previous = self._page_ids(cursor)
+        objects = self.queryset.in_bulk(ids)
+        return self._page([objects[pk] for pk in ids if pk in objects], has_next, has_previous)
+
+    async def aget_page(self, cursor=None):
+        ids, has_next, has_previous = self._page_ids(cursor)
+        objects = await self.queryset.ain_bulk(ids)
+        return self._page([objects[pk] for pk in ids if pk in objects], has_next, has_previous)
+
+    def _page_ids(self, cursor):
+        """id текущей страницы и признаки соседних страниц"""
+        decoded = decode_cursor(cursor, 1) if cursor and cursor != LAST_PAGE else None
+        anchor = None
+        if decoded is not None and type(decoded[0][0]) is int:
+            anchor = self._positions.get(decoded[0][0])
+        total = len(self.ranked_ids)
+
+        if cursor == LAST_PAGE:
+            end = total
+            start = max(0, end - self.per_page)
+        elif anchor is None:
+            start, end = 0, min(self.per_page, total)
+        elif decoded[1] == NEXT:
+            start = anchor + 1
+            end = min(start + self.per_page, total)
+        else:
+            end = anchor
+            start = max(0, end - self.per_page)
+
+        return self.ranked_ids[start:end], end < total, start > 0
+
+    @property
+    def estimated_count(self):
+        return EstimatedCount(len(self.ranked_ids), True)
@@ -0,0 +1,167 @@
+"""
+Кэш отрендеренного HTML постов
+
+HTML хранится в таблице PostRender и привязан к хэшу содержимого поста
+(с учетом версии рендерера), поэтому устаревшая запись никогда не отдается:
+при несовпадении хэша пост перерисовывается и запись обновляется.
+Текстовые анонсы хранятся в самом посте (Post.excerpt).
+"""
+import logging
+
+from django.db import DatabaseError
+from django.utils.safestring import mark_safe
+
+from .models import Post, PostRender
+from .utils import sanitize_markdown, content_hash, make_excerpt
+
+logger = logging.getLogger(__name__)
+
+
+def store_post_html(post, digest=None):
+    """
+    Рендерит Markdown поста и сохраняет результат
+
+    Args:
+        post: Пост
+        digest: Заранее посчитанный хэш содержимого (необязательно)
+
+    Returns:
+        Объект PostRender
+    """
+    if digest is None:
+        digest = content_hash(post.content)
+
+    render, created = PostRender.objects.update_or_create(
+        post=post,
+        defaults={
+            'content_hash': digest,
+            'html': str(sanitize_markdown(post.content)),
+        }
+    )
+    # Обновляем кэш связи, чтобы повторное обращение не делало запрос
+    post.render = render
+    return render
+
+
+def get_post_html(post):
+    """
+    Возвращает HTML поста из хранилища, перерисовывая его при необходимости
+
+    Для работы без лишних запросов пост стоит выбирать с select_related('render').
+    Ошибка сохранения (например, занятая БД) не ломает страницу: HTML
+    отдается без сохранения и перерисуется при следующем просмотре.
+    """
+    digest = content_hash(post.content)
+
+    try:
+        render = post.render
+    except PostRender.DoesNotExist:
+        render = None
+
+    if render is None or render.content_hash != digest:
+        try:
+            render = store_post_html(post, digest)
+        except DatabaseError:
+            logger.warning('Не удалось сохранить HTML поста %s', post.pk, exc_info=True)
+            return sanitize_markdown(post.content)
+
+    return mark_safe(render.html)
+
+
+def refresh_post_html(post):
+    """Обновляет сохраненный HTML поста, если содержимое изменилось"""
+    digest = content_hash(post.content)
+    stored = PostRender.objects.filter(post=post).values_list('content_hash', flat=True).first()
+    if stored != digest:
+        store_post_html(post, digest)
+
+
+def rebuild_post_html(queryset=None, batch_size=500, force=False):
+    """
+    Массово перерисовывает HTML постов
+
+    Args:
+        queryset: Посты для обработки (по умолчанию все)
+        batch_size: Размер пачки
+        force: Перерисовать даже актуальные записи
+
+    Returns:
+        Количество перерисованных постов
+    """
+    if queryset is None:
+        queryset = Post.objects.all()
+
+    queryset = queryset.select_related('render').order_by('pk')
+    rebuilt = 0
+    batch = []
+
+    def flush():
+        PostRender.objects.bulk_create(
+            batch,
+            update_conflicts=True,
+            unique_fields=['post'],
+            update_fields=['content_hash', 'html', 'rendered_at'],
+        )
+
+    for post in queryset.iterator(chunk_size=batch_size):
+        digest = content_hash(post.content)
+        try:
+            current = post.render.content_hash
+        except PostRender.DoesNotExist:
+            current = None
+
+        if current == digest and not force:
+            continue
+
+        batch.append(PostRender(
+            post=post,
+            content_hash=digest,
+            html=str(sanitize_markdown(post.content)),
+        ))
+        rebuilt += 1
+
+        if len(batch) >= batch_size:
+            flush()
+            batch = []
+
+    if batch:
+        flush()
+
+    return rebuilt
+
+
+def backfill_excerpts(queryset=None, batch_size=500, force=False):
+    """
+    Заполняет текстовые анонсы постов
+
+    Args:
+        queryset: Посты для обработки (по умолчанию все)
+        batch_size: Размер пачки
+        force: Пересчитать даже заполненные анонсы
+
+    Returns:
+        Количество обновленных постов
+    """
+    if queryset is None:
+        queryset = Post.objects.all()
+    if not force:
+        queryset = queryset.filter(excerpt='')
+
+    updated = 0
+    batch = []
+    for post in queryset.only('pk', 'content', 'excerpt').order_by('pk').iterator(chunk_size=batch_size):
+        excerpt = make_excerpt(post.content)
+        if excerpt == post.excerpt:
+            continue
+        post.excerpt = excerpt
+        batch.append(post)
+        updated += 1
+
+        if len(batch) >= batch_size:
+            Post.objects.bulk_update(batch, ['excerpt'])
+            batch = []
+
+    if batch:
+        Post.objects.bulk_update(batch, ['excerpt'])
+
+    return updated
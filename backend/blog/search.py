@@ -0,0 +1,164 @@
+"""
+Полнотекстовый поиск по постам
+
+На SQLite используется индекс FTS5 (таблица blog_post_fts, rowid = id поста)
+по заголовку, тексту и названиям тегов с ранжированием BM25.
+На остальных БД (или если FTS5 недоступен) поиск идет через icontains.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Exists, OuterRef, Q
+
+from .models import Post, Tag
+
+
+FTS_TABLE = 'blog_post_fts'
+
+# Максимум результатов, которые ранжируются и отдаются в пагинацию
+MAX_RESULTS = 1000
+
+# Веса колонок для BM25: заголовок, текст, теги
+BM25_WEIGHTS = (10.0, 1.0, 5.0)
+
+_fts_enabled = {}
+
+
+def fts_enabled():
+    """Доступен ли FTS5-индекс в текущей БД"""
+    if connection.vendor != 'sqlite':
+        return False
+
+    alias = connection.alias
+    if alias not in _fts_enabled:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE]
+            )
+            _fts_enabled[alias] = cursor.fetchone() is not None
+    return _fts_enabled[alias]
+
+
+def reset_fts_state():
+    """Сбрасывает закэшированную проверку наличия индекса (после миграций)"""
+    _fts_enabled.clear()
+
+
+def _index_select_sql(where=''):
+    """SELECT, собирающий строки индекса из таблиц постов и тегов"""
+    post_table = Post._meta.db_table
+    tag_table = Tag._meta.db_table
+    through_table = Post.tags.through._meta.db_table
+    return f"""
+        SELECT p.id, p.title, p.content, COALESCE((
+            SELECT group_concat(t.name, ' ')
+            FROM {tag_table} t
+            JOIN {through_table} pt ON pt.tag_id = t.id
+            WHERE pt.post_id = p.id
+        ), '')
+        FROM {post_table} p
+        {where}
+    """
+
+
+def index_posts(post_ids):
+    """Добавляет или обновляет посты в индексе"""
+    post_ids = list(post_ids)
+    if not post_ids or not fts_enabled():
+        return
+
+    placeholders = ', '.join(['%s'] * len(post_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', post_ids)
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, body, tags) '
+            + _index_select_sql(f'WHERE p.id IN ({placeholders})'),
+            post_ids,
+        )
+
+
+def unindex_posts(post_ids):
+    """Удаляет посты из индекса"""
+    post_ids = list(post_ids)
+    if not post_ids or not fts_enabled():
+        return
+
+    placeholders = ', '.join(['%s'] * len(post_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', post_ids)
+
+
+def rebuild_index():
+    """
+    Полностью перестраивает индекс
+
+    Returns:
+        Количество проиндексированных постов или None, если FTS5 недоступен
+    """
+    if not fts_enabled():
+        return None
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(f'INSERT INTO {FTS_TABLE} (rowid, title, body, tags) ' + _index_select_sql())
+        cursor.execute(f"INSERT INTO {FTS_TABLE} ({FTS_TABLE}) VALUES ('optimize')")
+        cursor.execute(f'SELECT count(*) FROM {FTS_TABLE}')
+        return cursor.fetchone()[0]
+
+
+def build_match_query(query):
+    """
+    Преобразует пользовательский запрос в выражение MATCH
+
+    Каждое слово ищется как префикс, слова объединяются через AND.
+    Спецсимволы FTS5 в запросе пользователя не интерпретируются.
+    """
+    terms = re.findall(r'\w+', query.lower())
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_post_ids(query, limit=MAX_RESULTS):
+    """
+    Ищет посты через FTS5
+
+    Returns:
+        Список id постов, отсортированных по релевантности (BM25)
+    """
+    match = build_match_query(query)
+    if not match:
+        return []
+
+    weights = ', '.join(str(weight) for weight in BM25_WEIGHTS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s '
+            f'ORDER BY bm25({FTS_TABLE}, {weights}) LIMIT %s',
+            [match, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def fallback_search(query):
+    """Поиск без полнотекстового индекса (icontains)"""
+    tag_match = Post.tags.through.objects.filter(
+        post_id=OuterRef('pk'),
+        tag__name__icontains=query,
+    )
+    return Post.objects.filter(
+        Q(title__icontains=query) |
+        Q(content__icontains=query) |
+        Exists(tag_match)
+    )
+
+
+def search_posts(query):
+    """
+    Поиск постов
+
+    Returns:
+        Кортеж (ranked_ids, queryset): при наличии FTS5 ranked_ids - список id
+        по релевантности, иначе None и queryset с результатами icontains
+    """
+    if fts_enabled():
+        return search_post_ids(query), None
+    return None, fallback_search(query)
@@ -0,0 +1,141 @@
+"""
+Атомарные переключатели лайков и подписок
+
+Переключение - одна транзакция без предварительного SELECT: DELETE по
+уникальной паре, а если удалять было нечего - INSERT ... ON CONFLICT DO NOTHING.
+Счетчик меняется через UPDATE ... RETURNING, поэтому новое значение известно
+без пересчета. Сигналы моделей при этом не отправляются: счетчики,
+статистика авторов, ленты подписок, версии списков, кэш страниц
+и уведомления обновляются здесь явно.
+"""
+from django.contrib.auth.models import User
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from users.models import AuthorStats, OutboxMessage
+from users.outbox import enqueue_notification
+from users.stats import adjust_author_stats, post_author, repair_author_stats
+
+from . import page_cache, timeline
+from .conditional import bump_listing_version
+from .models import Like, Post, Subscribe
+
+
+def _quote(name):
+    return connection.ops.quote_name(name)
+
+
+def _toggle_row(cursor, model, values):
+    """
+    Удаляет связь, а если ее не было - создает
+
+    Args:
+        cursor: Курсор внутри транзакции
+        model: Модель связи с уникальной парой полей и created_at
+        values: Словарь {имя поля: значение} уникальной пары
+
+    Returns:
+        Кортеж (создана ли связь, id созданной записи или None)
+    """
+    opts = model._meta
+    columns = [opts.get_field(name).column for name in values]
+    params = list(values.values())
+
+    where = ' AND '.join(f'{_quote(column)} = %s' for column in columns)
+    cursor.execute(f'DELETE FROM {_quote(opts.db_table)} WHERE {where}', params)
+    if cursor.rowcount:
+        return False, None
+
+    created_at = opts.get_field('created_at')
+    insert_columns = ', '.join(_quote(column) for column in [*columns, created_at.column])
+    placeholders = ', '.join(['%s'] * (len(columns) + 1))
+    cursor.execute(
+        f'INSERT INTO {_quote(opts.db_table)} ({insert_columns}) VALUES ({placeholders}) '
+        f'ON CONFLICT DO NOTHING RETURNING {_quote(opts.pk.column)}',
+        [*params, created_at.get_db_prep_save(timezone.now(), connection)],
+    )
+    row = cursor.fetchone()
+    # Пустой результат: параллельный запрос уже создал ту же связь
+    return True, row[0] if row else None
+
+
+def _shift_returning(cursor, model, pk, field_name, delta):
+    """
+    Изменяет счетчик на delta (не ниже нуля) и возвращает новое значение
+
+    Returns:
+        Новое значение или None, если записи нет
+    """
+    opts = model._meta
+    column = _quote(opts.get_field(field_name).column)
+    cursor.execute(
+        f'UPDATE {_quote(opts.db_table)} '
+        f'SET {column} = CASE WHEN {column} + %s > 0 THEN {column} + %s ELSE 0 END '
+        f'WHERE {_quote(opts.pk.column)} = %s RETURNING {column}',
+        [delta, delta, pk],
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+def toggle_like(post_id, user_id):
+    """
+    Ставит или снимает лайк
+
+    Returns:
+        Кортеж (поставлен ли лайк, новое количество лайков поста)
+
+    Raises:
+        Post.DoesNotExist: Поста нет (транзакция откатывается)
+    """
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            liked, like_id = _toggle_row(cursor, Like, {'post': post_id, 'user': user_id})
+            if liked and like_id is None:
+                count = Post.objects.filter(pk=post_id).values_list('like_count', flat=True).first()
+            else:
+                count = _shift_returning(cursor, Post, post_id, 'like_count', 1 if liked else -1)
+            if count is None:
+                raise Post.DoesNotExist(f'Пост {post_id} не найден')
+
+            if like_id is not None or not liked:
+                adjust_author_stats(post_author(post_id), likes_received=1 if liked else -1)
+                bump_listing_version()
+                page_cache.purge_post_counters(post_id)
+            if like_id is not None:
+                enqueue_notification(OutboxMessage.KIND_LIKE, like_id)
+    except IntegrityError:
+        # БД с немедленной проверкой внешних ключей отклоняет INSERT сразу
+        raise Post.DoesNotExist(f'Пост {post_id} не найден')
+
+    return liked, count
+
+
+def toggle_subscribe(user_id, author_id):
+    """
+    Подписывает на автора или отписывает от него
+
+    Returns:
+        Кортеж (есть ли подписка, новое количество подписчиков автора)
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        subscribed, subscription_id = _toggle_row(cursor, Subscribe, {'user': user_id, 'author': author_id})
+        if subscribed and subscription_id is None:
+            count = AuthorStats.objects.filter(user_id=author_id).values_list('followers_count', flat=True).first()
+        else:
+            delta = 1 if subscribed else -1
+            count = _shift_returning(cursor, AuthorStats, author_id, 'followers_count', delta)
+            adjust_author_stats(user_id, following_count=delta)
+            bump_listing_version()
+        if subscription_id is not None:
+            timeline.follow(user_id, author_id)
+            enqueue_notification(OutboxMessage.KIND_FOLLOWER, subscription_id)
+        elif not subscribed:
+            timeline.unfollow(user_id, author_id)
+
+    if count is None:
+        # Записи статистики нет: восстанавливаем ее по фактическим данным
+        repair_author_stats(User.objects.filter(pk=author_id))
+        count = AuthorStats.objects.get(user_id=author_id).followers_count
+
+    return subscribed, count
@@ -1,42 +1,316 @@
 """
-Сигналы для автоматической отправки email уведомлений
+Сигналы: email уведомления (через очередь), счетчики, ленты подписок, кэш HTML,
+поисковый индекс, версии списков для условных GET и кэш страниц
 """
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed, post_migrate
 from django.dispatch import receiver
-from .models import Comment, Like, Subscribe, Post
-from users.email_utils import (
-    notify_new_comment,
-    notify_new_like,
-    notify_new_follower,
-    notify_new_post_to_followers
-)
+from .models import Comment, Like, Subscribe, Post, Tag
+from .counters import adjust_post_counters, adjust_tag_counts
+from .rendering import refresh_post_html
+from .search import index_posts, unindex_posts, reset_fts_state
+from . import timeline
+from .conditional import bump_listing_version
+from . import page_cache
+from users.models import OutboxMessage, Profile
+from users.outbox import enqueue_notification
+from users.stats import adjust_author_stats, post_author
 
 
 @receiver(post_save, sender=Comment)
 def comment_created(sender, instance, created, **kwargs):
-    """Отправка уведомления при создании комментария"""
+    """Постановка в очередь уведомления о комментарии"""
     if created:
-        notify_new_comment(instance)
+        enqueue_notification(OutboxMessage.KIND_COMMENT, instance.pk)
 
 
 @receiver(post_save, sender=Like)
 def like_created(sender, instance, created, **kwargs):
-    """Отправка уведомления при лайке"""
+    """Постановка в очередь уведомления о лайке"""
     if created:
-        notify_new_like(instance)
+        enqueue_notification(OutboxMessage.KIND_LIKE, instance.pk)
 
 
 @receiver(post_save, sender=Subscribe)
 def subscription_created(sender, instance, created, **kwargs):
-    """Отправка уведомления при новой подписке"""
+    """Постановка в очередь уведомления о новой подписке"""
     if created:
-        notify_new_follower(instance)
+        enqueue_notification(OutboxMessage.KIND_FOLLOWER, instance.pk)
 
 
 @receiver(post_save, sender=Post)
 def post_created(sender, instance, created, **kwargs):
-    """Отправка уведомления подписчикам при создании поста"""
+    """Постановка в очередь уведомления подписчикам о новом посте"""
     if created:
-        # Отправляем уведомления подписчикам
-        notify_new_post_to_followers(instance)
+        # Рассылка подписчикам выполняется воркером очереди
+        enqueue_notification(OutboxMessage.KIND_NEW_POST, instance.pk)
 
+
+@receiver(post_save, sender=Post)
+def post_fanned_out(sender, instance, created, **kwargs):
+    """Раскладка нового поста по лентам подписчиков (воркером очереди после коммита)"""
+    if created:
+        timeline.schedule_fan_out(instance.pk)
+
+
+@receiver(post_save, sender=Subscribe)
+def subscription_timeline_filled(sender, instance, created, **kwargs):
+    """Дополнение ленты последними постами автора при подписке"""
+    if created:
+        timeline.follow(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscribe)
+def subscription_timeline_cleared(sender, instance, **kwargs):
+    """Удаление постов автора из ленты при отписке"""
+    timeline.unfollow(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def post_content_rendered(sender, instance, update_fields=None, **kwargs):
+    """Обновление сохраненного HTML при изменении содержимого поста"""
+    if update_fields is not None and 'content' not in update_fields:
+        return
+    refresh_post_html(instance)
+
+
+@receiver(post_save, sender=Like)
+def like_counted(sender, instance, created, **kwargs):
+    """Увеличение счетчика лайков поста"""
+    if created:
+        adjust_post_counters(instance.post_id, like_count=1)
+
+
+@receiver(post_delete, sender=Like)
+def like_uncounted(sender, instance, **kwargs):
+    """Уменьшение счетчика лайков поста (в т.ч. при каскадном удалении)"""
+    adjust_post_counters(instance.post_id, like_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_counted(sender, instance, created, **kwargs):
+    """Увеличение счетчика комментариев поста"""
+    if created:
+        adjust_post_counters(instance.post_id, comment_count=1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_uncounted(sender, instance, **kwargs):
+    """Уменьшение счетчика комментариев поста (в т.ч. при каскадном удалении)"""
+    adjust_post_counters(instance.post_id, comment_count=-1)
+
+
+@receiver(post_save, sender=Post)
+def post_author_counted(sender, instance, created, **kwargs):
+    """Увеличение количества постов автора"""
+    if created:
+        adjust_author_stats(instance.author_id, posts_count=1)
+
+
+@receiver(post_delete, sender=Post)
+def post_author_uncounted(sender, instance, **kwargs):
+    """Уменьшение количества постов и просмотров автора (лайки вычитаются каскадом)"""
+    adjust_author_stats(instance.author_id, posts_count=-1, total_views=-instance.views)
+
+
+@receiver(post_save, sender=Like)
+def like_author_counted(sender, instance, created, **kwargs):
+    """Увеличение количества лайков, полученных автором поста"""
+    if created:
+        adjust_author_stats(post_author(instance.post_id), likes_received=1)
+
+
+@receiver(post_delete, sender=Like)
+def like_author_uncounted(sender, instance, **kwargs):
+    """Уменьшение количества лайков, полученных автором поста"""
+    adjust_author_stats(post_author(instance.post_id), likes_received=-1)
+
+
+@receiver(post_save, sender=Subscribe)
+def subscription_counted(sender, instance, created, **kwargs):
+    """Увеличение счетчиков подписчиков автора и подписок пользователя"""
+    if created:
+        adjust_author_stats(instance.author_id, followers_count=1)
+        adjust_author_stats(instance.user_id, following_count=1)
+
+
+@receiver(post_delete, sender=Subscribe)
+def subscription_uncounted(sender, instance, **kwargs):
+    """Уменьшение счетчиков подписчиков автора и подписок пользователя"""
+    adjust_author_stats(instance.author_id, followers_count=-1)
+    adjust_author_stats(instance.user_id, following_count=-1)
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def post_tags_counted(sender, instance, action, reverse, pk_set, **kwargs):
+    """Обновление количества постов у тегов при изменении связей"""
+    through = Post.tags.through
+
+    if action in ('pre_remove', 'pre_clear'):
+        # Запоминаем только действительно существующие связи
+        links = through.objects.filter(tag=instance) if reverse else through.objects.filter(post=instance)
+        if action == 'pre_remove':
+            links = links.filter(**{'post__in' if reverse else 'tag__in': pk_set})
+        instance._removed_tag_ids = list(links.values_list('tag_id', flat=True))
+        return
+
+    if action == 'post_add':
+        # pk_set содержит только реально добавленные связи
+        tag_ids = [instance.pk] * len(pk_set) if reverse else pk_set
+        adjust_tag_counts(tag_ids, 1)
+    elif action in ('post_remove', 'post_clear'):
+        adjust_tag_counts(getattr(instance, '_removed_tag_ids', []), -1)
+        instance._removed_tag_ids = []
+
+
+@receiver(pre_delete, sender=Post)
+def post_tags_uncounting(sender, instance, **kwargs):
+    """Запоминаем теги удаляемого поста (связи удаляются каскадно без m2m_changed)"""
+    instance._counted_tag_ids = list(instance.tags.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Post)
+def post_tags_uncounted(sender, instance, **kwargs):
+    """Уменьшение количества постов у тегов удаленного поста"""
+    adjust_tag_counts(getattr(instance, '_counted_tag_ids', []), -1)
+
+
+@receiver(post_save, sender=Post)
+def post_indexed(sender, instance, update_fields=None, **kwargs):
+    """Обновление поискового индекса при изменении поста"""
+    if update_fields is not None and not {'title', 'content'} & set(update_fields):
+        return
+    index_posts([instance.pk])
+
+
+@receiver(post_delete, sender=Post)
+def post_unindexed(sender, instance, **kwargs):
+    """Удаление поста из поискового индекса"""
+    unindex_posts([instance.pk])
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def post_tags_indexed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Обновление индекса при изменении тегов поста"""
+    if action == 'pre_clear' and reverse:
+        # После очистки список постов тега уже не получить
+        instance._cleared_post_ids = list(instance.posts.values_list('pk', flat=True))
+        return
+
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if not reverse:
+        index_posts([instance.pk])
+    elif action == 'post_clear':
+        index_posts(getattr(instance, '_cleared_post_ids', []))
+    else:
+        index_posts(pk_set)
+
+
+@receiver(post_save, sender=Tag)
+def tag_renamed(sender, instance, created, **kwargs):
+    """Переиндексация постов при переименовании тега"""
+    if not created:
+        index_posts(instance.posts.values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleting(sender, instance, **kwargs):
+    """Запоминаем посты удаляемого тега"""
+    instance._indexed_post_ids = list(instance.posts.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    """Переиндексация постов удаленного тега"""
+    index_posts(getattr(instance, '_indexed_post_ids', []))
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+@receiver(post_save, sender=Subscribe)
+@receiver(post_delete, sender=Subscribe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Profile)
+def listing_changed(sender, **kwargs):
+    """Карточки в списках постов изменились: новый ETag списков"""
+    bump_listing_version()
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def listing_tags_changed(sender, action, **kwargs):
+    """Теги постов изменились: новый ETag списков"""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_listing_version()
+
+
+@receiver(post_save, sender=Post)
+def post_pages_purged(sender, instance, **kwargs):
+    """Сброс кэша страниц поста: сама страница, страницы его тегов и списки"""
+    page_cache.purge_post(instance.pk)
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Like)
+@receiver(post_delete, sender=Like)
+def post_counter_pages_purged(sender, instance, **kwargs):
+    """Сброс кэша страницы поста и списков при изменении лайков и комментариев"""
+    page_cache.purge_post_counters(instance.post_id)
+
+
+@receiver(pre_delete, sender=Post)
+def post_pages_purging(sender, instance, **kwargs):
+    """Запоминаем теги удаляемого поста для сброса их страниц"""
+    instance._page_cache_tag_slugs = list(instance.tags.values_list('slug', flat=True))
+
+
+@receiver(post_delete, sender=Post)
+def post_pages_purged_on_delete(sender, instance, **kwargs):
+    """Сброс кэша страниц удаленного поста"""
+    page_cache.purge_post(instance.pk, getattr(instance, '_page_cache_tag_slugs', []))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def post_tag_pages_purged(sender, instance, action, reverse, pk_set, **kwargs):
+    """Сброс кэша страниц при изменении тегов поста (затронутые теги и посты)"""
+    if action == 'pre_clear':
+        if reverse:
+            instance._page_cache_post_ids = list(instance.posts.values_list('pk', flat=True))
+        else:
+            instance._page_cache_tag_slugs = list(instance.tags.values_list('slug', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        post_ids = pk_set if action != 'post_clear' else getattr(instance, '_page_cache_post_ids', [])
+        page_cache.purge(
+            page_cache.tag_group(instance.slug), page_cache.LISTINGS,
+            *(page_cache.post_group(post_id) for post_id in post_ids),
+        )
+    else:
+        if action == 'post_clear':
+            slugs = getattr(instance, '_page_cache_tag_slugs', [])
+        else:
+            slugs = Tag.objects.filter(pk__in=pk_set).values_list('slug', flat=True)
+        page_cache.purge_post(instance.pk, slugs)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=Profile)
+def all_pages_purged(sender, **kwargs):
+    """Теги и аватары выводятся на многих страницах: сбрасывается весь кэш страниц"""
+    page_cache.purge(page_cache.ALL_PAGES)
+
+
+@receiver(post_migrate)
+def search_schema_changed(sender, **kwargs):
+    """Сброс проверки наличия FTS-индекса после миграций"""
+    reset_fts_state()
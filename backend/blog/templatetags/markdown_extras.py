@@ -2,6 +2,8 @@
 Template tags для обработки Markdown
 """
 from django import template
+from blog.models import Post
+from blog.rendering import get_post_html
 from blog.utils import sanitize_markdown
 
 register = template.Library()
@@ -11,7 +13,10 @@ register = template.Library()
 def markdown_filter(value):
     """
     Фильтр для конвертации Markdown в HTML
-    Использование: {{ post.content|markdown }}
+    Использование: {{ post|markdown }} (HTML берется из сохраненного кэша)
+    или {{ text|markdown }} для произвольного текста
     """
+    if isinstance(value, Post):
+        return get_post_html(value)
     return sanitize_markdown(value)
 
@@ -1,3 +1,1672 @@
-from django.test import TestCase
+import gzip
+import json
+import re
+import pstats
+import shutil
+import tempfile
+import threading
+import time
+from io import StringIO
+from pathlib import Path
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib import messages
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.db.models import Count, F
+from django.http import Http404
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from backend import staticfiles
+from backend.instrumentation import RequestMetrics, query_budget
+from backend.profiling import ProfilingMiddleware, StackSampler, profile_store
+from backend.testing import QueryBudgetMixin, override_async_views
+from . import page_cache, services
+from .checks import check_page_cache_backend
+from .forms import PostForm
+from .models import Post, PostRender, Like, Comment, Subscribe, Tag, TimelineEntry
+from .pagination import LAST_PAGE, NEXT, KeysetPaginator, RankedPaginator, encode_cursor
+from .rendering import get_post_html
+from .search import search_post_ids, fallback_search
+from .timeline import FeedPaginator, fan_out_post, trim_timelines
+from .utils import content_hash, make_excerpt
+from .view_counter import ViewCounter, view_counter
+from users import outbox
+from users.models import AuthorStats, OutboxMessage
+
+
+def setUpModule():
+    # Общий счетчик не пишет из фоновых потоков в тестовую БД, открытую в транзакции TestCase
+    view_counter.autoflush = False
+
+
+def tearDownModule():
+    # Просмотры, посчитанные в тестах, не должны попасть в рабочую БД при выходе
+    view_counter.clear()
+    view_counter.autoflush = True
+
+
+class PostRenderTests(QueryBudgetMixin, TestCase):
+    """Кэш отрендеренного HTML постов"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+
+    def test_render_stored_on_save(self):
+        post = Post.objects.create(title='Пост', content='**жирный**', author=self.author)
+        render = PostRender.objects.get(post=post)
+        self.assertEqual(render.content_hash, content_hash(post.content))
+        self.assertIn('<strong>жирный</strong>', render.html)
+
+    def test_render_invalidated_on_edit(self):
+        post = Post.objects.create(title='Пост', content='старый', author=self.author)
+        post.content = 'новый'
+        post.save()
+        self.assertIn('новый', PostRender.objects.get(post=post).html)
+
+    def test_views_update_does_not_rerender(self):
+        post = Post.objects.create(title='Пост', content='текст', author=self.author)
+        PostRender.objects.filter(post=post).update(html='<p>сохранено</p>')
+        post.save(update_fields=['views'])
+        self.assertEqual(PostRender.objects.get(post=post).html, '<p>сохранено</p>')
+
+    def test_stale_hash_rerendered_on_read(self):
+        post = Post.objects.create(title='Пост', content='текст', author=self.author)
+        PostRender.objects.filter(post=post).update(content_hash='stale', html='старый')
+        post = Post.objects.select_related('render').get(pk=post.pk)
+        self.assertIn('текст', get_post_html(post))
+        self.assertEqual(PostRender.objects.get(post=post).content_hash, content_hash('текст'))
+
+    def test_store_error_does_not_break_read(self):
+        post = Post.objects.create(title='Пост', content='**текст**', author=self.author)
+        PostRender.objects.filter(post=post).delete()
+        post = Post.objects.select_related('render').get(pk=post.pk)
+        with mock.patch('blog.rendering.PostRender.objects.update_or_create',
+                        side_effect=OperationalError('database is locked')), \
+                self.assertLogs('blog.rendering', 'WARNING'):
+            self.assertIn('<strong>текст</strong>', get_post_html(post))
+        self.assertFalse(PostRender.objects.filter(post=post).exists())
+
+    def test_detail_reads_stored_html(self):
+        post = Post.objects.create(title='Пост', content='текст', author=self.author)
+        PostRender.objects.filter(post=post).update(html='<p>из кэша</p>')
+        response = self.client.get(reverse('blog:post_detail', args=[post.pk]))
+        self.assertContains(response, 'из кэша')
+        self.assertQueryBudget(response)
+
+    def test_rebuild_command(self):
+        post = Post.objects.create(title='Пост', content='текст', author=self.author)
+        PostRender.objects.all().delete()
+        call_command('rebuild_post_html', stdout=StringIO())
+        self.assertEqual(PostRender.objects.get(post=post).content_hash, content_hash('текст'))
+
+
+class ViewCounterTests(TransactionTestCase):
+    """Буферизованный счетчик просмотров"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.posts = [
+            Post.objects.create(title=f'Пост {i}', content='текст', author=self.author)
+            for i in range(3)
+        ]
+
+    def test_flush_on_threshold(self):
+        counter = ViewCounter(threshold=3, interval=3600)
+        counter.incr(self.posts[0].pk)
+        counter.incr(self.posts[0].pk)
+        counter.join()
+        self.assertEqual(Post.objects.get(pk=self.posts[0].pk).views, 0)
+        # Запрос, учитывающий просмотр, в БД не пишет
+        with CaptureQueriesContext(connection) as queries:
+            counter.incr(self.posts[1].pk)
+        self.assertEqual(len(queries), 0)
+        counter.join()
+        self.assertEqual(Post.objects.get(pk=self.posts[0].pk).views, 2)
+        self.assertEqual(Post.objects.get(pk=self.posts[1].pk).views, 1)
+        self.assertEqual(counter.pending(), 0)
+
+    def test_flush_on_timer(self):
+        counter = ViewCounter(threshold=1000, interval=0.01)
+        for expected in (1, 2):
+            # Каждый просмотр после записи запускает новый таймер
+            counter.incr(self.posts[0].pk)
+            for _ in range(200):
+                if not counter.pending():
+                    break
+                time.sleep(0.01)
+            counter.join()
+            self.assertEqual(Post.objects.get(pk=self.posts[0].pk).views, expected)
+
+    def test_single_update_for_different_amounts(self):
+        counter = ViewCounter(autoflush=False)
+        for i, post in enumerate(self.posts):
+            counter.incr(post.pk, amount=i + 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(counter.flush(), 6)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "blog_post"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(list(Post.objects.order_by('pk').values_list('views', flat=True)), [1, 2, 3])
+        self.assertEqual(AuthorStats.objects.get(user=self.author).total_views, 6)
+
+    def test_clear_drops_pending(self):
+        counter = ViewCounter(autoflush=False)
+        counter.incr(self.posts[0].pk, amount=2)
+        self.assertEqual(counter.clear(), 2)
+        self.assertEqual(counter.flush(), 0)
+        self.assertEqual(Post.objects.get(pk=self.posts[0].pk).views, 0)
+
+    def test_background_error_logged_and_retained(self):
+        counter = ViewCounter(threshold=1, interval=3600)
+        with mock.patch('users.stats.add_author_views', side_effect=OperationalError('database is locked')):
+            with self.assertLogs('blog.view_counter', 'ERROR'):
+                counter.incr(self.posts[0].pk)
+                counter.join()
+        self.assertEqual(counter.pending(self.posts[0].pk), 1)
+        self.assertEqual(Post.objects.get(pk=self.posts[0].pk).views, 0)
+        counter.flush()
+        self.assertEqual(Post.objects.get(pk=self.posts[0].pk).views, 1)
+
+    def test_no_lost_counts_under_concurrency(self):
+        counter = ViewCounter(threshold=7, interval=3600)
+        threads_count, per_thread = 8, 250
+        barrier = threading.Barrier(threads_count)
+
+        def worker(index):
+            try:
+                barrier.wait()
+                for i in range(per_thread):
+                    counter.incr(self.posts[(index + i) % len(self.posts)].pk)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        counter.flush()
+
+        total = sum(Post.objects.values_list('views', flat=True))
+        self.assertEqual(total, threads_count * per_thread)
+
+
+class PostCountersTests(TestCase):
+    """Денормализованные счетчики лайков и комментариев"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.reader = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.post = Post.objects.create(title='Пост', content='текст', author=self.author)
+
+    def assertCounters(self, likes, comments):
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comment_count), (likes, comments))
+
+    def test_create_and_delete(self):
+        like = Like.objects.create(post=self.post, user=self.reader)
+        comment = Comment.objects.create(post=self.post, author=self.reader, content='!')
+        self.assertCounters(1, 1)
+        like.delete()
+        comment.delete()
+        self.assertCounters(0, 0)
+
+    def test_cascade_and_bulk_delete(self):
+        Like.objects.create(post=self.post, user=self.reader)
+        Like.objects.create(post=self.post, user=self.author)
+        Comment.objects.create(post=self.post, author=self.reader, content='!')
+        self.reader.delete()
+        self.assertCounters(1, 0)
+        # Массовое удаление, как в админке
+        Like.objects.all().delete()
+        self.assertCounters(0, 0)
+
+    def test_toggle_like_returns_stored_counter(self):
+        self.client.force_login(self.reader)
+        url = reverse('blog:toggle_like', args=[self.post.pk])
+        self.assertEqual(self.client.post(url).json(), {'liked': True, 'total_likes': 1})
+        self.assertEqual(self.client.post(url).json(), {'liked': False, 'total_likes': 0})
+
+    def test_reconcile_command(self):
+        Like.objects.create(post=self.post, user=self.reader)
+        Post.objects.update(like_count=42, comment_count=7)
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertCounters(1, 0)
+
+
+class TagCountTests(TestCase):
+    """Хранимое количество постов у тегов"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.python = Tag.objects.create(name='python', slug='python')
+        self.django = Tag.objects.create(name='django', slug='django')
+        self.post = Post.objects.create(title='Пост', content='текст', author=self.author)
+        self.other = Post.objects.create(title='Другой', content='текст', author=self.author)
+
+    def counts(self):
+        return dict(Tag.objects.values_list('name', 'post_count'))
+
+    def test_add_remove_clear(self):
+        self.post.tags.add(self.python, self.django)
+        self.post.tags.add(self.python)
+        self.other.tags.add(self.python)
+        self.assertEqual(self.counts(), {'python': 2, 'django': 1})
+        # Удаление отсутствующей связи не меняет счетчик
+        self.other.tags.remove(self.django)
+        self.post.tags.remove(self.python)
+        self.assertEqual(self.counts(), {'python': 1, 'django': 1})
+        self.post.tags.clear()
+        self.assertEqual(self.counts(), {'python': 1, 'django': 0})
+
+    def test_reverse_side(self):
+        self.python.posts.add(self.post, self.other)
+        self.assertEqual(self.counts()['python'], 2)
+        self.python.posts.remove(self.other)
+        self.assertEqual(self.counts()['python'], 1)
+        self.python.posts.clear()
+        self.assertEqual(self.counts()['python'], 0)
+
+    def test_post_delete(self):
+        self.post.tags.add(self.python, self.django)
+        self.other.tags.add(self.python)
+        Post.objects.filter(pk=self.post.pk).delete()
+        self.assertEqual(self.counts(), {'python': 1, 'django': 0})
+        self.author.delete()
+        self.assertEqual(self.counts(), {'python': 0, 'django': 0})
+
+    def test_form_new_tags(self):
+        form = PostForm(data={'title': 'Новый', 'content': 'текст', 'tags': [self.python.pk],
+                              'new_tags': 'django, web, web'})
+        self.assertTrue(form.is_valid(), form.errors)
+        form.instance.author = self.author
+        post = form.save()
+        self.assertEqual(set(post.tags.values_list('name', flat=True)), {'python', 'django', 'web'})
+        self.assertEqual(self.counts(), {'python': 1, 'django': 1, 'web': 1})
+
+    def test_index_reads_stored_count(self):
+        self.post.tags.add(self.django)
+        with CaptureQueriesContext(connection) as queries:
+            popular = list(self.client.get(reverse('blog:index')).context['popular_tags'])
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+        self.assertEqual([(tag.name, tag.post_count) for tag in popular], [('django', 1), ('python', 0)])
+
+    def test_drifted_count_not_negative(self):
+        self.post.tags.add(self.python)
+        Tag.objects.update(post_count=0)
+        self.post.delete()
+        self.assertEqual(self.counts()['python'], 0)
+
+    def test_rebuild_command(self):
+        self.post.tags.add(self.python)
+        Tag.objects.update(post_count=10)
+        call_command('rebuild_tag_counts', stdout=StringIO())
+        self.assertEqual(self.counts(), {'python': 1, 'django': 0})
+
+
+class ViewerStateTests(QueryBudgetMixin, TestCase):
+    """Флаги лайка и подписки для страницы постов"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.other = User.objects.create_user('other', 'other@example.com', 'password')
+        self.reader = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.liked = Post.objects.create(title='Лайкнутый', content='текст', author=self.author)
+        self.plain = Post.objects.create(title='Обычный', content='текст', author=self.other)
+        Like.objects.create(post=self.liked, user=self.reader)
+        Subscribe.objects.create(user=self.reader, author=self.author)
+
+    def flags(self, posts):
+        return {post.title: (post.viewer_liked, post.viewer_follows_author) for post in posts}
+
+    def test_queryset_flags(self):
+        posts = Post.objects.with_viewer_state(self.reader)
+        self.assertEqual(self.flags(posts), {'Лайкнутый': (True, True), 'Обычный': (False, False)})
+        anonymous = self.client.get(reverse('blog:posts_list')).context['page_obj']
+        self.assertEqual(self.flags(anonymous), {'Лайкнутый': (False, False), 'Обычный': (False, False)})
+
+    def test_list_queries_do_not_grow_with_page(self):
+        self.client.force_login(self.reader)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse('blog:posts_list'))
+        Post.objects.bulk_create([Post(title=f'Пост {i}', content='текст', author=self.other) for i in range(6)])
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(reverse('blog:posts_list'))
+        self.assertEqual(self.flags(response.context['page_obj'])['Лайкнутый'], (True, True))
+
+        def viewer_queries(queries):
+            return [q for q in queries if '"blog_like"' in q['sql'] or '"blog_subscribe"' in q['sql']]
+
+        self.assertEqual(len(viewer_queries(large)), len(viewer_queries(small)))
+        self.assertEqual(len(viewer_queries(large)), 1)
+
+    def test_detail_and_profile(self):
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('blog:post_detail', args=[self.liked.pk]))
+        self.assertTrue(response.context['user_liked'])
+        self.assertQueryBudget(response)
+        response = self.client.get(reverse('users:profile', args=['author']))
+        self.assertTrue(response.context['is_subscribed'])
+        self.assertQueryBudget(response)
+        self.assertFalse(self.client.get(reverse('users:profile', args=['other'])).context['is_subscribed'])
+
+
+class ExcerptTests(TestCase):
+    """Хранимые текстовые анонсы"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+
+    def test_excerpt_without_markdown(self):
+        post = Post.objects.create(
+            title='Пост',
+            content='# Заголовок\n\n**Жирный** [ссылка](http://example.com) & `код`',
+            author=self.author,
+        )
+        self.assertEqual(post.excerpt, 'Заголовок Жирный ссылка & код')
+
+    def test_excerpt_truncated_and_updated(self):
+        post = Post.objects.create(title='Пост', content='слово ' * 80, author=self.author)
+        self.assertEqual(post.excerpt, ' '.join(['слово'] * 50) + '…')
+        post.content = 'новый текст'
+        post.save(update_fields=['content'])
+        post.refresh_from_db()
+        self.assertEqual(post.excerpt, 'новый текст')
+
+    def test_list_does_not_load_content(self):
+        Post.objects.create(title='Пост', content='**текст**', author=self.author)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('blog:posts_list'))
+        self.assertContains(response, '<p class="post-excerpt">текст</p>', html=True)
+        self.assertFalse([query for query in queries if '"blog_post"."content"' in query['sql']])
+
+    def test_backfill_command(self):
+        post = Post.objects.create(title='Пост', content='*текст*', author=self.author)
+        Post.objects.update(excerpt='')
+        call_command('backfill_excerpts', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.excerpt, 'текст')
+
+
+class SearchTests(TestCase):
+    """Полнотекстовый поиск"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.tag = Tag.objects.create(name='Django', slug='django')
+        self.in_title = Post.objects.create(title='Оптимизация Django', content='текст', author=self.author)
+        self.in_body = Post.objects.create(title='Заметка', content='немного про django orm', author=self.author)
+        self.other = Post.objects.create(title='Другое', content='про javascript', author=self.author)
+
+    def test_ranked_by_bm25(self):
+        self.assertEqual(search_post_ids('django'), [self.in_title.pk, self.in_body.pk])
+
+    def test_index_follows_edits_and_deletes(self):
+        self.other.content = 'теперь и про django'
+        self.other.save()
+        self.assertIn(self.other.pk, search_post_ids('django'))
+        self.in_body.delete()
+        self.assertNotIn(self.in_body.pk, search_post_ids('django'))
+
+    def test_index_follows_tags(self):
+        self.other.tags.add(self.tag)
+        self.assertIn(self.other.pk, search_post_ids('django'))
+        self.tag.name = 'Framework'
+        self.tag.save()
+        self.assertIn(self.other.pk, search_post_ids('framework'))
+        self.tag.delete()
+        self.assertNotIn(self.other.pk, search_post_ids('framework'))
+
+    def test_query_syntax_is_escaped(self):
+        self.assertEqual(search_post_ids('django"*(:'), [self.in_title.pk, self.in_body.pk])
+        self.assertEqual(search_post_ids('***'), [])
+
+    def test_fallback_matches_fts(self):
+        self.other.tags.add(self.tag)
+        self.assertEqual(
+            set(fallback_search('django').values_list('pk', flat=True)),
+            {self.in_title.pk, self.in_body.pk, self.other.pk},
+        )
+
+    def test_search_view(self):
+        response = self.client.get(reverse('blog:search'), {'q': 'django'})
+        self.assertEqual([post.pk for post in response.context['page_obj']], [self.in_title.pk, self.in_body.pk])
+
+
+class KeysetPaginationTests(TestCase):
+    """Курсорная пагинация"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        Post.objects.bulk_create([
+            Post(title=f'Пост {i}', content='текст', author=self.author) for i in range(7)
+        ])
+        # Одинаковая дата у всех постов: порядок определяется id
+        self.expected = list(Post.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+        self.paginator = KeysetPaginator(Post.objects.all(), 3)
+
+    def pks(self, page):
+        return [post.pk for post in page]
+
+    def test_forward_and_back(self):
+        first = self.paginator.get_page()
+        self.assertEqual(self.pks(first), self.expected[:3])
+        self.assertFalse(first.has_previous)
+
+        second = self.paginator.get_page(first.next_cursor)
+        third = self.paginator.get_page(second.next_cursor)
+        self.assertEqual(self.pks(second), self.expected[3:6])
+        self.assertEqual(self.pks(third), self.expected[6:])
+        self.assertFalse(third.has_next)
+
+        back = self.paginator.get_page(third.previous_cursor)
+        self.assertEqual(self.pks(back), self.expected[3:6])
+        self.assertEqual(self.pks(self.paginator.get_page(back.previous_cursor)), self.expected[:3])
+
+    def test_last_page_and_invalid_cursor(self):
+        last = self.paginator.get_page(LAST_PAGE)
+        self.assertEqual(self.pks(last), self.expected[4:])
+        self.assertTrue(last.has_previous)
+        self.assertFalse(last.has_next)
+        self.assertEqual(self.pks(self.paginator.get_page('мусор')), self.expected[:3])
+
+    def test_malformed_cursor_opens_first_page(self):
+        cursors = [
+            encode_cursor([], NEXT),
+            encode_cursor([self.expected[0]], NEXT),
+            encode_cursor([None, None], NEXT),
+            encode_cursor([[1], {}], NEXT),
+            encode_cursor(['2024-01-01T00:00:00', 1, 2], NEXT),
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.pks(self.paginator.get_page(cursor)), self.expected[:3])
+                response = self.client.get(reverse('blog:posts_list'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 200)
+                response = self.client.get(reverse('blog:posts_api'), {'cursor': cursor})
+                self.assertEqual(response.status_code, 200)
+
+    def test_ranked_paginator_malformed_cursor(self):
+        ranked = list(reversed(self.expected))
+        paginator = RankedPaginator(ranked, Post.objects.all(), 3)
+        for values in ([], [[1]], [{}], [None], [str(ranked[3])], [True], [ranked[3], ranked[4]]):
+            with self.subTest(values=values):
+                self.assertEqual(self.pks(paginator.get_page(encode_cursor(values, NEXT))), ranked[:3])
+
+    def test_page_uses_constant_queries(self):
+        cursor = self.paginator.get_page().next_cursor
+        with self.assertNumQueries(1):
+            self.paginator.get_page(cursor)
+
+    def test_estimated_count(self):
+        self.assertEqual(str(self.paginator.estimated_count), '7')
+        self.assertEqual(str(KeysetPaginator(Post.objects.all(), 3, estimate_limit=5).estimated_count), '5+')
+
+    def test_ranked_paginator(self):
+        ranked = list(reversed(self.expected))
+        paginator = RankedPaginator(ranked, Post.objects.all(), 3)
+        first = paginator.get_page()
+        second = paginator.get_page(first.next_cursor)
+        self.assertEqual(self.pks(second), ranked[3:6])
+        self.assertEqual(self.pks(paginator.get_page(second.previous_cursor)), ranked[:3])
+        self.assertEqual(self.pks(paginator.get_page(LAST_PAGE)), ranked[4:])
+
+    def test_list_view_follows_cursor(self):
+        response = self.client.get(reverse('blog:posts_list'))
+        page = response.context['page_obj']
+        self.assertEqual(len(page), 7)
+        self.assertFalse(page.has_other_pages)
+
+    def test_posts_api(self):
+        response = self.client.get(reverse('blog:posts_api'), {'limit': 3, 'estimate': 1})
+        data = response.json()
+        self.assertEqual([item['id'] for item in data['results']], self.expected[:3])
+        self.assertEqual(data['estimated_count'], {'count': 7, 'exact': True})
+        self.assertIsNone(data['previous'])
+
+        data = self.client.get(reverse('blog:posts_api'), {'limit': 3, 'cursor': data['next']}).json()
+        self.assertEqual([item['id'] for item in data['results']], self.expected[3:6])
+
+
+class ToggleServiceTests(TestCase):
+    """Атомарные переключатели лайков и подписок"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.reader = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.post = Post.objects.create(title='Пост', content='текст', author=self.author)
+
+    def test_toggle_like(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(services.toggle_like(self.post.pk, self.reader.pk), (True, 1))
+        self.assertEqual(OutboxMessage.objects.filter(kind=OutboxMessage.KIND_LIKE).count(), 1)
+        self.assertEqual(AuthorStats.objects.get(user=self.author).likes_received, 1)
+
+        self.assertEqual(services.toggle_like(self.post.pk, self.reader.pk), (False, 0))
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(AuthorStats.objects.get(user=self.author).likes_received, 0)
+
+    def test_toggle_like_without_recount(self):
+        with CaptureQueriesContext(connection) as queries:
+            services.toggle_like(self.post.pk, self.reader.pk)
+        statements = [query['sql'] for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE'))]
+        self.assertFalse([sql for sql in statements if sql.startswith('SELECT')])
+        self.assertEqual(len(statements), 4)
+
+    def test_missing_post(self):
+        with self.assertRaises(Post.DoesNotExist):
+            services.toggle_like(self.post.pk + 100, self.reader.pk)
+        self.assertFalse(Like.objects.exists())
+        self.client.force_login(self.reader)
+        response = self.client.post(reverse('blog:toggle_like', args=[self.post.pk + 100]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_toggle_subscribe_view(self):
+        self.client.force_login(self.reader)
+        url = reverse('blog:toggle_subscribe', args=['author'])
+        self.assertEqual(self.client.post(url).json(), {'subscribed': True, 'followers_count': 1})
+        self.assertEqual(AuthorStats.objects.get(user=self.reader).following_count, 1)
+        self.assertEqual(self.client.post(url).json(), {'subscribed': False, 'followers_count': 0})
+        self.assertFalse(Subscribe.objects.exists())
+
+
+class ToggleStressTests(TransactionTestCase):
+    """Переключатели под параллельной нагрузкой"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.readers = [User.objects.create_user(f'reader{i}', f'reader{i}@example.com', 'password') for i in range(3)]
+        self.post = Post.objects.create(title='Пост', content='текст', author=self.author)
+
+    def run_threads(self, target, threads_count=8):
+        barrier = threading.Barrier(threads_count)
+        errors = []
+
+        def worker(index):
+            try:
+                barrier.wait()
+                target(index)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(threads_count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    @staticmethod
+    def retry_locked(func, *args):
+        """
+        Повтор при блокировке таблицы
+
+        Тестовая БД SQLite в памяти (shared cache) не ждет снятия блокировки,
+        а сразу возвращает ошибку; транзакция переключателя откатывается целиком.
+        """
+        while True:
+            try:
+                return func(*args)
+            except OperationalError as e:
+                if 'locked' not in str(e):
+                    raise
+                time.sleep(0.001)
+
+    @mock.patch('blog.services.enqueue_notification')
+    def test_concurrent_toggles_keep_counts(self, enqueue):
+        def toggle(index):
+            # Каждого читателя переключают несколько потоков: 75, 75 и 50 раз
+            reader = self.readers[index % len(self.readers)]
+            for _ in range(25):
+                self.retry_locked(services.toggle_like, self.post.pk, reader.pk)
+                self.retry_locked(services.toggle_subscribe, reader.pk, self.author.pk)
+
+        self.run_threads(toggle)
+
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 2)
+        self.assertEqual(self.post.like_count, Like.objects.filter(post=self.post).count())
+        stats = AuthorStats.objects.get(user=self.author)
+        self.assertEqual(stats.likes_received, self.post.like_count)
+        self.assertEqual(stats.followers_count, Subscribe.objects.filter(author=self.author).count())
+
+
+class TimelineTests(QueryBudgetMixin, TestCase):
+    """Лента подписок"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.star = User.objects.create_user('star', 'star@example.com', 'password')
+        self.reader = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.stranger = User.objects.create_user('stranger', 'stranger@example.com', 'password')
+        Subscribe.objects.create(user=self.reader, author=self.author)
+
+    def create_post(self, author, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(title=title, content='текст', author=author)
+        # Раскладку по лентам выполняет воркер очереди
+        outbox.deliver_batch()
+        return post
+
+    def feed(self, user, cursor=None, per_page=20):
+        return FeedPaginator(user, Post.objects.all(), per_page).get_page(cursor)
+
+    def titles(self, page):
+        return [post.title for post in page]
+
+    def test_new_post_fanned_out_to_followers(self):
+        self.create_post(self.author, 'Новый')
+        self.assertEqual(self.titles(self.feed(self.reader)), ['Новый'])
+        self.assertFalse(TimelineEntry.objects.filter(user=self.stranger).exists())
+
+    def test_fan_out_queued_for_worker(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            post = Post.objects.create(title='Новый', content='текст', author=self.author)
+        self.assertFalse(TimelineEntry.objects.exists())
+        message = OutboxMessage.objects.get(kind=OutboxMessage.KIND_TIMELINE)
+        self.assertEqual(message.object_id, post.pk)
+
+        outbox.deliver_batch()
+        message.refresh_from_db()
+        self.assertEqual(message.status, OutboxMessage.STATUS_SENT)
+        self.assertEqual(message.cursor, Subscribe.objects.get(author=self.author).pk)
+        self.assertTrue(TimelineEntry.objects.filter(user=self.reader, post=post).exists())
+
+    @override_settings(TIMELINE_TRIM_EVERY=3, TIMELINE_MAX_LENGTH=2)
+    def test_trim_every_nth_post_of_author(self):
+        # Посты других авторов не сдвигают периодичность обрезки
+        for i in range(4):
+            self.create_post(self.stranger, f'Чужой {i}')
+        self.create_post(self.author, 'Пост 0')
+        self.create_post(self.author, 'Пост 1')
+        self.assertEqual(len(self.feed(self.reader)), 2)
+        Subscribe.objects.create(user=self.reader, author=self.star)
+        self.create_post(self.star, 'Звезда')
+        self.assertEqual(TimelineEntry.objects.filter(user=self.reader).count(), 3)
+        self.create_post(self.author, 'Пост 2')
+        self.assertEqual(self.titles(self.feed(self.reader)), ['Пост 2', 'Звезда'])
+
+    def test_follow_backfills_and_unfollow_clears(self):
+        self.create_post(self.star, 'Старый')
+        self.create_post(self.star, 'Свежий')
+        services.toggle_subscribe(self.reader.pk, self.star.pk)
+        self.assertEqual(self.titles(self.feed(self.reader)), ['Свежий', 'Старый'])
+        services.toggle_subscribe(self.reader.pk, self.star.pk)
+        self.assertEqual(self.titles(self.feed(self.reader)), [])
+
+        Subscribe.objects.create(user=self.stranger, author=self.star)
+        self.assertEqual(len(self.feed(self.stranger)), 2)
+        Subscribe.objects.filter(user=self.stranger).delete()
+        self.assertEqual(len(self.feed(self.stranger)), 0)
+
+    def test_malformed_cursor_opens_first_page(self):
+        post = self.create_post(self.author, 'Первый')
+        for values in ([None, post.pk], [None, None], [[1], post.pk], []):
+            with self.subTest(values=values):
+                self.assertEqual(self.titles(self.feed(self.reader, encode_cursor(values, NEXT))), ['Первый'])
+
+    def test_pages_follow_cursor(self):
+        for i in range(5):
+            self.create_post(self.author, f'Пост {i}')
+        first = self.feed(self.reader, per_page=2)
+        second = self.feed(self.reader, first.next_cursor, per_page=2)
+        third = self.feed(self.reader, second.next_cursor, per_page=2)
+        self.assertEqual(self.titles(first) + self.titles(second) + self.titles(third),
+                         [f'Пост {i}' for i in reversed(range(5))])
+        self.assertFalse(third.has_next)
+
+    @override_settings(TIMELINE_BIG_AUTHOR_FOLLOWERS=2)
+    def test_big_author_merged_on_read(self):
+        own = self.create_post(self.author, 'Обычный')
+        Subscribe.objects.create(user=self.reader, author=self.star)
+        Subscribe.objects.create(user=self.stranger, author=self.star)
+        starred = self.create_post(self.star, 'Звезда')
+        self.assertEqual(fan_out_post(starred.pk), 0)
+        self.assertFalse(TimelineEntry.objects.filter(post=starred).exists())
+        self.assertEqual(self.titles(self.feed(self.reader)), ['Звезда', 'Обычный'])
+        # Пост уже в ленте и подмешивается при чтении: дубликата нет
+        TimelineEntry.objects.create(user=self.reader, post=starred, author=self.star, created_at=starred.created_at)
+        self.assertEqual(self.titles(self.feed(self.reader)), ['Звезда', own.title])
+
+    @override_settings(TIMELINE_BIG_AUTHOR_FOLLOWERS=2)
+    def test_several_big_authors(self):
+        stars = [User.objects.create_user(f'star{i}') for i in range(4)]
+        for star in stars:
+            Subscribe.objects.create(user=self.reader, author=star)
+            Subscribe.objects.create(user=self.stranger, author=star)
+        titles = []
+        for i in range(3):
+            for author in [self.author, *stars]:
+                titles.append(f'{author.username} {i}')
+                self.create_post(author, titles[-1])
+        self.assertFalse(TimelineEntry.objects.filter(author__in=stars).exists())
+
+        # Страницы сливают ленту и посты всех больших авторов без пропусков
+        walked = []
+        page = self.feed(self.reader, per_page=4)
+        walked += self.titles(page)
+        while page.has_next:
+            page = self.feed(self.reader, page.next_cursor, per_page=4)
+            walked += self.titles(page)
+        self.assertEqual(walked, titles[::-1])
+
+        # Один запрос на всех больших авторов, сколько бы их ни было
+        self.client.force_login(self.reader)
+        for name in ('blog:feed', 'blog:feed_api'):
+            with self.subTest(view=name):
+                response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+                self.assertQueryBudget(response)
+
+    def test_trim(self):
+        for i in range(5):
+            self.create_post(self.author, f'Пост {i}')
+        self.assertEqual(trim_timelines(length=3), 2)
+        self.assertEqual(self.titles(self.feed(self.reader)), ['Пост 4', 'Пост 3', 'Пост 2'])
+
+    def test_feed_view_and_api(self):
+        self.create_post(self.author, 'Новый')
+        self.assertEqual(self.client.get(reverse('blog:feed')).status_code, 302)
+        self.client.force_login(self.reader)
+        self.assertContains(self.client.get(reverse('blog:feed')), 'Новый')
+        data = self.client.get(reverse('blog:feed_api')).json()
+        self.assertEqual([item['title'] for item in data['results']], ['Новый'])
+        self.assertTrue(data['results'][0]['follows_author'])
+        self.assertIsNone(data['next'])
+
+    def test_rebuild_command(self):
+        self.create_post(self.author, 'Новый')
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertEqual(self.titles(self.feed(self.reader)), ['Новый'])
+
+
+class ConditionalGetTests(TestCase):
+    """Условные GET (ETag / Last-Modified) для поста и списков"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.reader = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.tag = Tag.objects.create(name='Django', slug='django')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post = Post.objects.create(title='Пост', content='текст', author=self.author)
+            self.post.tags.add(self.tag)
+
+    def revalidate(self, url, response):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_post_detail_not_modified(self):
+        url = reverse('blog:post_detail', args=[self.post.pk])
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        self.assertIn('Cookie', response['Vary'])
+
+        views = view_counter.pending(self.post.pk)
+        with self.assertNumQueries(1):
+            cached = self.revalidate(url, response)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached['ETag'], response['ETag'])
+        self.assertEqual(view_counter.pending(self.post.pk), views + 1)
+
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_post_detail_changes(self):
+        url = reverse('blog:post_detail', args=[self.post.pk])
+        response = self.client.get(url)
+        Comment.objects.create(post=self.post, author=self.reader, content='!')
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+        response = self.client.get(url)
+        Comment.objects.all().delete()
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+        self.assertEqual(self.client.get(reverse('blog:post_detail', args=[self.post.pk + 100])).status_code, 404)
+
+    def test_post_detail_changes_with_commenter_profile(self):
+        url = reverse('blog:post_detail', args=[self.post.pk])
+        Comment.objects.create(post=self.post, author=self.reader, content='!')
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+        # Аватар комментатора выводится на странице поста
+        profile = self.reader.profile
+        profile.location = 'Москва'
+        profile.save()
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+        response = self.client.get(url)
+        self.author.profile.save()
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_listings_not_modified_without_queries(self):
+        for url in (reverse('blog:posts_list'), reverse('blog:tag_posts', args=['django'])):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            with self.assertNumQueries(0):
+                self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+            # Новый лайк меняет карточку: список рендерится заново
+            with self.captureOnCommitCallbacks(execute=True):
+                like = Like.objects.create(post=self.post, user=self.reader)
+            self.assertEqual(self.revalidate(url, response).status_code, 200)
+            like.delete()
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}})
+    def test_listing_without_stored_version_never_not_modified(self):
+        url = reverse('blog:posts_list')
+        response = self.client.get(url)
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_toggle_service_bumps_listing(self):
+        url = reverse('blog:posts_list')
+        response = self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            services.toggle_subscribe(self.reader.pk, self.author.pk)
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_viewer_specific_validators(self):
+        url = reverse('blog:post_detail', args=[self.post.pk])
+        anonymous = self.client.get(url)
+        self.client.force_login(self.reader)
+        response = self.client.get(url)
+        self.assertNotEqual(response['ETag'], anonymous['ETag'])
+        self.assertIn('private', response['Cache-Control'])
+        self.assertNotIn('Last-Modified', response)
+        self.assertEqual(self.revalidate(url, anonymous).status_code, 200)
+
+        # Сессия и пользователь (один запрос с JOIN), затем валидаторы поста
+        with self.assertNumQueries(3):
+            self.assertEqual(self.revalidate(url, response).status_code, 304)
+
+        # Лайк читателя меняет его страницу
+        services.toggle_like(self.post.pk, self.reader.pk)
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+    def test_pending_messages_rendered(self):
+        url = reverse('blog:posts_list')
+        response = self.client.get(url)
+        with mock.patch('blog.conditional.get_messages', return_value=[messages.INFO]):
+            self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+
+class StaticPipelineTests(TestCase):
+    """Сборка статики: хэши, минификация, сжатые копии и их раздача"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.static_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.static_root, ignore_errors=True)
+        cls.enterClassContext(override_settings(
+            STATIC_ROOT=cls.static_root,
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'backend.staticfiles.CompressedManifestStaticFilesStorage'},
+            },
+        ))
+        call_command('collectstatic', interactive=False, verbosity=0)
+        cls.manifest = json.loads((Path(cls.static_root) / 'staticfiles.json').read_text())['paths']
+
+    def serve(self, path, **headers):
+        request = RequestFactory().get(f'/static/{path}', headers=headers)
+        return staticfiles.serve(request, path)
+
+    def test_hashed_and_minified(self):
+        hashed = self.manifest['css/base.css']
+        self.assertRegex(hashed, staticfiles.HASHED_NAME_RE)
+        self.assertEqual(staticfiles_storage.url('css/base.css'), f'/static/{hashed}')
+        source = (Path(__file__).resolve().parent.parent / 'static/css/base.css').read_text()
+        minified = (Path(self.static_root) / hashed).read_text()
+        self.assertLess(len(minified), len(source))
+        self.assertNotIn('/* =====', minified)
+        self.assertIn('.avatar-picture{display:contents}', minified)
+
+        script = (Path(self.static_root) / self.manifest['js/likes.js']).read_text()
+        self.assertNotIn('// ===== Лайки', script)
+        self.assertIn('function initLikes() {', script)
+
+    def test_minify_js_keeps_literals(self):
+        source = (
+            'function f(a) {\n'
+            '    // комментарий\n'
+            '    const t = `строка\n'
+            '    // не комментарий\n'
+            '    ${ a ? `вложенная ${a}` : "{" } конец`;\n'
+            '    const re = /https?:\\/\\/[^/]+/g;  /* блок */\n'
+            '    return t + \'a  //  b\' + re.source + a / 2 / 3;\n'
+            '}\n'
+        )
+        self.assertEqual(staticfiles.minify_js(source), (
+            'function f(a) {\n'
+            'const t = `строка\n'
+            '    // не комментарий\n'
+            '    ${ a ? `вложенная ${a}` : "{" } конец`;\n'
+            'const re = /https?:\\/\\/[^/]+/g;\n'
+            'return t + \'a  //  b\' + re.source + a / 2 / 3;\n'
+            '}\n'
+        ))
+
+    def test_minify_css_keeps_strings(self):
+        source = 'a  ,  b {\n  content: "  x ;  } ";  /* c */\n  color : red ;\n}\n'
+        self.assertEqual(staticfiles.minify_css(source), 'a,b{content:"  x ;  } ";color : red}')
+
+    def test_minify_css_keeps_descendant_pseudo_class(self):
+        source = 'a :hover { color: red; }\n@media (max-width: 600px) {\n  a  :hover { x: y }\n}\n'
+        self.assertEqual(staticfiles.minify_css(source), 'a :hover{color:red}@media (max-width: 600px){a :hover{x:y}}')
+
+    def test_minify_js_regex_after_condition(self):
+        cases = {
+            'if (x) /a  //.test(s); y = 1': 'if (x) /a  //.test(s); y = 1\n',
+            'while (f(a)) /b/g.exec(s)\nz = 1': 'while (f(a)) /b/g.exec(s)\nz = 1\n',
+            'for (;;) /c/.test(s) // конец': 'for (;;) /c/.test(s)\n',
+            # После обычной ")" - деление
+            'x = f(a) / 2 / (b) / 3 // конец': 'x = f(a) / 2 / (b) / 3\n',
+        }
+        for source, expected in cases.items():
+            with self.subTest(source=source):
+                self.assertEqual(staticfiles.minify_js(source), expected)
+
+    def test_precompressed_copies(self):
+        path = Path(self.static_root) / self.manifest['js/likes.js']
+        self.assertEqual(gzip.decompress(path.with_name(path.name + '.gz').read_bytes()), path.read_bytes())
+
+    def test_missing_file_keeps_plain_url(self):
+        self.assertEqual(staticfiles_storage.url('favicon.ico'), '/static/favicon.ico')
+
+    def test_serve_negotiates_encoding(self):
+        hashed = self.manifest['css/base.css']
+        response = self.serve(hashed, accept_encoding='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)),
+                         (Path(self.static_root) / hashed).read_bytes())
+
+        plain = self.serve(hashed, accept_encoding='gzip;q=0')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+
+        unhashed = self.serve('css/base.css', accept_encoding='gzip')
+        self.assertIn('no-cache', unhashed['Cache-Control'])
+
+        not_modified = self.serve(hashed, if_modified_since=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, 304)
+
+    @skipUnless(staticfiles.brotli, 'brotli не установлен')
+    def test_serve_prefers_brotli(self):
+        response = self.serve(self.manifest['css/base.css'], accept_encoding='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+
+    def test_serve_rejects_paths_outside_root(self):
+        with self.assertRaises(Http404):
+            self.serve('../settings.py')
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=60)
+class PageCacheTests(TestCase):
+    """Кэш страниц для анонимных читателей"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.reader = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.django = Tag.objects.create(name='Django', slug='django')
+        self.python = Tag.objects.create(name='Python', slug='python')
+        self.post = Post.objects.create(title='Пост', content='текст', author=self.author)
+        self.post.tags.add(self.django)
+        self.other = Post.objects.create(title='Другой', content='текст', author=self.author)
+        self.other.tags.add(self.python)
+        self.urls = {
+            'index': reverse('blog:index'),
+            'list': reverse('blog:posts_list'),
+            'post': reverse('blog:post_detail', args=[self.post.pk]),
+            'other': reverse('blog:post_detail', args=[self.other.pk]),
+            'django': reverse('blog:tag_posts', args=['django']),
+            'python': reverse('blog:tag_posts', args=['python']),
+        }
+
+    def test_check_requires_shared_cache(self):
+        self.assertEqual([error.id for error in check_page_cache_backend(None)], ['blog.E001'])
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'}}
+        with self.settings(CACHES=redis):
+            self.assertEqual(check_page_cache_backend(None), [])
+        with self.settings(PAGE_CACHE_TIMEOUT=0):
+            self.assertEqual(check_page_cache_backend(None), [])
+
+    def status(self, url):
+        return self.client.get(url).get('X-Page-Cache')
+
+    def warm(self):
+        for url in self.urls.values():
+            self.assertEqual(self.status(url), 'MISS')
+
+    def test_hit_without_queries(self):
+        self.warm()
+        for url in self.urls.values():
+            with self.assertNumQueries(0):
+                response = self.client.get(url)
+            self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertContains(self.client.get(self.urls['post']), 'Пост')
+
+        views = view_counter.pending(self.post.pk)
+        self.client.get(self.urls['post'])
+        self.assertEqual(view_counter.pending(self.post.pk), views + 1)
+
+    def test_query_string_is_part_of_key(self):
+        self.warm()
+        self.assertEqual(self.status(self.urls['list'] + '?cursor=x'), 'MISS')
+
+    def test_authenticated_not_cached(self):
+        self.warm()
+        self.client.force_login(self.reader)
+        self.assertIsNone(self.status(self.urls['list']))
+
+    def test_post_edit_purges_related_pages(self):
+        self.warm()
+        self.post.title = 'Новый заголовок'
+        self.post.save()
+        statuses = {name: self.status(url) for name, url in self.urls.items()}
+        self.assertEqual(statuses, {
+            'index': 'MISS', 'list': 'MISS', 'post': 'MISS', 'django': 'MISS',
+            'other': 'HIT', 'python': 'HIT',
+        })
+        self.assertContains(self.client.get(self.urls['post']), 'Новый заголовок')
+
+    def test_tag_change_purges_both_tags(self):
+        self.warm()
+        self.post.tags.set([self.python])
+        self.assertEqual(self.status(self.urls['django']), 'MISS')
+        self.assertEqual(self.status(self.urls['python']), 'MISS')
+        self.assertEqual(self.status(self.urls['other']), 'HIT')
+
+    def test_likes_and_comments_purge_post_and_listings(self):
+        self.warm()
+        services.toggle_like(self.post.pk, self.reader.pk)
+        self.assertEqual(self.status(self.urls['post']), 'MISS')
+        self.assertEqual(self.status(self.urls['list']), 'MISS')
+        self.assertEqual(self.status(self.urls['other']), 'HIT')
+
+        Comment.objects.create(post=self.other, author=self.reader, content='!')
+        self.assertEqual(self.status(self.urls['other']), 'MISS')
+        self.assertEqual(self.status(self.urls['post']), 'HIT')
+
+    def test_stale_page_served_while_rebuilding(self):
+        self.warm()
+        request = RequestFactory().get(self.urls['list'])
+        lock_key = page_cache._page_key(request, [page_cache.LISTINGS]) + ':lock'
+        cache.add(lock_key, 1)
+        with mock.patch('blog.page_cache.time.time', return_value=time.time() + 61):
+            with self.assertNumQueries(0):
+                self.assertEqual(self.status(self.urls['list']), 'STALE')
+            cache.delete(lock_key)
+            # Блокировка свободна: страницу перестраивает этот запрос
+            self.assertEqual(self.status(self.urls['list']), 'MISS')
+
+    @override_settings(PAGE_CACHE_LOCK_WAIT=0.1)
+    def test_cold_miss_waits_for_other_worker(self):
+        request = RequestFactory().get(self.urls['list'])
+        lock_key = page_cache._page_key(request, [page_cache.LISTINGS]) + ':lock'
+        cache.add(lock_key, 1)
+        # Другой процесс так и не записал страницу: ответ строится без записи в кэш
+        response = self.client.get(self.urls['list'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('X-Page-Cache', response)
+
+    def test_stats_command(self):
+        self.client.get(self.urls['list'])
+        self.client.get(self.urls['list'])
+        self.client.get(self.urls['list'])
+        out = StringIO()
+        call_command('page_cache_stats', '--json', '--reset', stdout=out)
+        stats = json.loads(out.getvalue())
+        self.assertEqual((stats['hit'], stats['miss']), (2, 1))
+        self.assertAlmostEqual(stats['hit_ratio'], 2 / 3)
+        self.assertEqual(page_cache.stats()['hit'], 0)
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=60, PAGE_SHELL_ENABLED=True)
+class PageShellTests(TestCase):
+    """Общая оболочка страниц и данные читателя из /api/viewer/"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.reader = User.objects.create_user('reader', 'reader@example.com', 'password', is_staff=True)
+        self.post = Post.objects.create(title='Пост', content='текст', author=self.author)
+        self.other = Post.objects.create(title='Другой', content='текст', author=self.reader)
+        Like.objects.create(post=self.post, user=self.reader)
+        Subscribe.objects.create(user=self.reader, author=self.author)
+        self.url = reverse('blog:post_detail', args=[self.post.pk])
+
+    def test_authenticated_reader_gets_shared_page(self):
+        self.assertEqual(self.client.get(self.url)['X-Page-Cache'], 'MISS')
+        self.client.force_login(self.reader)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertContains(response, 'class="page-shell"')
+        self.assertContains(response, 'js/viewer.js')
+        # Ни имени пользователя, ни CSRF токена в общей странице нет
+        self.assertNotContains(response, 'reader')
+        self.assertContains(response, 'name="csrfmiddlewaretoken" value=""')
+
+    def test_listing_shared_between_readers(self):
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get(reverse('blog:posts_list'))['X-Page-Cache'], 'MISS')
+        self.client.logout()
+        response = self.client.get(reverse('blog:posts_list'))
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertContains(response, f'data-liked-post="{self.post.pk}"')
+        self.assertContains(response, f'data-following-author="{self.author.pk}"')
+
+    def test_page_with_messages_rendered_for_user(self):
+        self.client.force_login(self.reader)
+        self.client.post(reverse('blog:post_detail', args=[self.post.pk]), {'content': 'Комментарий'})
+        response = self.client.get(self.url)
+        self.assertNotIn('X-Page-Cache', response)
+        self.assertContains(response, 'Комментарий добавлен!')
+        self.assertContains(response, 'reader')
+
+    def test_comment_post_not_affected(self):
+        self.client.force_login(self.reader)
+        response = self.client.post(self.url, {'content': 'Привет'})
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        self.assertTrue(Comment.objects.filter(post=self.post, author=self.reader).exists())
+
+    def test_viewer_api(self):
+        self.client.force_login(self.reader)
+        url = reverse('blog:viewer_api')
+        query = f'?posts={self.post.pk},{self.other.pk},x&authors={self.author.pk},{self.reader.pk}'
+        with self.assertNumQueries(4):  # сессия, пользователь, лайки, подписки
+            response = self.client.get(url + query)
+        data = response.json()
+        self.assertTrue(data['authenticated'])
+        self.assertEqual(data['user']['username'], 'reader')
+        self.assertTrue(data['user']['is_staff'])
+        self.assertEqual(data['liked'], [self.post.pk])
+        self.assertEqual(data['following'], [self.author.pk])
+        self.assertTrue(data['csrf_token'])
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_viewer_api_anonymous(self):
+        response = self.client.get(reverse('blog:viewer_api'))
+        self.assertEqual(response.json(), {'authenticated': False})
+
+
+class AsyncViewTests(TestCase):
+    """Асинхронные представления страниц чтения (ASGI)"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.enterClassContext(override_async_views())
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', 'author@example.com', 'password')
+        cls.reader = User.objects.create_user('reader', 'reader@example.com', 'password')
+        cls.tag = Tag.objects.create(name='Django', slug='django')
+        cls.post = Post.objects.create(title='Асинхронный пост', content='текст про django', author=cls.author)
+        cls.post.tags.add(cls.tag)
+        Like.objects.create(post=cls.post, user=cls.reader)
+        cls.urls = [
+            reverse('blog:index'),
+            reverse('blog:posts_list'),
+            reverse('blog:post_detail', args=[cls.post.pk]),
+            reverse('blog:tag_posts', args=['django']),
+            reverse('blog:search') + '?q=django',
+            reverse('users:profile', args=['author']),
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_routes_use_async_views(self):
+        from . import async_views
+        from users import async_views as users_async_views
+        self.assertIs(resolve(reverse('blog:index')).func, async_views.index)
+        self.assertIs(resolve(reverse('users:profile', args=['author'])).func, users_async_views.profile)
+
+    async def test_pages_render(self):
+        for url in self.urls:
+            response = await self.async_client.get(url)
+            self.assertContains(response, 'Асинхронный пост', msg_prefix=url)
+
+    async def test_viewer_state_for_authenticated_user(self):
+        await self.async_client.aforce_login(self.reader)
+        response = await self.async_client.get(reverse('blog:posts_list'))
+        self.assertContains(response, 'class="stat liked"')
+        self.assertContains(response, 'reader')
+
+    async def test_session_from_model_backend(self):
+        # Сессии, созданные до UserStateBackend: настройки пользователя не загружены заранее
+        await self.async_client.aforce_login(self.reader, backend='django.contrib.auth.backends.ModelBackend')
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = await self.async_client.get(url)
+                self.assertContains(response, 'Асинхронный пост')
+
+    async def test_missing_objects(self):
+        response = await self.async_client.get(reverse('blog:post_detail', args=[self.post.pk + 100]))
+        self.assertEqual(response.status_code, 404)
+        response = await self.async_client.get(reverse('blog:tag_posts', args=['missing']))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_comment_posted_through_sync_view(self):
+        await self.async_client.aforce_login(self.reader)
+        url = reverse('blog:post_detail', args=[self.post.pk])
+        response = await self.async_client.post(url, {'content': 'Комментарий'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(await Comment.objects.filter(post=self.post, author=self.reader).aexists())
+
+    @override_settings(PAGE_CACHE_TIMEOUT=60)
+    async def test_page_cache(self):
+        url = reverse('blog:post_detail', args=[self.post.pk])
+        self.assertEqual((await self.async_client.get(url))['X-Page-Cache'], 'MISS')
+        views = view_counter.pending(self.post.pk)
+        self.assertEqual((await self.async_client.get(url))['X-Page-Cache'], 'HIT')
+        self.assertEqual(view_counter.pending(self.post.pk), views + 1)
+
+    async def test_request_metrics(self):
+        await self.async_client.aforce_login(self.reader)
+        for url in self.urls:
+            with self.subTest(url=url):
+                metrics = (await self.async_client.get(url)).request_metrics
+                # Запросы из sync_to_async (сессия, пользователь, рендеринг) тоже учтены
+                self.assertGreaterEqual(metrics['queries'], 3)
+                self.assertGreater(metrics['template_ms'], 0)
+
+    def test_views_flushed_in_background(self):
+        counter = ViewCounter(threshold=2, interval=3600)
+        flushed = threading.Event()
+        threads = []
+
+        def flush():
+            threads.append(threading.current_thread())
+            flushed.set()
+
+        with mock.patch.object(counter, 'flush', side_effect=flush):
+            counter.incr(self.post.pk)
+            self.assertFalse(threads)
+            counter.incr(self.post.pk)
+            self.assertTrue(flushed.wait(5))
+        self.assertIsNot(threads[0], threading.current_thread())
+
+
+class RequestMetricsTests(QueryBudgetMixin, TestCase):
+    """Метрики запроса и бюджеты SQL запросов представлений"""
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.reader = User.objects.create_user('reader', 'reader@example.com', 'password')
+        commenters = [User.objects.create_user(f'commenter{i}') for i in range(3)]
+        tag = Tag.objects.create(name='django', slug='django')
+        Subscribe.objects.create(user=self.reader, author=self.author)
+        # Постов больше, чем бюджет: запрос на каждую карточку (N+1) не уложится
+        for i in range(12):
+            with self.captureOnCommitCallbacks(execute=True):
+                post = Post.objects.create(title=f'Пост django {i}', content='## Текст\n\nабзац', author=self.author)
+            post.tags.add(tag)
+            for commenter in commenters:
+                Like.objects.create(post=post, user=commenter)
+                Comment.objects.create(post=post, author=commenter, content='Комментарий')
+        self.post = post
+        self.tag = tag
+
+    def read_urls(self):
+        return [
+            reverse('blog:index'),
+            reverse('blog:posts_list'),
+            reverse('blog:post_detail', args=[self.post.pk]),
+            reverse('blog:tag_posts', args=[self.tag.slug]),
+            reverse('blog:search') + '?q=django',
+            reverse('blog:posts_api'),
+            reverse('users:profile', args=[self.author.username]),
+        ]
+
+    def test_anonymous_reads_within_budget(self):
+        for url in self.read_urls():
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertQueryBudget(response)
+
+    def test_authenticated_reads_within_budget(self):
+        self.client.force_login(self.reader)
+        urls = [
+            *self.read_urls(),
+            reverse('blog:feed'),
+            reverse('blog:feed_api'),
+            reverse('blog:viewer_api') + f'?posts={self.post.pk}&authors={self.author.pk}',
+        ]
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertQueryBudget(response)
+
+    def test_like_within_budget(self):
+        self.client.force_login(self.reader)
+        self.assertQueryBudget(self.client.post(reverse('blog:toggle_like', args=[self.post.pk])))
+
+    def test_budget_exceeded(self):
+        response = self.client.get(reverse('blog:index'))
+        with self.assertRaises(AssertionError):
+            self.assertQueryBudget(response, budget=response.request_metrics['queries'] - 1)
+
+        with override_settings(QUERY_BUDGETS={'blog:index': 0}), \
+                self.assertLogs('backend.instrumentation', 'WARNING') as logs:
+            self.client.get(reverse('blog:index'))
+        self.assertIn('blog:index', logs.output[0])
+
+    @override_settings(REQUEST_METRICS_HEADER=True)
+    def test_server_timing_and_log_line(self):
+        with self.assertLogs('backend.instrumentation', 'INFO') as logs:
+            response = self.client.get(reverse('blog:index'))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries, \d+ duplicate", tpl;dur=')
+        self.assertGreater(response.request_metrics['template_ms'], 0)
+
+        line = json.loads(logs.records[0].getMessage())
+        self.assertEqual(line['view'], 'blog:index')
+        self.assertEqual(line['status'], 200)
+        self.assertEqual(line['queries'], response.request_metrics['queries'])
+
+    def test_duplicate_queries(self):
+        metrics = RequestMetrics()
+        metrics.add_query('SELECT * FROM post WHERE id IN (%s, %s)', 0.001)
+        metrics.add_query('SELECT * FROM post WHERE id IN (%s, %s, %s)', 0.001)
+        metrics.add_query('SELECT * FROM tag WHERE id = %s', 0.001)
+        self.assertEqual(metrics.query_count, 3)
+        self.assertEqual(metrics.duplicates(), {'SELECT * FROM post WHERE id IN (%s, ...)': 2})
+        self.assertEqual(metrics.as_dict()['duplicate_queries'], 1)
+
+    @override_settings(REQUEST_METRICS_ENABLED=False)
+    def test_disabled(self):
+        self.assertFalse(hasattr(self.client.get(reverse('blog:index')), 'request_metrics'))
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_TOKEN='secret-token', PROFILING_SAMPLE_RATE=0.0)
+class ProfilingTests(TestCase):
+    """Профилирование запросов"""
+
+    def setUp(self):
+        self.profiles_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.profiles_dir, ignore_errors=True)
+        self.enterContext(override_settings(PROFILING_DIR=self.profiles_dir))
+        profile_store.clear()
+        self.addCleanup(profile_store.clear)
+
+    def test_disabled_middleware_not_used(self):
+        with override_settings(PROFILING_ENABLED=False), self.assertRaises(MiddlewareNotUsed):
+            ProfilingMiddleware(lambda request: None)
+
+    def test_requests_without_token_not_profiled(self):
+        response = self.client.get(reverse('blog:index'), headers={'X-Profile-Token': 'wrong'})
+        self.assertNotIn('X-Profiled', response)
+        self.assertEqual(list(self.profiles_dir.iterdir()), [])
+
+    @override_settings(PROFILING_INTERVAL=0.001)
+    def test_token_request_sampled(self):
+        from django.shortcuts import render
+
+        def slow_render(*args, **kwargs):
+            time.sleep(0.03)
+            return render(*args, **kwargs)
+
+        with mock.patch('blog.views.render', slow_render):
+            response = self.client.get(reverse('blog:index'), headers={'X-Profile-Token': 'secret-token'})
+        self.assertEqual(response['X-Profiled'], 'blog:index')
+        [path] = self.profiles_dir.glob('blog_index.*.collapsed')
+        lines = path.read_text(encoding='utf-8').splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertGreater(int(count), 0)
+            self.assertIn('ProfilingMiddleware.__call__ (backend/profiling.py:', stack)
+        self.assertIn('slow_render', path.read_text(encoding='utf-8'))
+
+    @override_settings(PROFILING_PROFILER='cprofile', PROFILING_SAMPLE_RATE=1.0)
+    def test_cprofile_aggregated_per_view(self):
+        for _ in range(2):
+            self.client.get(reverse('blog:index'))
+        self.client.get(reverse('blog:posts_list'))
+        [index_profile] = self.profiles_dir.glob('blog_index.*.prof')
+        calls = {
+            func[2]: stat[0] for func, stat in pstats.Stats(str(index_profile)).stats.items()
+            if func[0].endswith(str(Path('blog', 'views.py')))
+        }
+        self.assertEqual(calls['index'], 2)
+
+        out = StringIO()
+        call_command('profile_report', dir=str(self.profiles_dir), view='blog:index', stdout=out)
+        self.assertIn('== blog_index', out.getvalue())
+        self.assertNotIn('blog_posts_list', out.getvalue())
+
+    def test_stack_sampler(self):
+        def slow_function():
+            time.sleep(0.05)
+
+        with StackSampler(interval=0.001) as sampler:
+            slow_function()
+        self.assertTrue(any(stack.endswith(')') and 'slow_function' in stack for stack in sampler.samples))
+
+        self.profiles_dir.joinpath('view.1.collapsed').write_text(
+            ''.join(f'{stack} {count}\n' for stack, count in sampler.samples.items()), encoding='utf-8'
+        )
+        out = StringIO()
+        call_command('profile_report', dir=str(self.profiles_dir), stdout=out)
+        self.assertIn('slow_function', out.getvalue())
+
+
+class GenerateDataTests(TestCase):
+    def generate(self, prefix, **options):
+        options = {
+            'users': 30, 'posts': 120, 'tags': 8, 'comments': 200, 'likes': 400,
+            'following': 5, 'batch_size': 50, 'prefix': prefix, **options,
+        }
+        call_command('generate_data', stdout=StringIO(), verbosity=0, **options)
+        return Post.objects.filter(author__username__startswith=prefix)
+
+    def test_counts_and_derived_data(self):
+        posts = self.generate('gen')
+        self.assertEqual(User.objects.filter(username__startswith='gen').count(), 30)
+        self.assertEqual(posts.count(), 120)
+        self.assertEqual(Comment.objects.filter(post__in=posts).count(), 200)
+        self.assertTrue(Like.objects.exists())
+        self.assertTrue(Subscribe.objects.exists())
+        self.assertFalse(Subscribe.objects.filter(user=F('author')).exists())
+
+        # Счетчики и анонсы пересчитаны, даты реакций не раньше поста
+        for post in posts.annotate(total=Count('likes')):
+            self.assertEqual(post.like_count, post.total)
+        for post in posts.annotate(total=Count('comments')):
+            self.assertEqual(post.comment_count, post.total)
+        post = posts.first()
+        self.assertEqual(post.excerpt, make_excerpt(post.content))
+        self.assertFalse(Like.objects.filter(created_at__lt=F('post__created_at')).exists())
+        self.assertTrue(TimelineEntry.objects.exists())
+
+    def test_deterministic(self):
+        first = list(self.generate('one').order_by('pk').values_list('title', 'views'))
+        second = list(self.generate('two').order_by('pk').values_list('title', 'views'))
+        self.assertEqual(first, second)
+
+    def test_skewed_popularity(self):
+        self.generate('gen', skip_rebuild=True)
+        followers = sorted(
+            Subscribe.objects.values('author').annotate(total=Count('pk')).values_list('total', flat=True)
+        )
+        self.assertGreater(followers[-1], 3 * followers[len(followers) // 2])
+
+    def test_existing_prefix_rejected(self):
+        User.objects.create_user('gen0')
+        with self.assertRaises(CommandError):
+            self.generate('gen')
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN SQLite')
+class QueryPlanTests(QueryBudgetMixin, TestCase):
+    """
+    Планы запросов представлений на заполненной базе
+
+    Каждый SELECT/UPDATE/DELETE обработки запроса проверяется через
+    EXPLAIN QUERY PLAN: полный просмотр таблицы (SCAN без индекса) и
+    сортировка во временном B-дереве - ошибка. Допустимы только сортировки
+    заведомо ограниченного набора строк (BOUNDED_SORTS). Чтение проверяется
+    и с настройками по умолчанию, и на ветках для больших объемов (тег
+    популярен, часть авторов - большие).
+    """
+    BOUNDED_SORTS = [
+        # Посты редкого тега (не больше TAG_POSTS_SORT_LIMIT, Post.objects.with_tag)
+        re.compile(r'"blog_post_tags"\."tag_id" = %s.*ORDER BY "blog_post"\."created_at" DESC'),
+        # Теги постов страницы (prefetch_related) и одного поста
+        re.compile(r'"blog_post_tags"\."post_id" (IN \(|= %s).*ORDER BY "blog_tag"\."name"'),
+        # Страница, загружаемая по ключам (лента, поиск)
+        re.compile(r'WHERE "blog_post"\."id" IN \('),
+        # Ранжирование результатов FTS (bm25), ограничено SEARCH_MAX_RESULTS
+        re.compile(r'MATCH %s ORDER BY bm25'),
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'generate_data', users=30, posts=300, tags=6, comments=400, likes=800, following=5,
+            render_html=True, prefix='plan', stdout=StringIO(), verbosity=0,
+        )
+        cls.reader = User.objects.annotate(total=Count('subscribes')).order_by('-total').first()
+        cls.post = Post.objects.order_by('-like_count', 'pk').first()
+        cls.tag = Tag.objects.order_by('-post_count').first()
+        # Два самых популярных автора из подписок читателя - большие (подмешиваются при чтении)
+        followers = sorted(
+            AuthorStats.objects.filter(user__subscribers__user=cls.reader).values_list('followers_count', flat=True)
+        )
+        cls.big_author_followers = followers[-2]
+
+    def explain(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[3] for row in cursor.fetchall()]
+
+    def plan_problems(self, plan):
+        # Подзапросы FROM (CO-ROUTINE, MATERIALIZE) читаются целиком по определению
+        derived = {match.group(1) for match in map(re.compile(r'(?:CO-ROUTINE|MATERIALIZE) (.+)$').match, plan) if match}
+        return [
+            step for step in plan
+            if 'TEMP B-TREE' in step
+            or (step.startswith('SCAN ') and ' USING ' not in step
+                and 'VIRTUAL TABLE' not in step and step[5:] not in derived)
+        ]
+
+    def assertIndexedPlans(self, request):
+        """Выполняет запрос и проверяет планы всех его SQL запросов и их бюджет"""
+        captured = []
+
+        def capture(execute, sql, params, many, context):
+            captured.append((sql, params))
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(capture):
+            response = request()
+        self.assertLess(response.status_code, 400)
+        if query_budget(response.request_metrics['view']) is not None:
+            self.assertQueryBudget(response)
+
+        failures = []
+        for sql, params in captured:
+            if not sql.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            problems = self.plan_problems(self.explain(sql, params))
+            if any(pattern.search(sql) for pattern in self.BOUNDED_SORTS):
+                problems = [step for step in problems if 'TEMP B-TREE' not in step]
+            if problems:
+                failures.append(f'{sql}\n    {problems}')
+        self.assertFalse(failures, '\n'.join(failures))
+        return response
+
+    def pages(self, url):
+        """Первая и вторая страницы курсорного списка"""
+        response = self.assertIndexedPlans(lambda: self.client.get(url))
+        cursor = re.search(r'cursor=([\w-]+)', response.content.decode())
+        if cursor:
+            separator = '&' if '?' in url else '?'
+            self.assertIndexedPlans(lambda: self.client.get(f'{url}{separator}cursor={cursor.group(1)}'))
+
+    def read_routes(self):
+        return [
+            reverse('blog:index'),
+            reverse('blog:posts_list'),
+            reverse('blog:post_detail', args=[self.post.pk]),
+            reverse('blog:tag_posts', args=[self.tag.slug]),
+            reverse('blog:search') + '?q=django',
+            reverse('blog:posts_api'),
+            reverse('users:profile', args=[self.post.author.username]),
+        ]
+
+    def check_reads(self, urls):
+        for large_volumes in (False, True):
+            overrides = {}
+            if large_volumes:
+                overrides = {'TAG_POSTS_SORT_LIMIT': 0, 'TIMELINE_BIG_AUTHOR_FOLLOWERS': self.big_author_followers}
+            with self.settings(**overrides):
+                for url in urls:
+                    with self.subTest(url=url, large_volumes=large_volumes):
+                        self.pages(url)
+
+    def test_anonymous_reads(self):
+        self.check_reads(self.read_routes())
+
+    def test_authenticated_reads(self):
+        self.client.force_login(self.reader)
+        self.check_reads(self.read_routes() + [
+            reverse('blog:feed'),
+            reverse('blog:feed_api'),
+            reverse('blog:viewer_api') + f'?posts={self.post.pk}&authors={self.post.author_id}',
+            reverse('users:my_subscriptions'),
+            reverse('users:my_subscribers'),
+        ])
+
+    def test_writes(self):
+        self.client.force_login(self.reader)
+        self.assertIndexedPlans(lambda: self.client.post(reverse('blog:toggle_like', args=[self.post.pk])))
+        self.assertIndexedPlans(
+            lambda: self.client.post(reverse('blog:post_detail', args=[self.post.pk]), {'content': 'Комментарий'})
+        )
+        self.assertIndexedPlans(
+            lambda: self.client.post(reverse('blog:toggle_subscribe', args=[self.post.author.username]))
+        )
+        self.assertIndexedPlans(lambda: self.client.post(
+            reverse('blog:create_post'), {'title': 'Новый', 'content': 'Текст', 'tags': [self.tag.pk]}
+        ))
+
+    def test_tag_posts_paths_agree(self):
+        ordered = Post.objects.order_by('-created_at', '-pk').values_list('pk', flat=True)
+        with self.settings(TAG_POSTS_SORT_LIMIT=0):
+            walked = list(ordered.with_tag(self.tag))
+        with self.settings(TAG_POSTS_SORT_LIMIT=self.tag.post_count):
+            joined = list(ordered.with_tag(self.tag))
+        self.assertEqual(walked, joined)
+        self.assertEqual(len(walked), self.tag.post_count)
+
+    def test_composite_indexes(self):
+        with connection.cursor() as cursor:
+            indexes = {
+                table: connection.introspection.get_constraints(cursor, table)
+                for table in ('blog_post', 'blog_comment', 'blog_like', 'blog_subscribe', 'blog_tag')
+            }
+        self.assertEqual(indexes['blog_post']['blog_post_author_recent_idx']['columns'], ['author_id', 'created_at', 'id'])
+        self.assertEqual(indexes['blog_comment']['blog_comment_post_idx']['columns'], ['post_id', 'created_at'])
+        self.assertIn('blog_like_post_recent_idx', indexes['blog_like'])
+        self.assertIn('blog_subscribe_user_idx', indexes['blog_subscribe'])
+        self.assertIn('blog_tag_popular_idx', indexes['blog_tag'])
@@ -0,0 +1,276 @@
+"""
+Лента подписок ("посты авторов, на которых я подписан")
+
+Новые посты раскладываются по лентам подписчиков (fan-out on write) пачками
+воркером очереди (manage.py send_notifications), а не в запросе. Посты авторов с очень большим числом подписчиков
+в ленты не копируются, а подмешиваются при чтении (merge on read).
+Длина ленты ограничена TIMELINE_MAX_LENGTH; при подписке лента дополняется
+последними постами автора, при отписке посты автора из нее удаляются.
+"""
+import heapq
+
+from django.conf import settings
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+
+from users.models import AuthorStats
+
+from .models import Post, Subscribe, TimelineEntry
+from .pagination import NEXT, KeysetPage, decode_cursor, encode_cursor
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def max_length():
+    return _setting('TIMELINE_MAX_LENGTH', 1000)
+
+
+def big_author_threshold():
+    return _setting('TIMELINE_BIG_AUTHOR_FOLLOWERS', 10_000)
+
+
+def is_big_author(author_id):
+    """Автор, посты которого подмешиваются при чтении, а не раскладываются по лентам"""
+    return AuthorStats.objects.filter(
+        user_id=author_id,
+        followers_count__gte=big_author_threshold(),
+    ).exists()
+
+
+def trim_timelines(user_ids=None, length=None):
+    """
+    Обрезает ленты до заданной длины (оконная функция ROW_NUMBER по каждому читателю)
+
+    Args:
+        user_ids: Читатели (по умолчанию все)
+        length: Максимальная длина (по умолчанию TIMELINE_MAX_LENGTH)
+
+    Returns:
+        Количество удаленных записей
+    """
+    length = length or max_length()
+    entries = TimelineEntry.objects.all()
+    if user_ids is not None:
+        entries = entries.filter(user_id__in=user_ids)
+
+    ranked = entries.annotate(rank=Window(
+        RowNumber(),
+        partition_by=[F('user_id')],
+        order_by=[F('created_at').desc(), F('post_id').desc()],
+    ))
+    stale = list(ranked.filter(rank__gt=length).values_list('pk', flat=True))
+    deleted = 0
+    for start in range(0, len(stale), 500):
+        deleted += TimelineEntry.objects.filter(pk__in=stale[start:start + 500]).delete()[0]
+    return deleted
+
+
+def fan_out_post(post_id, chunk_size=None, after=0, on_progress=None):
+    """
+    Раскладывает пост по лентам подписчиков автора
+
+    Подписчики читаются пачками по ключу Subscribe.pk, каждая пачка -
+    один INSERT. Ленты обрезаются не при каждом посте, а при каждом
+    TIMELINE_TRIM_EVERY-м посте автора (по AuthorStats.posts_count,
+    амортизированно).
+
+    Args:
+        post_id: Пост
+        chunk_size: Размер пачки подписчиков
+        after: Продолжить после подписки с этим pk (для повторных попыток)
+        on_progress: Вызывается с pk последней подписки каждой записанной пачки
+
+    Returns:
+        Количество подписчиков, в ленты которых добавлен пост
+    """
+    post = Post.objects.filter(pk=post_id).values('author_id', 'created_at').first()
+    if post is None:
+        return 0
+    stats = AuthorStats.objects.filter(user_id=post['author_id']).values('followers_count', 'posts_count').first()
+    if stats is None or stats['followers_count'] >= big_author_threshold():
+        return 0
+
+    chunk_size = chunk_size or _setting('TIMELINE_FANOUT_CHUNK_SIZE', 1000)
+    trim = stats['posts_count'] % _setting('TIMELINE_TRIM_EVERY', 50) == 0
+    subscriptions = Subscribe.objects.filter(author_id=post['author_id']).order_by('pk')
+
+    delivered = 0
+    while True:
+        rows = list(subscriptions.filter(pk__gt=after).values_list('pk', 'user_id')[:chunk_size])
+        if not rows:
+            break
+        after = rows[-1][0]
+        user_ids = [user_id for _, user_id in rows]
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(user_id=user_id, post_id=post_id, author_id=post['author_id'], created_at=post['created_at'])
+                for user_id in user_ids
+            ],
+            ignore_conflicts=True,
+        )
+        if trim:
+            trim_timelines(user_ids)
+        delivered += len(user_ids)
+        if on_progress:
+            on_progress(after)
+
+    return delivered
+
+
+def schedule_fan_out(post_id):
+    """Раскладка поста по лентам воркером очереди (users/outbox.py) после коммита"""
+    from users.models import OutboxMessage
+    from users.outbox import enqueue_notification
+
+    enqueue_notification(OutboxMessage.KIND_TIMELINE, post_id)
+
+
+def follow(user_id, author_id):
+    """
+    Дополняет ленту читателя последними постами автора
+
+    Returns:
+        Количество добавленных постов
+    """
+    if is_big_author(author_id):
+        return 0
+    limit = _setting('TIMELINE_BACKFILL_POSTS', 100)
+    posts = list(
+        Post.objects.filter(author_id=author_id)
+        .order_by('-created_at', '-pk')
+        .values_list('pk', 'created_at')[:limit]
+    )
+    TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post_id=pk, author_id=author_id, created_at=created_at)
+            for pk, created_at in posts
+        ],
+        ignore_conflicts=True,
+    )
+    trim_timelines([user_id])
+    return len(posts)
+
+
+def unfollow(user_id, author_id):
+    """Удаляет посты автора из ленты читателя"""
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def rebuild_timeline(user_id):
+    """
+    Пересобирает ленту читателя по его подпискам
+
+    Returns:
+        Количество записей в ленте
+    """
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    big_authors = AuthorStats.objects.filter(followers_count__gte=big_author_threshold()).values('user_id')
+    posts = (
+        Post.objects.filter(author__subscribers__user_id=user_id)
+        .exclude(author_id__in=big_authors)
+        .order_by('-created_at', '-pk')
+        .values_list('pk', 'author_id', 'created_at')[:max_length()]
+    )
+    entries = TimelineEntry.objects.bulk_create(
+        [
+            TimelineEntry(user_id=user_id, post_id=pk, author_id=author_id, created_at=created_at)
+            for pk, author_id, created_at in posts
+        ],
+        batch_size=500,
+    )
+    return len(entries)
+
+
+class FeedPaginator:
+    """
+    Курсорная пагинация ленты подписок (только вперед)
+
+    Страница собирается слиянием двух упорядоченных потоков ключей
+    (created_at, id поста): записей ленты и постов больших авторов,
+    на которых подписан читатель. Из таблицы постов загружается только
+    сама страница.
+
+    Args:
+        user: Читатель
+        queryset: QuerySet постов для загрузки страницы (select_related и т.п.)
+        per_page: Количество постов на странице
+    """
+
+    def __init__(self, user, queryset, per_page=20):
+        self.user = user
+        self.queryset = queryset
+        self.per_page = per_page
+
+    def _streams(self, after):
+        limit = self.per_page + 1
+        timeline = TimelineEntry.objects.filter(user=self.user).order_by('-created_at', '-post_id')
+        if after is not None:
+            created_at, post_id = after
+            timeline = timeline.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, post_id__lt=post_id))
+        timeline = list(timeline.values_list('created_at', 'post_id')[:limit])
+        # Полная порция ленты ограничивает страницу снизу: более старые посты на нее не попадут
+        since = timeline[-1][0] if len(timeline) == limit else None
+        return timeline, self._big_author_posts(after, since, limit)
+
+    def _big_author_posts(self, after, since, limit):
+        """
+        Ключи последних постов больших авторов, на которых подписан читатель
+
+        Один запрос при любом числе таких авторов: ROW_NUMBER по каждому
+        автору (индекс blog_post_author_recent_idx) оставляет не больше
+        limit постов автора, и порция сливается здесь. Читаются только
+        посты не старше since - нижней границы страницы по ленте.
+        """
+        author_ids = Subscribe.objects.filter(
+            user=self.user,
+            author__stats__followers_count__gte=big_author_threshold(),
+        ).values('author_id')
+
+        posts = Post.objects.filter(author_id__in=author_ids)
+        if after is not None:
+            created_at, post_id = after
+            posts = posts.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=post_id))
+        if since is not None:
+            posts = posts.filter(created_at__gte=since)
+        ranked = posts.annotate(rank=Window(
+            RowNumber(),
+            partition_by=[F('author_id')],
+            order_by=[F('created_at').desc(), F('pk').desc()],
+        ))
+        keys = ranked.filter(rank__lte=limit).order_by().values_list('created_at', 'pk')
+        return sorted(keys, reverse=True)[:limit]
+
+    def _decode(self, cursor):
+        decoded = decode_cursor(cursor, 2) if cursor else None
+        if decoded is None or decoded[1] != NEXT:
+            return None
+        try:
+            field = Post._meta.get_field('created_at')
+            return field.to_python(decoded[0][0]), int(decoded[0][1])
+        except Exception:
+            return None
+
+    def get_page(self, cursor=None):
+        after = self._decode(cursor)
+        streams = self._streams(after)
+
+        keys = []
+        seen = set()
+        for key in heapq.merge(*streams, reverse=True):
+            # Пост большого автора мог попасть в ленту до того, как автор стал большим
+            if key[1] in seen:
+                continue
+            seen.add(key[1])
+            keys.append(key)
+            if len(keys) > self.per_page:
+                break
+
+        has_next = len(keys) > self.per_page
+        keys = keys[:self.per_page]
+        posts = self.queryset.in_bulk([post_id for _, post_id in keys])
+        rows = [posts[post_id] for _, post_id in keys if post_id in posts]
+
+        next_cursor = encode_cursor(list(keys[-1]), NEXT) if has_next else None
+        return KeysetPage(rows, self, has_next, after is not None, next_cursor, None)
@@ -1,15 +1,19 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'blog'
 
+# Страницы чтения: асинхронные представления под ASGI (ASYNC_VIEWS)
+read_views = async_views if settings.ASYNC_VIEWS else views
+
 urlpatterns = [
     # Главная и список
-    path('', views.index, name='index'),
-    path('posts/', views.posts_list, name='posts_list'),
+    path('', read_views.index, name='index'),
+    path('posts/', read_views.posts_list, name='posts_list'),
     
     # Детали поста
-    path('post/<int:pk>/', views.post_detail, name='post_detail'),
+    path('post/<int:pk>/', read_views.post_detail, name='post_detail'),
     
     # CRUD операции с постами
     path('post/create/', views.create_post, name='create_post'),
@@ -20,9 +24,17 @@ urlpatterns = [
     path('post/<int:pk>/like/', views.toggle_like, name='toggle_like'),
     path('user/<str:username>/subscribe/', views.toggle_subscribe, name='toggle_subscribe'),
     
+    # Лента подписок
+    path('feed/', views.feed, name='feed'),
+    
     # Теги
-    path('tag/<slug:slug>/', views.tag_posts, name='tag_posts'),
+    path('tag/<slug:slug>/', read_views.tag_posts, name='tag_posts'),
     
     # Поиск
-    path('search/', views.search, name='search'),
+    path('search/', read_views.search, name='search'),
+    
+    # JSON API
+    path('api/posts/', views.posts_api, name='posts_api'),
+    path('api/feed/', views.feed_api, name='feed_api'),
+    path('api/viewer/', views.viewer_api, name='viewer_api'),
 ]
\ No newline at end of file
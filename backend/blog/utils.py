@@ -1,84 +1,137 @@
 """
 Утилиты для безопасной обработки Markdown
 """
+import hashlib
+import html
+
 import markdown
 import bleach
+from django.utils.html import strip_tags
 from django.utils.safestring import mark_safe
+from django.utils.text import Truncator
+
+
+# Расширения для Markdown
+MARKDOWN_EXTENSIONS = [
+    'fenced_code',      # Блоки кода с ```
+    'tables',           # Таблицы
+    'nl2br',            # Автоматические переносы строк
+    'sane_lists',       # Улучшенные списки
+    'codehilite',       # Подсветка синтаксиса
+]
+
+# Конфигурация для подсветки кода
+MARKDOWN_EXTENSION_CONFIGS = {
+    'codehilite': {
+        'css_class': 'highlight',
+        'linenums': False,
+    }
+}
+
+# Разрешенные HTML теги (безопасные)
+ALLOWED_TAGS = [
+    'a', 'abbr', 'acronym', 'b', 'blockquote', 'code',
+    'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul',
+    'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'p', 'br', 'span', 'div',
+    'table', 'thead', 'tbody', 'tr', 'th', 'td',
+    'img', 'hr', 'del', 'ins', 'sup', 'sub',
+]
+
+# Разрешенные атрибуты для тегов
+ALLOWED_ATTRIBUTES = {
+    'a': ['href', 'title', 'rel'],
+    'abbr': ['title'],
+    'acronym': ['title'],
+    'img': ['src', 'alt', 'title'],
+    'code': ['class'],  # Для подсветки синтаксиса
+    'pre': ['class'],
+    'div': ['class'],
+    'span': ['class'],
+    'td': ['align'],
+    'th': ['align'],
+}
+
+# Разрешенные протоколы для ссылок (защита от javascript:)
+ALLOWED_PROTOCOLS = ['http', 'https', 'mailto']
+
+# Длина анонса поста в словах
+EXCERPT_WORDS = 50
+
+# Версия рендерера: меняется вместе с расширениями, allowlist'ом и версиями библиотек,
+# поэтому сохраненный HTML автоматически устаревает при изменении санитайзера
+RENDERER_VERSION = hashlib.sha256(repr((
+    MARKDOWN_EXTENSIONS,
+    sorted(MARKDOWN_EXTENSION_CONFIGS.items()),
+    ALLOWED_TAGS,
+    sorted(ALLOWED_ATTRIBUTES.items()),
+    ALLOWED_PROTOCOLS,
+    markdown.__version__,
+    bleach.__version__,
+)).encode()).hexdigest()[:12]
 
 
 def sanitize_markdown(md_text):
     """
     Конвертирует Markdown в безопасный HTML
-    
+
     Args:
         md_text: Текст в формате Markdown
-        
+
     Returns:
         Безопасный HTML
     """
     if not md_text:
         return ''
-    
-    # Расширения для Markdown
-    extensions = [
-        'fenced_code',      # Блоки кода с ```
-        'tables',           # Таблицы
-        'nl2br',            # Автоматические переносы строк
-        'sane_lists',       # Улучшенные списки
-        'codehilite',       # Подсветка синтаксиса
-    ]
-    
-    # Конфигурация для подсветки кода
-    extension_configs = {
-        'codehilite': {
-            'css_class': 'highlight',
-            'linenums': False,
-        }
-    }
-    
+
     # Конвертируем Markdown в HTML
     html = markdown.markdown(
         md_text,
-        extensions=extensions,
-        extension_configs=extension_configs,
+        extensions=MARKDOWN_EXTENSIONS,
+        extension_configs=MARKDOWN_EXTENSION_CONFIGS,
         output_format='html5'
     )
-    
-    # Разрешенные HTML теги (безопасные)
-    allowed_tags = [
-        'a', 'abbr', 'acronym', 'b', 'blockquote', 'code',
-        'em', 'i', 'li', 'ol', 'pre', 'strong', 'ul',
-        'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
-        'p', 'br', 'span', 'div',
-        'table', 'thead', 'tbody', 'tr', 'th', 'td',
-        'img', 'hr', 'del', 'ins', 'sup', 'sub',
-    ]
-    
-    # Разрешенные атрибуты для тегов
-    allowed_attributes = {
-        'a': ['href', 'title', 'rel'],
-        'abbr': ['title'],
-        'acronym': ['title'],
-        'img': ['src', 'alt', 'title'],
-        'code': ['class'],  # Для подсветки синтаксиса
-        'pre': ['class'],
-        'div': ['class'],
-        'span': ['class'],
-        'td': ['align'],
-        'th': ['align'],
-    }
-    
-    # Разрешенные протоколы для ссылок (защита от javascript:)
-    allowed_protocols = ['http', 'https', 'mailto']
-    
+
     # Санитизируем HTML с помощью bleach
     clean_html = bleach.clean(
         html,
-        tags=allowed_tags,
-        attributes=allowed_attributes,
-        protocols=allowed_protocols,
+        tags=ALLOWED_TAGS,
+        attributes=ALLOWED_ATTRIBUTES,
+        protocols=ALLOWED_PROTOCOLS,
         strip=True  # Удаляем запрещенные теги, а не экранируем
     )
-    
+
     return mark_safe(clean_html)
 
+
+def content_hash(md_text):
+    """
+    Хэш содержимого поста с учетом версии рендерера
+
+    Args:
+        md_text: Текст в формате Markdown
+
+    Returns:
+        Hex-строка SHA-256
+    """
+    data = f'{RENDERER_VERSION}:{md_text or ""}'
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def make_excerpt(md_text, words=EXCERPT_WORDS):
+    """
+    Текстовый анонс поста без разметки Markdown
+
+    Args:
+        md_text: Текст в формате Markdown
+        words: Максимальное количество слов
+
+    Returns:
+        Обычный текст (экранируется шаблоном при выводе)
+    """
+    if not md_text:
+        return ''
+
+    html_text = markdown.markdown(md_text, extensions=['fenced_code', 'tables', 'sane_lists'])
+    text = ' '.join(html.unescape(strip_tags(html_text)).split())
+    return Truncator(text).words(words)
@@ -0,0 +1,163 @@
+"""
+Буферизованный счетчик просмотров постов
+
+Просмотры копятся в памяти процесса и записываются в БД пачками
+в фоновом потоке: по достижении порога и по таймеру через интервал
+после первого незаписанного просмотра. Запрос, учитывающий просмотр,
+никогда не пишет в БД сам и не получает ее ошибок: они пишутся в лог,
+а просмотры возвращаются в буфер до следующей попытки. При завершении
+процесса буфер записывается синхронно.
+"""
+import atexit
+import logging
+import threading
+from collections import Counter
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+
+logger = logging.getLogger(__name__)
+
+# Постов в одном UPDATE (по два параметра CASE на пост)
+FLUSH_CHUNK_SIZE = 500
+
+
+class ViewCounter:
+    """Потокобезопасный буфер просмотров"""
+
+    def __init__(self, threshold=None, interval=None, autoflush=True):
+        self.threshold = threshold if threshold is not None else getattr(
+            settings, 'VIEW_COUNTER_FLUSH_THRESHOLD', 100
+        )
+        self.interval = interval if interval is not None else getattr(
+            settings, 'VIEW_COUNTER_FLUSH_INTERVAL', 10
+        )
+        # Без autoflush буфер записывается только явным flush()
+        self.autoflush = autoflush
+        self._pending = Counter()
+        self._total = 0
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        self._thread = None
+
+    def incr(self, post_id, amount=1):
+        """Учесть просмотр поста; запись в БД - в фоновом потоке"""
+        with self._lock:
+            if not self._pending:
+                self._schedule()
+            self._pending[post_id] += amount
+            self._total += amount
+            due = self.autoflush and self._total >= self.threshold
+
+        if due:
+            self.flush_in_background()
+
+    def _schedule(self):
+        """Таймер записи буфера через интервал (вызывается под self._lock)"""
+        if not self.autoflush or self._timer is not None:
+            return
+        self._timer = threading.Timer(self.interval, self._on_timer)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _on_timer(self):
+        with self._lock:
+            self._timer = None
+            busy = self._flush_lock.locked()
+            # Запись уже идет: просмотры, пришедшие после нее, ждут следующего интервала
+            if busy and self._pending:
+                self._schedule()
+        if not busy:
+            self.flush_in_background()
+
+    def flush_in_background(self):
+        """Запись буфера в отдельном потоке (если запись уже не идет)"""
+        if self._flush_lock.locked():
+            return
+        self._thread = threading.Thread(target=self._background_flush, name='view-counter-flush', daemon=True)
+        self._thread.start()
+
+    def _background_flush(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Ошибка записи просмотров, повтор через %s с', self.interval)
+        finally:
+            close_old_connections()
+
+    def join(self, timeout=None):
+        """Дождаться завершения начатой фоновой записи"""
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def pending(self, post_id=None):
+        """Количество еще не записанных просмотров"""
+        with self._lock:
+            if post_id is None:
+                return self._total
+            return self._pending[post_id]
+
+    def clear(self):
+        """
+        Отбросить накопленные просмотры без записи
+
+        Returns:
+            Количество отброшенных просмотров
+        """
+        with self._lock:
+            dropped, self._total = self._total, 0
+            self._pending = Counter()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        return dropped
+
+    def flush(self):
+        """
+        Записать накопленные просмотры в БД
+
+        Returns:
+            Количество записанных просмотров
+        """
+        from users.stats import add_author_views
+        from .counters import increment_each
+        from .models import Post
+
+        # Записью занимается один поток, остальные продолжают копить просмотры
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, Counter()
+                self._total = 0
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+
+            if not pending:
+                return 0
+
+            post_ids = list(pending)
+            try:
+                with transaction.atomic():
+                    # Прирост каждого поста - в CASE одного UPDATE (пачками из-за лимита параметров)
+                    for start in range(0, len(post_ids), FLUSH_CHUNK_SIZE):
+                        chunk = {post_id: pending[post_id] for post_id in post_ids[start:start + FLUSH_CHUNK_SIZE]}
+                        Post.objects.filter(pk__in=list(chunk)).update(views=increment_each('views', chunk))
+                        add_author_views(chunk)
+            except Exception:
+                # Возвращаем незаписанное в буфер, чтобы не потерять просмотры
+                with self._lock:
+                    self._pending.update(pending)
+                    self._total += sum(pending.values())
+                    self._schedule()
+                raise
+
+            return sum(pending.values())
+
+
+view_counter = ViewCounter()
+
+# Сбрасываем буфер при штатном завершении воркера
+atexit.register(view_counter.flush)
@@ -1,22 +1,39 @@
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.db.models import Q, Count
-from django.core.paginator import Paginator
-from django.http import JsonResponse
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.http import Http404, JsonResponse
+from django.middleware.csrf import get_token
+from django.urls import reverse
+from django.views.decorators.cache import never_cache
 from django.views.decorators.http import require_POST
 
-from .models import Post, Comment, Subscribe, Like, Tag
+from users.models import Profile, UserSettings
+from users.thumbnails import thumbnail_url
+
+from . import services
+from . import page_cache
+from .conditional import POSTS, listing_version, make_etag, not_modified, post_validators, set_validators, viewer_state
+from .models import Post, Comment, Like, Subscribe, Tag
 from .forms import CommentForm, PostForm, SearchForm
+from .pagination import KeysetPaginator, RankedPaginator
+from .search import search_posts
+from .timeline import FeedPaginator
+from .view_counter import view_counter
 
 
 # Create your views here.
 
 
+@page_cache.anonymous_page_cache(lambda request: [page_cache.LISTINGS])
 def index(request):
     """Главная страница"""
-    recent_posts = Post.objects.select_related('author').prefetch_related('tags').all()[:10]
-    popular_tags = Tag.objects.annotate(post_count=Count('posts')).order_by('-post_count')[:10]
+    recent_posts = (
+        Post.objects.select_related('author__profile').prefetch_related('tags').defer('content')
+        .with_viewer_state(request.user)[:10]
+    )
+    popular_tags = Tag.objects.order_by('-post_count', 'name')[:10]
     
     context = {
         'recent_posts': recent_posts,
@@ -25,36 +42,55 @@ def index(request):
     return render(request, 'blog/index.html', context)
 
 
+@page_cache.anonymous_page_cache(lambda request: [page_cache.LISTINGS])
 def posts_list(request):
     """Список всех постов с пагинацией"""
-    posts = Post.objects.select_related('author').prefetch_related('tags').all()
+    # Условный GET: валидатор по версии списка, без запросов к БД
+    etag = make_etag('posts_list', listing_version(POSTS), request.GET.get('cursor'), viewer_state(request))
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+
+    posts = (
+        Post.objects.select_related('author__profile').prefetch_related('tags').defer('content')
+        .with_viewer_state(request.user)
+    )
     
-    # Пагинация
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Курсорная пагинация
+    paginator = KeysetPaginator(posts, 10)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     context = {
         'page_obj': page_obj,
     }
-    return render(request, 'blog/posts_list.html', context)
+    return set_validators(request, render(request, 'blog/posts_list.html', context), etag)
 
 
+@page_cache.anonymous_page_cache(
+    lambda request, pk: [page_cache.post_group(pk)],
+    # Просмотр засчитывается и при ответе из кэша
+    on_hit=lambda request, pk: view_counter.incr(pk),
+)
 def post_detail(request, pk):
     """Детальная страница поста с комментариями"""
+    # Условный GET: валидаторы поста одним запросом, без рендеринга
+    etag = last_modified = None
+    if request.method == 'GET':
+        etag, last_modified = post_validators(request, pk)
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            # Просмотр засчитывается и без рендеринга страницы
+            view_counter.incr(pk)
+            return response
+
     post = get_object_or_404(
-        Post.objects.select_related('author').prefetch_related('tags', 'comments__author'),
+        Post.objects.select_related('author__profile', 'render').with_viewer_state(request.user),
         pk=pk
     )
     
     # Увеличиваем счетчик просмотров
     post.increment_views()
     
-    # Проверяем, лайкнул ли пользователь пост
-    user_liked = False
-    if request.user.is_authenticated:
-        user_liked = Like.objects.filter(post=post, user=request.user).exists()
-    
     # Форма комментария
     if request.method == 'POST':
         comment_form = CommentForm(request.POST)
@@ -62,18 +98,25 @@ def post_detail(request, pk):
             comment = comment_form.save(commit=False)
             comment.post = post
             comment.author = request.user
-            comment.save()
+            # Комментарий и счетчик поста сохраняются в одной транзакции
+            with transaction.atomic():
+                comment.save()
             messages.success(request, 'Комментарий добавлен!')
             return redirect('blog:post_detail', pk=pk)
     else:
         comment_form = CommentForm()
     
+    # Теги и комментарии нужны только странице: отправка комментария перенаправляет без них
+    prefetch_related_objects([post], 'tags', 'comments__author__profile')
     context = {
         'post': post,
         'comment_form': comment_form,
-        'user_liked': user_liked,
+        'user_liked': post.viewer_liked,
     }
-    return render(request, 'blog/post_detail.html', context)
+    response = render(request, 'blog/post_detail.html', context)
+    if etag is not None:
+        set_validators(request, response, etag, last_modified)
+    return response
 
 
 @login_required
@@ -138,18 +181,15 @@ def delete_post(request, pk):
 @require_POST
 def toggle_like(request, pk):
     """AJAX: Лайк/анлайк поста"""
-    post = get_object_or_404(Post, pk=pk)
-    like, created = Like.objects.get_or_create(post=post, user=request.user)
-    
-    if not created:
-        like.delete()
-        liked = False
-    else:
-        liked = True
+    # Лайк и счетчик поста меняются в одной транзакции без пересчета
+    try:
+        liked, total_likes = services.toggle_like(pk, request.user.pk)
+    except Post.DoesNotExist:
+        raise Http404('Пост не найден')
     
     return JsonResponse({
         'liked': liked,
-        'total_likes': post.total_likes()
+        'total_likes': total_likes
     })
 
 
@@ -158,43 +198,44 @@ def toggle_like(request, pk):
 def toggle_subscribe(request, username):
     """AJAX: Подписка/отписка от автора"""
     from django.contrib.auth.models import User
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(User.objects.only('pk'), username=username)
     
     if author == request.user:
         return JsonResponse({'error': 'Нельзя подписаться на самого себя'}, status=400)
     
-    subscription, created = Subscribe.objects.get_or_create(
-        user=request.user,
-        author=author
-    )
-    
-    if not created:
-        subscription.delete()
-        subscribed = False
-    else:
-        subscribed = True
+    # Подписка и счетчики меняются в одной транзакции без пересчета
+    subscribed, followers_count = services.toggle_subscribe(request.user.pk, author.pk)
     
     return JsonResponse({
         'subscribed': subscribed,
-        'followers_count': author.subscribers.count()
+        'followers_count': followers_count
     })
 
 
+@page_cache.anonymous_page_cache(lambda request, slug: [page_cache.tag_group(slug)])
 def tag_posts(request, slug):
     """Посты по тегу"""
+    # Условный GET: валидатор по версии списка, без запросов к БД
+    etag = make_etag('tag_posts', slug, listing_version(POSTS), request.GET.get('cursor'), viewer_state(request))
+    response = not_modified(request, etag)
+    if response is not None:
+        return response
+
     tag = get_object_or_404(Tag, slug=slug)
-    posts = Post.objects.filter(tags=tag).select_related('author').prefetch_related('tags')
+    posts = (
+        Post.objects.with_tag(tag).select_related('author__profile').prefetch_related('tags').defer('content')
+        .with_viewer_state(request.user)
+    )
     
-    # Пагинация
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Курсорная пагинация; общее количество берется из счетчика тега
+    paginator = KeysetPaginator(posts, 10, count=tag.post_count)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     context = {
         'tag': tag,
         'page_obj': page_obj,
     }
-    return render(request, 'blog/tag_posts.html', context)
+    return set_validators(request, render(request, 'blog/tag_posts.html', context), etag)
 
 
 def search(request):
@@ -203,20 +244,23 @@ def search(request):
     posts = Post.objects.none()
     query = None
     
+    ranked_ids = None
+    
     if form.is_valid():
         query = form.cleaned_data.get('q')
         if query:
             # Поиск по заголовку, содержанию и тегам
-            posts = Post.objects.filter(
-                Q(title__icontains=query) |
-                Q(content__icontains=query) |
-                Q(tags__name__icontains=query)
-            ).select_related('author').prefetch_related('tags').distinct()
+            ranked_ids, posts = search_posts(query)
     
-    # Пагинация
-    paginator = Paginator(posts, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Курсорная пагинация
+    cards = Post.objects.all() if ranked_ids is not None else posts
+    cards = cards.select_related('author__profile').prefetch_related('tags').defer('content').with_viewer_state(request.user)
+    if ranked_ids is not None:
+        # FTS5: пагинируем id по релевантности и загружаем только текущую страницу
+        paginator = RankedPaginator(ranked_ids, cards, 10)
+    else:
+        paginator = KeysetPaginator(cards, 10)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     context = {
         'form': form,
@@ -226,5 +270,143 @@ def search(request):
     return render(request, 'blog/search.html', context)
 
 
+def _post_json(post):
+    """Карточка поста для JSON API"""
+    return {
+        'id': post.pk,
+        'title': post.title,
+        'excerpt': post.excerpt,
+        'url': post.get_absolute_url(),
+        'author': post.author.username,
+        'created_at': post.created_at.isoformat(),
+        'tags': [tag.slug for tag in post.tags.all()],
+        'views': post.views,
+        'likes': post.like_count,
+        'comments': post.comment_count,
+        'liked': post.viewer_liked,
+        'follows_author': post.viewer_follows_author,
+    }
+
 
+def posts_api(request):
+    """JSON: список постов с курсорной пагинацией (фильтры: tag, author)"""
+    posts = (
+        Post.objects.select_related('author').prefetch_related('tags').defer('content')
+        .with_viewer_state(request.user)
+    )
+    
+    tag_slug = request.GET.get('tag')
+    if tag_slug:
+        posts = posts.filter(tags__slug=tag_slug)
+    
+    author = request.GET.get('author')
+    if author:
+        posts = posts.filter(author__username=author)
+    
+    try:
+        per_page = min(max(int(request.GET.get('limit', 10)), 1), 50)
+    except ValueError:
+        per_page = 10
+    
+    paginator = KeysetPaginator(posts, per_page)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
+    
+    data = {
+        'results': [_post_json(post) for post in page_obj],
+        'next': page_obj.next_cursor,
+        'previous': page_obj.previous_cursor,
+    }
+    
+    # Приблизительное общее количество - только по запросу
+    if request.GET.get('estimate'):
+        estimate = page_obj.estimated_count
+        data['estimated_count'] = {'count': estimate.count, 'exact': estimate.exact}
+    
+    return JsonResponse(data)
 
+
+def _feed_page(request):
+    """Страница ленты подписок текущего пользователя"""
+    posts = (
+        Post.objects.select_related('author__profile').prefetch_related('tags').defer('content')
+        .with_viewer_state(request.user)
+    )
+    paginator = FeedPaginator(request.user, posts, 20)
+    return paginator.get_page(request.GET.get('cursor'))
+
+
+@login_required
+def feed(request):
+    """Лента постов авторов, на которых подписан пользователь"""
+    context = {
+        'page_obj': _feed_page(request),
+    }
+    return render(request, 'blog/feed.html', context)
+
+
+@login_required
+def feed_api(request):
+    """JSON: лента подписок с курсорной пагинацией"""
+    page_obj = _feed_page(request)
+    return JsonResponse({
+        'results': [_post_json(post) for post in page_obj],
+        'next': page_obj.next_cursor,
+    })
+
+
+# Сколько id постов и авторов принимает /api/viewer/ (страница выводит не больше 10-20)
+VIEWER_API_MAX_IDS = 100
+
+
+def _id_list(value):
+    """Список id из параметра вида 1,2,3 (некорректные значения пропускаются)"""
+    ids = {int(part) for part in value.split(',') if part.strip().isdigit()}
+    return sorted(ids)[:VIEWER_API_MAX_IDS]
+
+
+@never_cache
+def viewer_api(request):
+    """
+    JSON: данные читателя для страницы-оболочки (PAGE_SHELL_ENABLED)
+
+    Параметры posts и authors - id постов и авторов на странице; в ответе
+    из них остаются лайкнутые посты и авторы, на которых подписан читатель.
+    """
+    user = request.user
+    if not user.is_authenticated:
+        return JsonResponse({'authenticated': False})
+
+    try:
+        avatar_url = thumbnail_url(user.profile, 'sm')
+    except Profile.DoesNotExist:
+        avatar_url = ''
+    try:
+        theme, sound_enabled = user.settings.theme, user.settings.sound_enabled
+    except UserSettings.DoesNotExist:
+        theme, sound_enabled = 'light', True
+
+    post_ids = _id_list(request.GET.get('posts', ''))
+    author_ids = _id_list(request.GET.get('authors', ''))
+    liked = Like.objects.filter(user=user, post_id__in=post_ids).values_list('post_id', flat=True) if post_ids else []
+    following = (
+        Subscribe.objects.filter(user=user, author_id__in=author_ids).values_list('author_id', flat=True)
+        if author_ids else []
+    )
+
+    return JsonResponse({
+        'authenticated': True,
+        'user': {
+            'id': user.pk,
+            'username': user.username,
+            'profile_url': reverse('users:profile', args=[user.username]),
+            'avatar_url': avatar_url,
+            'is_staff': user.is_staff,
+        },
+        'settings': {
+            'theme': theme,
+            'sound_enabled': sound_enabled,
+        },
+        'liked': list(liked),
+        'following': list(following),
+        'csrf_token': get_token(request),
+    })
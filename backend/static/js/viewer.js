@@ -0,0 +1,105 @@
+// ===== Данные читателя для страницы-оболочки =====
+// Страница закэширована общей для всех (PAGE_SHELL_ENABLED), поэтому
+// имя пользователя, тема, лайки, подписки и CSRF токен загружаются отдельно
+
+document.addEventListener('DOMContentLoaded', function() {
+    loadViewer();
+});
+
+function collectIds(attribute) {
+    const ids = new Set();
+    document.querySelectorAll(`[${attribute}]`).forEach(element => {
+        ids.add(element.getAttribute(attribute));
+    });
+    return Array.from(ids).join(',');
+}
+
+async function loadViewer() {
+    const params = new URLSearchParams({
+        posts: collectIds('data-liked-post'),
+        authors: collectIds('data-following-author'),
+    });
+
+    try {
+        const response = await fetch(`/api/viewer/?${params}`, {
+            credentials: 'same-origin',
+            headers: {'Accept': 'application/json'},
+        });
+
+        if (!response.ok) {
+            throw new Error('Network response was not ok');
+        }
+
+        const data = await response.json();
+        if (data.authenticated) {
+            applyViewer(data);
+        }
+    } catch (error) {
+        console.error('Error:', error);
+    } finally {
+        document.documentElement.classList.add('viewer-ready');
+    }
+}
+
+function setVisible(selector, visible) {
+    document.querySelectorAll(selector).forEach(element => {
+        element.hidden = !visible;
+    });
+}
+
+function applyViewer(data) {
+    const user = data.user;
+
+    // Шапка: меню пользователя вместо кнопок входа
+    setVisible('[data-viewer="authenticated"]', true);
+    setVisible('[data-viewer="anonymous"]', false);
+    setVisible('[data-viewer="staff"]', user.is_staff);
+    setVisible(`[data-viewer-author="${user.id}"]`, true);
+
+    document.querySelectorAll('[data-viewer-field="username"]').forEach(element => {
+        element.textContent = user.username;
+    });
+    document.querySelectorAll('[data-viewer-field="profile_url"]').forEach(element => {
+        element.href = user.profile_url;
+    });
+    document.querySelectorAll('[data-viewer-field="avatar"]').forEach(element => {
+        if (user.avatar_url) {
+            const image = document.createElement('img');
+            image.src = user.avatar_url;
+            image.alt = user.username;
+            image.className = 'avatar-sm';
+            image.width = 32;
+            image.height = 32;
+            element.replaceWith(image);
+        } else {
+            element.textContent = user.username.charAt(0).toUpperCase();
+        }
+    });
+
+    // Форма комментария
+    document.querySelectorAll('[data-viewer-field="csrf_token"]').forEach(element => {
+        element.value = data.csrf_token;
+    });
+
+    // Лайки и подписки
+    data.liked.forEach(postId => {
+        document.querySelectorAll(`[data-liked-post="${postId}"]`).forEach(element => {
+            element.classList.add('liked');
+        });
+    });
+    data.following.forEach(authorId => {
+        setVisible(`[data-following-author="${authorId}"]`, true);
+    });
+
+    // Настройки
+    window.userSettings = {
+        soundEnabled: data.settings.sound_enabled,
+        theme: data.settings.theme,
+    };
+    window.soundManager?.setEnabled(data.settings.sound_enabled);
+    if (window.themeManager) {
+        window.themeManager.applyTheme(data.settings.theme);
+    } else {
+        document.documentElement.setAttribute('data-theme', data.settings.theme);
+    }
+}
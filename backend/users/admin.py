@@ -1,7 +1,7 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
-from .models import Profile, UserSettings
+from .models import Profile, UserSettings, OutboxMessage, AuthorStats
 
 
 # Register your models here.
@@ -39,3 +39,17 @@ class ProfileAdmin(admin.ModelAdmin):
 class UserSettingsAdmin(admin.ModelAdmin):
     list_display = ['user', 'theme', 'sound_enabled', 'email_notifications']
     list_filter = ['theme', 'sound_enabled', 'email_notifications']
+
+
+@admin.register(OutboxMessage)
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'object_id', 'status', 'attempts', 'available_at', 'created_at', 'sent_at']
+    list_filter = ['status', 'kind']
+    readonly_fields = ['created_at', 'sent_at', 'last_error']
+
+
+@admin.register(AuthorStats)
+class AuthorStatsAdmin(admin.ModelAdmin):
+    list_display = ['user', 'posts_count', 'followers_count', 'following_count', 'likes_received', 'total_views', 'updated_at']
+    search_fields = ['user__username']
+    readonly_fields = ['posts_count', 'followers_count', 'following_count', 'likes_received', 'total_views', 'updated_at']
@@ -0,0 +1,44 @@
+"""
+Асинхронные представления пользователей (ASGI, см. blog/async_views.py)
+"""
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.shortcuts import aget_object_or_404, render
+
+from blog.models import Post, Subscribe
+from blog.pagination import KeysetPaginator
+
+from .backends import with_user
+from .models import get_profile
+from .stats import get_author_stats
+
+
+@with_user
+async def profile(request, username):
+    """Профиль пользователя"""
+    user = await aget_object_or_404(User.objects.select_related('profile', 'stats'), username=username)
+    # Недостающие профиль и статистика создаются синхронно (редкий случай)
+    profile = await sync_to_async(get_profile)(user)
+    stats = await sync_to_async(get_author_stats)(user)
+    posts = (
+        Post.objects.filter(author=user).select_related('author').prefetch_related('tags').defer('content')
+        .with_viewer_state(request.user)
+    )
+    page_obj = await KeysetPaginator(posts, 5, count=stats.posts_count).aget_page(request.GET.get('cursor'))
+
+    # У всех постов автор один, поэтому флаг подписки берется из первого поста
+    is_subscribed = False
+    if request.user.is_authenticated and request.user != user:
+        if page_obj:
+            is_subscribed = page_obj[0].viewer_follows_author
+        else:
+            is_subscribed = await Subscribe.objects.filter(user=request.user, author=user).aexists()
+
+    context = {
+        'profile_user': user,
+        'profile': profile,
+        'stats': stats,
+        'page_obj': page_obj,
+        'is_subscribed': is_subscribed,
+    }
+    return await sync_to_async(render)(request, 'users/profile.html', context)
@@ -0,0 +1,93 @@
+"""
+Бэкенд аутентификации с загрузкой профиля и настроек
+
+base.html на каждой странице читает user.settings и user.profile. Бэкенд
+загружает пользователя вместе с ними одним запросом с JOIN, а при
+USER_STATE_CACHE_TIMEOUT > 0 хранит результат в кэше. Запись кэша
+удаляется сигналами при сохранении User, Profile и UserSettings.
+Кэш имеет смысл только с общим для всех процессов бэкендом (Redis,
+Memcached): LocMemCache не увидит удаление в соседнем процессе.
+
+Асинхронные представления (ASYNC_VIEWS) получают пользователя через
+request.auser() - тем же запросом, но через асинхронный ORM.
+"""
+import functools
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+
+def _cache_key(user_id):
+    return f'user_state:{user_id}'
+
+
+def cache_timeout():
+    return getattr(settings, 'USER_STATE_CACHE_TIMEOUT', 0)
+
+
+def forget_user_state(user_id):
+    """Удаляет пользователя из кэша (после изменения его данных)"""
+    if cache_timeout():
+        cache.delete(_cache_key(user_id))
+
+
+def load_user_state(user_id):
+    """
+    Пользователь вместе с профилем и настройками
+
+    Returns:
+        User или None, если пользователя нет
+    """
+    timeout = cache_timeout()
+    if timeout:
+        user = cache.get(_cache_key(user_id))
+        if user is not None:
+            return user
+
+    user = User._default_manager.select_related('profile', 'settings').filter(pk=user_id).first()
+    if user is not None and timeout:
+        cache.set(_cache_key(user_id), user, timeout)
+    return user
+
+
+async def aload_user_state(user_id):
+    """Асинхронный вариант load_user_state"""
+    timeout = cache_timeout()
+    if timeout:
+        user = await cache.aget(_cache_key(user_id))
+        if user is not None:
+            return user
+
+    user = await User._default_manager.select_related('profile', 'settings').filter(pk=user_id).afirst()
+    if user is not None and timeout:
+        await cache.aset(_cache_key(user_id), user, timeout)
+    return user
+
+
+class UserStateBackend(ModelBackend):
+    """ModelBackend, загружающий пользователя сессии с профилем и настройками"""
+
+    def get_user(self, user_id):
+        user = load_user_state(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        user = await aload_user_state(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
+
+
+def with_user(view):
+    """
+    Декоратор асинхронного представления: пользователь сессии загружается до вызова
+
+    request.user у AuthenticationMiddleware ленивый и синхронный: первое
+    обращение к нему из цикла событий запросило бы БД синхронно.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        request.user = await request.auser()
+        return await view(request, *args, **kwargs)
+
+    return wrapper
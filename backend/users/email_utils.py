@@ -1,138 +1,302 @@
 """
 Утилиты для отправки email уведомлений
+
+Функции new_*_emails собирают письма без отправки (их использует
+воркер очереди уведомлений), notify_* собирают и сразу отправляют.
+Рассылка о новом посте (fan_out_new_post) идет пачками и сама отправляет письма.
 """
-from django.core.mail import send_mail
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.conf import settings
+from django.db import connections
 from django.template.loader import render_to_string
+from django.utils.html import escape
 
 
-def send_notification_email(user, subject, template_name, context):
+def _text_body(subject):
+    """Простая текстовая версия письма"""
+    return f"""
+        {subject}
+
+        Это уведомление с сайта TechBlog.
+
+        Вы можете отключить email уведомления в настройках профиля:
+        {settings.SITE_URL}/users/settings/
+        """
+
+
+def build_notification_email(user, subject, template_name, context):
     """
-    Отправка email уведомления пользователю
-    
+    Сборка email уведомления пользователю
+
     Args:
         user: Пользователь-получатель
         subject: Тема письма
         template_name: Имя шаблона для письма
         context: Контекст для шаблона
+
+    Returns:
+        EmailMultiAlternatives или None, если письмо отправлять не нужно
     """
     # Проверяем настройки пользователя
     if not hasattr(user, 'settings') or not user.settings.email_notifications:
-        return False
-    
+        return None
+
     if not user.email:
-        return False
-    
+        return None
+
+    # Рендерим HTML письмо
+    html_message = render_to_string(template_name, context)
+
+    # Создаем текстовую версию (простую)
+    text_message = _text_body(subject)
+
+    message = EmailMultiAlternatives(
+        subject=subject,
+        body=text_message,
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[user.email],
+    )
+    message.attach_alternative(html_message, 'text/html')
+    return message
+
+
+def send_emails(messages, connection=None, fail_silently=True):
+    """
+    Отправка писем через одно SMTP-соединение
+
+    Returns:
+        Количество отправленных писем
+    """
+    if not messages:
+        return 0
+
+    connection = connection or get_connection(fail_silently=fail_silently)
+    return connection.send_messages(messages) or 0
+
+
+def send_notification_email(user, subject, template_name, context):
+    """
+    Отправка email уведомления пользователю
+
+    Args:
+        user: Пользователь-получатель
+        subject: Тема письма
+        template_name: Имя шаблона для письма
+        context: Контекст для шаблона
+    """
     try:
-        # Рендерим HTML письмо
-        html_message = render_to_string(template_name, context)
-        
-        # Создаем текстовую версию (простую)
-        text_message = f"""
-        {subject}
-        
-        Это уведомление с сайта TechBlog.
-        
-        Вы можете отключить email уведомления в настройках профиля:
-        {settings.SITE_URL}/users/settings/
-        """
-        
-        send_mail(
-            subject=subject,
-            message=text_message,
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=[user.email],
-            html_message=html_message,
-            fail_silently=True,
-        )
-        return True
+        message = build_notification_email(user, subject, template_name, context)
+        if message is None:
+            return False
+        return send_emails([message]) > 0
     except Exception as e:
         print(f"Error sending email to {user.email}: {e}")
         return False
 
 
-def notify_new_comment(comment):
-    """Уведомление автору поста о новом комментарии"""
+def new_comment_emails(comment):
+    """Письма автору поста о новом комментарии"""
     post_author = comment.post.author
-    
+
     # Не уведомляем если автор сам комментирует
     if comment.author == post_author:
-        return
-    
+        return []
+
     subject = f'Новый комментарий к вашему посту "{comment.post.title}"'
     context = {
         'post': comment.post,
         'comment': comment,
         'author': post_author,
     }
-    
-    send_notification_email(
+
+    message = build_notification_email(
         user=post_author,
         subject=subject,
         template_name='emails/new_comment.html',
         context=context
     )
+    return [message] if message else []
 
 
-def notify_new_like(like):
-    """Уведомление автору поста о новом лайке"""
+def new_like_emails(like):
+    """Письма автору поста о новом лайке"""
     post_author = like.post.author
-    
+
     # Не уведомляем если автор сам лайкает
     if like.user == post_author:
-        return
-    
+        return []
+
     subject = f'{like.user.username} лайкнул ваш пост "{like.post.title}"'
     context = {
         'post': like.post,
         'liker': like.user,
         'author': post_author,
     }
-    
-    send_notification_email(
+
+    message = build_notification_email(
         user=post_author,
         subject=subject,
         template_name='emails/new_like.html',
         context=context
     )
+    return [message] if message else []
 
 
-def notify_new_follower(subscription):
-    """Уведомление пользователю о новом подписчике"""
+def new_follower_emails(subscription):
+    """Письма пользователю о новом подписчике"""
     subject = f'{subscription.user.username} подписался на вас!'
     context = {
         'follower': subscription.user,
         'author': subscription.author,
     }
-    
-    send_notification_email(
+
+    message = build_notification_email(
         user=subscription.author,
         subject=subject,
         template_name='emails/new_follower.html',
         context=context
     )
+    return [message] if message else []
 
 
-def notify_new_post_to_followers(post):
-    """Уведомление подписчикам о новом посте автора"""
+# Маркер имени подписчика: шаблон рендерится один раз на пачку,
+# затем маркер заменяется на имя конкретного получателя
+SUBSCRIBER_MARKER = '__SUBSCRIBER_USERNAME__'
+
+
+class _SubscriberPlaceholder:
+    username = SUBSCRIBER_MARKER
+
+
+def _new_post_recipient_chunks(post, after, chunk_size):
+    """
+    Пачки получателей рассылки о новом посте
+
+    Подписчики обходятся по Subscribe.pk (keyset), настройки уведомлений
+    и email проверяются тем же запросом.
+    """
     from blog.models import Subscribe
-    
-    # Получаем всех подписчиков автора
-    subscribers = Subscribe.objects.filter(author=post.author).select_related('user')
-    
-    subject = f'{post.author.username} опубликовал новый пост: "{post.title}"'
-    
-    for subscription in subscribers:
-        context = {
-            'post': post,
-            'author': post.author,
-            'subscriber': subscription.user,
-        }
-        
-        send_notification_email(
-            user=subscription.user,
+
+    subscribers = (
+        Subscribe.objects
+        .filter(author_id=post.author_id, user__settings__email_notifications=True)
+        .exclude(user__email='')
+        .order_by('pk')
+    )
+    while True:
+        rows = list(
+            subscribers.filter(pk__gt=after)
+            .values_list('pk', 'user__username', 'user__email')[:chunk_size]
+        )
+        if not rows:
+            return
+        yield rows
+        after = rows[-1][0]
+
+
+def _send_new_post_chunk(post, subject, rows):
+    """Рендерит письмо один раз и отправляет пачку через одно соединение"""
+    html_template = render_to_string('emails/new_post.html', {
+        'post': post,
+        'author': post.author,
+        'subscriber': _SubscriberPlaceholder,
+    })
+    text_message = _text_body(subject)
+
+    messages = []
+    for _, username, email in rows:
+        message = EmailMultiAlternatives(
             subject=subject,
-            template_name='emails/new_post.html',
-            context=context
+            body=text_message,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            to=[email],
         )
+        message.attach_alternative(html_template.replace(SUBSCRIBER_MARKER, escape(username)), 'text/html')
+        messages.append(message)
+
+    with get_connection() as connection:
+        return connection.send_messages(messages) or 0
+
+
+def _send_new_post_chunk_in_pool(post, subject, rows):
+    """_send_new_post_chunk в потоке пула: соединение с БД потока закрывается после пачки"""
+    try:
+        return _send_new_post_chunk(post, subject, rows)
+    finally:
+        # Поток пула завершается вместе с рассылкой, его соединение больше не понадобится
+        connections.close_all()
 
+
+def fan_out_new_post(post, after=0, chunk_size=None, workers=None, on_progress=None):
+    """
+    Рассылка подписчикам о новом посте автора
+
+    Args:
+        post: Пост (с загруженным автором)
+        after: Продолжить после подписки с этим pk (для повторных попыток)
+        chunk_size: Размер пачки получателей
+        workers: Количество потоков для параллельной отправки пачек
+        on_progress: Вызывается с pk последней подписки из непрерывно
+            отправленного начала списка
+
+    Returns:
+        Количество отправленных писем
+    """
+    chunk_size = chunk_size or getattr(settings, 'NOTIFY_FANOUT_CHUNK_SIZE', 500)
+    workers = workers or getattr(settings, 'NOTIFY_FANOUT_WORKERS', 4)
+    subject = f'{post.author.username} опубликовал новый пост: "{post.title}"'
+    chunks = _new_post_recipient_chunks(post, after, chunk_size)
+
+    if workers <= 1:
+        sent = 0
+        for rows in chunks:
+            sent += _send_new_post_chunk(post, subject, rows)
+            if on_progress:
+                on_progress(rows[-1][0])
+        return sent
+
+    # Получателей читаем в текущем потоке, рендеринг и SMTP - в пуле.
+    # В работе не больше workers пачек: прогресс сохраняется по ходу рассылки,
+    # а после ошибки новые пачки не отправляются (их отправит повторная попытка)
+    sent = 0
+    in_flight = deque()
+
+    def complete_oldest():
+        last_pk, future = in_flight.popleft()
+        # Прогресс двигается только по непрерывно отправленным пачкам
+        result = future.result()
+        if on_progress:
+            on_progress(last_pk)
+        return result
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for rows in chunks:
+            in_flight.append((rows[-1][0], pool.submit(_send_new_post_chunk_in_pool, post, subject, rows)))
+            if len(in_flight) >= workers:
+                sent += complete_oldest()
+        while in_flight:
+            sent += complete_oldest()
+    return sent
+
+
+def notify_new_comment(comment):
+    """Уведомление автору поста о новом комментарии"""
+    send_emails(new_comment_emails(comment))
+
+
+def notify_new_like(like):
+    """Уведомление автору поста о новом лайке"""
+    send_emails(new_like_emails(like))
+
+
+def notify_new_follower(subscription):
+    """Уведомление пользователю о новом подписчике"""
+    send_emails(new_follower_emails(subscription))
+
+
+def notify_new_post_to_followers(post):
+    """Уведомление подписчикам о новом посте автора"""
+    fan_out_new_post(post)
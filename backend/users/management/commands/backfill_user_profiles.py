@@ -0,0 +1,29 @@
+"""
+Создание недостающих профилей и настроек пользователей
+"""
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from users.models import Profile, UserSettings
+
+
+class Command(BaseCommand):
+    help = 'Создает Profile и UserSettings пользователям, у которых их нет (пачками, без сохранения существующих)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Записей на один INSERT')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        created = {}
+        for model, relation in ((Profile, 'profile'), (UserSettings, 'settings')):
+            missing = User.objects.filter(**{f'{relation}__isnull': True}).values_list('pk', flat=True)
+            rows = model.objects.bulk_create(
+                [model(user_id=pk) for pk in missing.iterator()],
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+            created[model._meta.verbose_name_plural] = len(rows)
+
+        summary = ', '.join(f'{name}: {count}' for name, count in created.items())
+        self.stdout.write(self.style.SUCCESS(f'Создано записей - {summary}'))
@@ -0,0 +1,90 @@
+"""
+Бенчмарк рассылки о новом посте: прежний цикл против пачечной рассылки
+"""
+import json
+
+from django.conf import settings
+from django.core import mail
+from django.core.mail import send_mail
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.db import connection
+
+from blog.management.commands._bench import benchmark_database, create_users, measure
+from blog.models import Post, Subscribe
+from users.email_utils import fan_out_new_post
+
+
+def legacy_fan_out(post):
+    """Прежняя реализация: рендеринг, запрос настроек и соединение на каждого подписчика"""
+    subject = f'{post.author.username} опубликовал новый пост: "{post.title}"'
+    for subscription in Subscribe.objects.filter(author=post.author).select_related('user'):
+        user = subscription.user
+        if not hasattr(user, 'settings') or not user.settings.email_notifications or not user.email:
+            continue
+        html_message = render_to_string('emails/new_post.html', {
+            'post': post,
+            'author': post.author,
+            'subscriber': user,
+        })
+        send_mail(
+            subject=subject,
+            message=subject,
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipient_list=[user.email],
+            html_message=html_message,
+            fail_silently=True,
+        )
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает прежнюю рассылку о новом посте с пачечной (locmem email backend)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--followers', type=int, nargs='+', default=[1_000, 10_000],
+                            help='Количество подписчиков автора')
+        parser.add_argument('--workers', type=int, default=4, help='Потоков для пачечной рассылки')
+        parser.add_argument('--repeat', type=int, default=3, help='Повторов на каждый замер')
+        parser.add_argument('--json', action='store_true', help='Вывести результаты в JSON')
+
+    @override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def handle(self, *args, **options):
+        results = []
+
+        with benchmark_database(stdout=None if options['json'] else self.stdout):
+            mail.outbox = []
+            author = create_users(1, prefix='author')[0]
+            post = Post.objects.create(title='Новый пост', content='текст ' * 200, author=author)
+            post = Post.objects.select_related('author').get(pk=post.pk)
+            followers = []
+
+            for count in sorted(options['followers']):
+                new_followers = create_users(count - len(followers), prefix=f'f{len(followers)}x')
+                Subscribe.objects.bulk_create([Subscribe(user=user, author=author) for user in new_followers])
+                followers += new_followers
+
+                row = {'followers': count}
+                for name, func in [
+                    ('legacy', lambda: legacy_fan_out(post)),
+                    ('chunked', lambda: fan_out_new_post(post, workers=options['workers'])),
+                ]:
+                    with CaptureQueriesContext(connection) as queries:
+                        func()
+                    mail.outbox = []
+                    row[name] = measure(func, options['repeat'])
+                    row[name]['queries'] = len(queries)
+                    mail.outbox = []
+                row['speedup'] = round(row['legacy']['median_ms'] / max(row['chunked']['median_ms'], 0.001), 1)
+                results.append(row)
+
+                if not options['json']:
+                    self.stdout.write(
+                        f"{count:>7} подписчиков  "
+                        f"прежняя {row['legacy']['median_ms']:>10.1f} мс ({row['legacy']['queries']} запросов)   "
+                        f"пачечная {row['chunked']['median_ms']:>9.1f} мс ({row['chunked']['queries']} запросов)   "
+                        f"x{row['speedup']}"
+                    )
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, ensure_ascii=False, indent=2))
@@ -0,0 +1,23 @@
+"""
+Пересоздание миниатюр аватаров
+"""
+from django.core.management.base import BaseCommand
+
+from users.models import Profile
+from users.thumbnails import generate_avatar_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Создает миниатюры аватаров (WebP и JPEG всех размеров) для существующих профилей'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Пересоздать и актуальные миниатюры')
+
+    def handle(self, *args, **options):
+        # Без --force обрабатываются только устаревшие: новый, смененный или удаленный аватар
+        updated = 0
+        for profile_id in Profile.objects.values_list('pk', flat=True).iterator():
+            if generate_avatar_thumbnails(profile_id, force=options['force']):
+                updated += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Обновлено профилей: {updated}'))
@@ -0,0 +1,14 @@
+"""
+Пересчет статистики авторов
+"""
+from django.core.management.base import BaseCommand
+
+from users.stats import repair_author_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает AuthorStats всех пользователей по фактическим данным (недостающие записи создаются)'
+
+    def handle(self, *args, **options):
+        updated = repair_author_stats()
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано авторов: {updated}'))
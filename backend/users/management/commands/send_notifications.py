@@ -0,0 +1,52 @@
+"""
+Воркер очереди email уведомлений
+"""
+import time
+
+from django.core.management.base import BaseCommand
+
+from users.outbox import deliver_batch, queue_depth
+
+
+class Command(BaseCommand):
+    help = 'Отправляет email уведомления из очереди (OutboxMessage) пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100, help='Размер пачки')
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Пауза в секундах, когда очередь пуста')
+        parser.add_argument('--once', action='store_true',
+                            help='Разобрать готовые записи и завершиться')
+        parser.add_argument('--stats', action='store_true',
+                            help='Показать глубину очереди и завершиться')
+
+    def handle(self, *args, **options):
+        if options['stats']:
+            self.print_depth()
+            return
+
+        try:
+            while True:
+                stats = deliver_batch(options['batch_size'])
+                processed = sum(stats.values())
+                if processed:
+                    self.stdout.write(
+                        f"Отправлено: {stats['sent']}, пропущено: {stats['skipped']}, "
+                        f"отложено: {stats['retried']}, ошибок: {stats['failed']}"
+                    )
+                    continue
+
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+
+        self.print_depth()
+
+    def print_depth(self):
+        depth = queue_depth()
+        self.stdout.write(
+            f"Очередь: готово к отправке {depth['due']}, в ожидании {depth['pending']}, "
+            f"отправлено {depth['sent']}, пропущено {depth['skipped']}, ошибок {depth['failed']}"
+        )
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxmessage',
+            name='cursor',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Прогресс рассылки'),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_author_stats(apps, schema_editor):
+    User = apps.get_model('auth', 'User')
+    AuthorStats = apps.get_model('users', 'AuthorStats')
+    Post = apps.get_model('blog', 'Post')
+    Like = apps.get_model('blog', 'Like')
+    Subscribe = apps.get_model('blog', 'Subscribe')
+
+    def aggregate_subquery(model, field, aggregate):
+        values = (
+            model.objects.filter(**{field: OuterRef('user')})
+            .order_by()
+            .values(field)
+            .annotate(total=aggregate)
+            .values('total')
+        )
+        return Coalesce(Subquery(values), Value(0))
+
+    AuthorStats.objects.bulk_create(
+        [AuthorStats(user_id=pk) for pk in User.objects.values_list('pk', flat=True)],
+        batch_size=1000,
+    )
+    AuthorStats.objects.update(
+        posts_count=aggregate_subquery(Post, 'author', Count('pk')),
+        followers_count=aggregate_subquery(Subscribe, 'author', Count('pk')),
+        following_count=aggregate_subquery(Subscribe, 'user', Count('pk')),
+        likes_received=aggregate_subquery(Like, 'post__author', Count('pk')),
+        total_views=aggregate_subquery(Post, 'author', Sum('views')),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('blog', '0005_tag_post_count'),
+        ('users', '0003_outbox_cursor'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Посты')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Подписчики')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Подписки')),
+                ('likes_received', models.PositiveIntegerField(default=0, verbose_name='Получено лайков')),
+                ('total_views', models.PositiveBigIntegerField(default=0, verbose_name='Просмотры постов')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Дата обновления')),
+            ],
+            options={
+                'verbose_name': 'Статистика автора',
+                'verbose_name_plural': 'Статистика авторов',
+            },
+        ),
+        migrations.RunPython(fill_author_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0005_profile_avatar_thumbnails'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxmessage',
+            name='kind',
+            field=models.CharField(choices=[('comment', 'Новый комментарий'), ('like', 'Новый лайк'), ('follower', 'Новый подписчик'), ('new_post', 'Новый пост'), ('timeline', 'Раскладка поста по лентам')], max_length=20, verbose_name='Тип'),
+        ),
+    ]
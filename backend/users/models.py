@@ -1,8 +1,9 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.db.models import Sum
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
+from django.utils import timezone
 
 
 # Create your models here.
@@ -15,6 +16,9 @@ class Profile(models.Model):
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True, verbose_name='Аватар')
     location = models.CharField(max_length=100, blank=True, verbose_name='Местоположение')
     website = models.URLField(blank=True, verbose_name='Веб-сайт')
+    avatar_thumbnails = models.JSONField(default=dict, blank=True, editable=False, verbose_name='Миниатюры аватара')
+    # Входит в валидаторы страниц поста (аватары автора и комментаторов)
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
     
     def __str__(self):
         return f'Профиль {self.user.username}'
@@ -24,17 +28,19 @@ class Profile(models.Model):
         verbose_name_plural = 'Профили'
 
     def get_total_likes(self):
-        """Получить общее количество лайков на всех постах пользователя"""
-        from blog.models import Like
-        return Like.objects.filter(post__author=self.user).count()
+        """Получить общее количество лайков на всех постах пользователя (из статистики автора)"""
+        from .stats import get_author_stats
+        return get_author_stats(self.user).likes_received
 
     def get_followers_count(self):
-        """Количество подписчиков"""
-        return self.user.subscribers.count()
+        """Количество подписчиков (из статистики автора)"""
+        from .stats import get_author_stats
+        return get_author_stats(self.user).followers_count
 
     def get_following_count(self):
-        """Количество подписок"""
-        return self.user.subscribes.count()
+        """Количество подписок (из статистики автора)"""
+        from .stats import get_author_stats
+        return get_author_stats(self.user).following_count
 
 
 class UserSettings(models.Model):
@@ -58,23 +64,115 @@ class UserSettings(models.Model):
         verbose_name_plural = 'Настройки пользователей'
 
 
+def get_profile(user):
+    """Профиль пользователя; если записи нет (старые пользователи), она создается"""
+    try:
+        return user.profile
+    except Profile.DoesNotExist:
+        user.profile, _ = Profile.objects.get_or_create(user=user)
+        return user.profile
+
+
+def get_user_settings(user):
+    """Настройки пользователя; если записи нет (старые пользователи), она создается"""
+    try:
+        return user.settings
+    except UserSettings.DoesNotExist:
+        user.settings, _ = UserSettings.objects.get_or_create(user=user)
+        return user.settings
+
+
+class OutboxMessage(models.Model):
+    """Очередь email уведомлений и раскладки постов по лентам (outbox), разбирается воркером send_notifications"""
+    KIND_COMMENT = 'comment'
+    KIND_LIKE = 'like'
+    KIND_FOLLOWER = 'follower'
+    KIND_NEW_POST = 'new_post'
+    KIND_TIMELINE = 'timeline'
+    KIND_CHOICES = [
+        (KIND_COMMENT, 'Новый комментарий'),
+        (KIND_LIKE, 'Новый лайк'),
+        (KIND_FOLLOWER, 'Новый подписчик'),
+        (KIND_NEW_POST, 'Новый пост'),
+        (KIND_TIMELINE, 'Раскладка поста по лентам'),
+    ]
+
+    STATUS_PENDING = 'pending'
+    STATUS_SENT = 'sent'
+    STATUS_SKIPPED = 'skipped'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_SENT, 'Отправлено'),
+        (STATUS_SKIPPED, 'Пропущено'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES, verbose_name='Тип')
+    object_id = models.PositiveBigIntegerField(verbose_name='ID объекта')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=STATUS_PENDING, verbose_name='Статус')
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name='Попытки')
+    available_at = models.DateTimeField(default=timezone.now, verbose_name='Доступно с')
+    lease_token = models.CharField(max_length=32, blank=True, verbose_name='Токен захвата')
+    cursor = models.PositiveBigIntegerField(default=0, verbose_name='Прогресс рассылки')
+    last_error = models.TextField(blank=True, verbose_name='Последняя ошибка')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='Дата создания')
+    sent_at = models.DateTimeField(null=True, blank=True, verbose_name='Дата отправки')
+
+    def __str__(self):
+        return f'{self.get_kind_display()} #{self.object_id} ({self.get_status_display()})'
+
+    class Meta:
+        ordering = ['available_at', 'pk']
+        indexes = [
+            models.Index(fields=['status', 'available_at'], name='users_outbox_due_idx'),
+        ]
+        verbose_name = 'Уведомление в очереди'
+        verbose_name_plural = 'Очередь уведомлений'
+
+
+class AuthorStats(models.Model):
+    """Статистика автора для страницы профиля (обновляется сигналами, см. users/stats.py)"""
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    posts_count = models.PositiveIntegerField(default=0, verbose_name='Посты')
+    followers_count = models.PositiveIntegerField(default=0, verbose_name='Подписчики')
+    following_count = models.PositiveIntegerField(default=0, verbose_name='Подписки')
+    likes_received = models.PositiveIntegerField(default=0, verbose_name='Получено лайков')
+    total_views = models.PositiveBigIntegerField(default=0, verbose_name='Просмотры постов')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Дата обновления')
+
+    def __str__(self):
+        return f'Статистика {self.user.username}'
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     """Автоматически создаем профиль и настройки при создании пользователя"""
     if created:
         Profile.objects.create(user=instance)
         UserSettings.objects.create(user=instance)
+        AuthorStats.objects.create(user=instance)
 
 
 @receiver(post_save, sender=User)
-def save_user_profile(sender, instance, **kwargs):
-    """Сохраняем профиль и настройки при сохранении пользователя"""
-    if hasattr(instance, 'profile'):
-        instance.profile.save()
-    else:
-        Profile.objects.create(user=instance)
-    
-    if hasattr(instance, 'settings'):
-        instance.settings.save()
-    else:
-        UserSettings.objects.create(user=instance)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+@receiver(post_save, sender=UserSettings)
+@receiver(post_delete, sender=UserSettings)
+def user_state_changed(sender, instance, **kwargs):
+    """Сбрасываем закэшированного пользователя сессии (см. users/backends.py)"""
+    from .backends import forget_user_state
+    forget_user_state(instance.pk if sender is User else instance.user_id)
+
+
+@receiver(post_save, sender=Profile)
+def avatar_thumbnails_scheduled(sender, instance, **kwargs):
+    """Новый или удаленный аватар: миниатюры пересоздаются вне запроса (см. users/thumbnails.py)"""
+    from .thumbnails import is_stale, schedule_thumbnails
+    if is_stale(instance):
+        schedule_thumbnails(instance.pk)
@@ -0,0 +1,239 @@
+"""
+Очередь email уведомлений (transactional outbox)
+
+В запросе после коммита транзакции добавляется только строка OutboxMessage.
+Письма собирает и отправляет воркер manage.py send_notifications:
+пачками, через одно SMTP-соединение, с повторами и экспоненциальной задержкой.
+Тот же воркер раскладывает новые посты по лентам подписок (blog/timeline.py).
+"""
+import logging
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import Count, F
+from django.utils import timezone
+
+from . import email_utils
+from .models import OutboxMessage
+
+
+logger = logging.getLogger(__name__)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def enqueue_notification(kind, object_id):
+    """Поставить уведомление в очередь после коммита текущей транзакции"""
+    transaction.on_commit(
+        lambda: OutboxMessage.objects.create(kind=kind, object_id=object_id)
+    )
+
+
+def build_emails(message):
+    """
+    Собирает письма для записи очереди
+
+    Returns:
+        Список писем или None, если исходный объект уже удален
+    """
+    from blog.models import Comment, Like, Subscribe
+
+    if message.kind == OutboxMessage.KIND_COMMENT:
+        comment = Comment.objects.select_related('post__author__settings', 'author').filter(pk=message.object_id).first()
+        return email_utils.new_comment_emails(comment) if comment else None
+
+    if message.kind == OutboxMessage.KIND_LIKE:
+        like = Like.objects.select_related('post__author__settings', 'user').filter(pk=message.object_id).first()
+        return email_utils.new_like_emails(like) if like else None
+
+    if message.kind == OutboxMessage.KIND_FOLLOWER:
+        subscription = Subscribe.objects.select_related('author__settings', 'user').filter(pk=message.object_id).first()
+        return email_utils.new_follower_emails(subscription) if subscription else None
+
+    raise ValueError(f'Неизвестный тип уведомления: {message.kind}')
+
+
+def extend_lease(lease_token, lease_seconds=None):
+    """
+    Продлевает аренду еще не обработанных записей пачки
+
+    Обработанные записи сбрасывают токен (см. deliver_batch), поэтому
+    продлевается аренда текущей записи и всех, что ждут после нее.
+    """
+    if lease_seconds is None:
+        lease_seconds = _setting('OUTBOX_LEASE_SECONDS', 300)
+    OutboxMessage.objects.filter(status=OutboxMessage.STATUS_PENDING, lease_token=lease_token).update(
+        available_at=timezone.now() + timedelta(seconds=lease_seconds),
+    )
+
+
+def _progress_saver(message):
+    """
+    Сохранение прогресса длинной рассылки
+
+    Вместе с прогрессом продлевается аренда пачки: иначе рассылку, идущую
+    дольше OUTBOX_LEASE_SECONDS, или записи после нее захватил бы второй
+    воркер и отправил повторно.
+    """
+    def save_progress(cursor):
+        message.cursor = cursor
+        OutboxMessage.objects.filter(pk=message.pk, lease_token=message.lease_token).update(cursor=cursor)
+        extend_lease(message.lease_token)
+
+    return save_progress
+
+
+def deliver_new_post(message):
+    """
+    Рассылка о новом посте с сохранением прогресса
+
+    При повторной попытке рассылка продолжается с последней
+    подтвержденной пачки подписчиков.
+
+    Returns:
+        False, если пост уже удален
+    """
+    from blog.models import Post
+
+    post = Post.objects.select_related('author').filter(pk=message.object_id).first()
+    if post is None:
+        return False
+
+    email_utils.fan_out_new_post(post, after=message.cursor, on_progress=_progress_saver(message))
+    return True
+
+
+def deliver_timeline(message):
+    """
+    Раскладка нового поста по лентам подписчиков с сохранением прогресса
+
+    Returns:
+        False, если пост уже удален
+    """
+    from blog.models import Post
+    from blog.timeline import fan_out_post
+
+    if not Post.objects.filter(pk=message.object_id).exists():
+        return False
+
+    fan_out_post(message.object_id, after=message.cursor, on_progress=_progress_saver(message))
+    return True
+
+
+def claim_batch(batch_size, lease_seconds=None):
+    """
+    Захватывает пачку готовых к отправке записей
+
+    Записи получают токен и откладываются на время аренды, поэтому
+    параллельные воркеры их не возьмут, а после падения воркера
+    они снова станут доступны.
+    """
+    if lease_seconds is None:
+        lease_seconds = _setting('OUTBOX_LEASE_SECONDS', 300)
+
+    now = timezone.now()
+    due = OutboxMessage.objects.filter(status=OutboxMessage.STATUS_PENDING, available_at__lte=now)
+    ids = list(due.order_by('available_at', 'pk').values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return []
+
+    token = uuid.uuid4().hex
+    due.filter(pk__in=ids).update(
+        lease_token=token,
+        available_at=now + timedelta(seconds=lease_seconds),
+        attempts=F('attempts') + 1,
+    )
+    return list(OutboxMessage.objects.filter(lease_token=token).order_by('pk'))
+
+
+def retry_delay(attempts):
+    """Задержка перед следующей попыткой: экспоненциальная, с ограничением сверху"""
+    base = _setting('OUTBOX_RETRY_BACKOFF', 30)
+    return min(base * 2 ** max(attempts - 1, 0), _setting('OUTBOX_RETRY_MAX_DELAY', 3600))
+
+
+def deliver_batch(batch_size=100, connection=None):
+    """
+    Отправляет одну пачку уведомлений
+
+    Returns:
+        Словарь с количеством отправленных, пропущенных, отложенных и проваленных записей
+    """
+    stats = {'sent': 0, 'skipped': 0, 'retried': 0, 'failed': 0}
+    batch = claim_batch(batch_size)
+    if not batch:
+        return stats
+
+    max_attempts = _setting('OUTBOX_MAX_ATTEMPTS', 5)
+    connection = connection or get_connection()
+    opened = False
+
+    # Одно соединение на всю пачку; открывается при первом письме, отправляемом из пачки
+    try:
+        for message in batch:
+            try:
+                if message.kind == OutboxMessage.KIND_NEW_POST:
+                    # Рассылка подписчикам идет своими пачками и соединениями
+                    delivered = deliver_new_post(message)
+                elif message.kind == OutboxMessage.KIND_TIMELINE:
+                    delivered = deliver_timeline(message)
+                else:
+                    emails = build_emails(message)
+                    delivered = emails is not None
+                    if emails:
+                        if not opened:
+                            connection.open()
+                            opened = True
+                        connection.send_messages(emails)
+
+                if not delivered:
+                    message.status = OutboxMessage.STATUS_SKIPPED
+                    stats['skipped'] += 1
+                else:
+                    message.status = OutboxMessage.STATUS_SENT
+                    message.sent_at = timezone.now()
+                    stats['sent'] += 1
+                message.last_error = ''
+            except Exception as e:
+                message.last_error = repr(e)
+                if message.attempts >= max_attempts:
+                    message.status = OutboxMessage.STATUS_FAILED
+                    stats['failed'] += 1
+                else:
+                    message.available_at = timezone.now() + timedelta(seconds=retry_delay(message.attempts))
+                    stats['retried'] += 1
+
+            # Запись принадлежит пачке, пока у нее наш токен: иначе ее уже захватил другой воркер
+            released = OutboxMessage.objects.filter(pk=message.pk, lease_token=message.lease_token).update(
+                status=message.status, sent_at=message.sent_at, available_at=message.available_at,
+                last_error=message.last_error, lease_token='',
+            )
+            if not released:
+                logger.warning('Аренда записи очереди %s истекла до конца обработки', message.pk)
+    finally:
+        if opened:
+            connection.close()
+
+    return stats
+
+
+def queue_depth():
+    """
+    Глубина очереди
+
+    Returns:
+        Словарь: количество записей по статусам и число готовых к отправке ('due')
+    """
+    depth = {status: 0 for status, _ in OutboxMessage.STATUS_CHOICES}
+    rows = OutboxMessage.objects.order_by().values('status').annotate(total=Count('pk'))
+    depth.update({row['status']: row['total'] for row in rows})
+    depth['due'] = OutboxMessage.objects.filter(
+        status=OutboxMessage.STATUS_PENDING,
+        available_at__lte=timezone.now(),
+    ).count()
+    return depth
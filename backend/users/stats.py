@@ -0,0 +1,113 @@
+"""
+Статистика авторов (AuthorStats)
+
+Счетчики меняются атомарными UPDATE из сигналов постов, лайков и подписок
+и при записи буфера просмотров. Расхождения (массовые операции в обход
+сигналов) исправляет manage.py repair_author_stats.
+"""
+from collections import defaultdict
+
+from django.contrib.auth.models import User
+from django.db.models import Case, Count, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import AuthorStats
+
+
+def adjust_author_stats(user_id, **deltas):
+    """
+    Атомарно изменяет статистику автора
+
+    user_id может быть выражением (например, подзапросом автора поста).
+    Уменьшение не опускает счетчик ниже нуля, даже если он уже разошелся с данными.
+    Пример: adjust_author_stats(author.pk, followers_count=1)
+    """
+    AuthorStats.objects.filter(user_id=user_id).update(**{
+        field: F(field) + delta if delta >= 0 else Greatest(F(field) + delta, Value(0))
+        for field, delta in deltas.items()
+    })
+
+
+def post_author(post_id):
+    """Подзапрос id автора поста (без отдельного SELECT)"""
+    from blog.models import Post
+    return Subquery(Post.objects.filter(pk=post_id).values('author_id')[:1])
+
+
+def add_author_views(post_views):
+    """
+    Переносит записанные просмотры постов в статистику авторов
+
+    Args:
+        post_views: Словарь {id поста: количество просмотров}
+    """
+    from blog.models import Post
+
+    by_author = defaultdict(int)
+    rows = Post.objects.filter(pk__in=list(post_views)).values_list('pk', 'author_id')
+    for post_id, author_id in rows:
+        by_author[author_id] += post_views[post_id]
+
+    if not by_author:
+        return
+    # Один UPDATE на всех авторов: прирост каждого - в CASE
+    AuthorStats.objects.filter(user_id__in=list(by_author)).update(total_views=F('total_views') + Case(
+        *[When(user_id=author_id, then=Value(amount)) for author_id, amount in by_author.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    ))
+
+
+def _aggregate_subquery(queryset, field, aggregate):
+    """Подзапрос с агрегатом по связанным записям пользователя"""
+    values = (
+        queryset.filter(**{field: OuterRef('user')})
+        .order_by()
+        .values(field)
+        .annotate(total=aggregate)
+        .values('total')
+    )
+    return Coalesce(Subquery(values), Value(0))
+
+
+def repair_author_stats(users=None):
+    """
+    Пересчитывает статистику по фактическим данным
+
+    Недостающие записи создаются, затем все значения обновляются одним UPDATE.
+
+    Args:
+        users: QuerySet пользователей (по умолчанию все)
+
+    Returns:
+        Количество обновленных записей
+    """
+    from blog.models import Post, Like, Subscribe
+
+    if users is None:
+        users = User.objects.all()
+
+    user_ids = users.values_list('pk', flat=True)
+    missing = user_ids.exclude(stats__isnull=False)
+    AuthorStats.objects.bulk_create(
+        [AuthorStats(user_id=pk) for pk in missing],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+    return AuthorStats.objects.filter(user_id__in=user_ids).update(
+        posts_count=_aggregate_subquery(Post.objects.all(), 'author', Count('pk')),
+        followers_count=_aggregate_subquery(Subscribe.objects.all(), 'author', Count('pk')),
+        following_count=_aggregate_subquery(Subscribe.objects.all(), 'user', Count('pk')),
+        likes_received=_aggregate_subquery(Like.objects.all(), 'post__author', Count('pk')),
+        total_views=_aggregate_subquery(Post.objects.all(), 'author', Sum('views')),
+    )
+
+
+def get_author_stats(user):
+    """Статистика автора; если записи нет, она восстанавливается по фактическим данным"""
+    try:
+        return user.stats
+    except AuthorStats.DoesNotExist:
+        repair_author_stats(User.objects.filter(pk=user.pk))
+        return AuthorStats.objects.get(user=user)
@@ -0,0 +1,40 @@
+"""
+Template tags для аватаров
+"""
+from django import template
+from django.utils.html import format_html
+
+from users.models import Profile
+from users.thumbnails import AVATAR_SIZES, thumbnail_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def avatar(user, size='md'):
+    """
+    Аватар пользователя в нужном размере (WebP с JPEG запасным вариантом)
+    Использование: {% avatar post.author 'md' %}; размеры и CSS классы - AVATAR_SIZES
+    Для списков пользователя стоит выбирать с select_related('profile').
+    """
+    try:
+        profile = user.profile
+    except Profile.DoesNotExist:
+        return ''
+    if not profile.avatar:
+        return ''
+
+    pixels, css_class = AVATAR_SIZES[size]
+    jpeg = thumbnail_url(profile, size, 'jpeg')
+    webp = thumbnail_url(profile, size, 'webp')
+    img = format_html(
+        '<img src="{}" alt="{}" class="{}" width="{}" height="{}">',
+        jpeg, user.username, css_class, pixels, pixels,
+    )
+    if webp == jpeg:
+        # Миниатюры еще не созданы: исходный файл
+        return img
+    return format_html(
+        '<picture class="avatar-picture"><source type="image/webp" srcset="{}">{}</picture>',
+        webp, img,
+    )
@@ -1,3 +1,500 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image
+
+from blog.models import Post, Like, Comment, Subscribe
+from blog.view_counter import ViewCounter
+from .backends import load_user_state
+from .email_utils import fan_out_new_post
+from .models import AuthorStats, OutboxMessage, Profile, UserSettings
+from .outbox import claim_batch, deliver_batch, deliver_new_post, queue_depth
+from .thumbnails import AVATAR_SIZES, SCALE, generate_avatar_thumbnails, thumbnail_url
+
+
+class OutboxTests(TestCase):
+    """Очередь email уведомлений"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.reader = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.post = Post.objects.create(title='Пост', content='текст', author=self.author)
+
+    def test_enqueued_only_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            Like.objects.create(post=self.post, user=self.reader)
+            self.assertFalse(OutboxMessage.objects.exists())
+        for callback in callbacks:
+            callback()
+        self.assertEqual(OutboxMessage.objects.get().kind, OutboxMessage.KIND_LIKE)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_worker_sends_batch_over_one_connection(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(post=self.post, user=self.reader)
+            Comment.objects.create(post=self.post, author=self.reader, content='!')
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as opened:
+            stats = deliver_batch()
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual(stats['sent'], 2)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(queue_depth()['sent'], 2)
+
+    def test_fan_out_batch_opens_no_connection(self):
+        Subscribe.objects.create(user=self.reader, author=self.author)
+        OutboxMessage.objects.create(kind=OutboxMessage.KIND_TIMELINE, object_id=self.post.pk)
+        OutboxMessage.objects.create(kind=OutboxMessage.KIND_NEW_POST, object_id=self.post.pk)
+
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open') as opened:
+            self.assertEqual(deliver_batch()['sent'], 2)
+        # Рассылка о новом посте открывает свои соединения, пачка - ни одного
+        self.assertEqual(opened.call_count, 1)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_fan_out_progress_extends_lease(self):
+        followers = [
+            User.objects.create_user(f'follower{i}', f'follower{i}@example.com', 'password')
+            for i in range(4)
+        ]
+        Subscribe.objects.bulk_create([Subscribe(user=user, author=self.author) for user in followers])
+        new_post = OutboxMessage.objects.create(kind=OutboxMessage.KIND_NEW_POST, object_id=self.post.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(post=self.post, user=self.reader)
+
+        from . import email_utils
+        recipient_chunks = email_utils._new_post_recipient_chunks
+        claimed = []
+
+        def chunks(post, after, chunk_size):
+            for index, rows in enumerate(recipient_chunks(post, after, chunk_size)):
+                if index == 2:
+                    # Первые пачки отправлены, аренда продлена: второй воркер ничего не захватит
+                    claimed.extend(claim_batch(10))
+                yield rows
+
+        # Пачка захвачена с истекающей сразу арендой
+        expiring_claim = mock.patch('users.outbox.claim_batch', side_effect=lambda size: claim_batch(size, lease_seconds=0))
+        with self.settings(OUTBOX_LEASE_SECONDS=60, NOTIFY_FANOUT_CHUNK_SIZE=1, NOTIFY_FANOUT_WORKERS=2), \
+                expiring_claim, mock.patch('users.email_utils._new_post_recipient_chunks', side_effect=chunks):
+            self.assertEqual(deliver_batch()['sent'], 2)
+
+        self.assertEqual(claimed, [])
+        self.assertEqual(len(mail.outbox), 5)
+        new_post.refresh_from_db()
+        self.assertEqual(new_post.cursor, Subscribe.objects.filter(author=self.author).latest('pk').pk)
+        self.assertEqual(set(OutboxMessage.objects.values_list('status', 'lease_token')), {(OutboxMessage.STATUS_SENT, '')})
+
+    def test_status_not_written_after_lease_lost(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(post=self.post, user=self.reader)
+
+        def release(message):
+            # Аренда истекла, запись захватил другой воркер
+            OutboxMessage.objects.filter(pk=message.pk).update(lease_token='other')
+            return []
+
+        with mock.patch('users.outbox.build_emails', side_effect=release), \
+                self.assertLogs('users.outbox', 'WARNING'):
+            deliver_batch()
+        message = OutboxMessage.objects.get()
+        self.assertEqual((message.status, message.lease_token), (OutboxMessage.STATUS_PENDING, 'other'))
+
+    def test_deleted_object_is_skipped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            like = Like.objects.create(post=self.post, user=self.reader)
+        like.delete()
+        self.assertEqual(deliver_batch()['skipped'], 1)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_retry_with_backoff_then_fail(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(post=self.post, user=self.reader)
+
+        with self.settings(OUTBOX_MAX_ATTEMPTS=2, OUTBOX_RETRY_BACKOFF=0), \
+                mock.patch('django.core.mail.backends.locmem.EmailBackend.send_messages',
+                           side_effect=ConnectionError('smtp down')):
+            self.assertEqual(deliver_batch()['retried'], 1)
+            message = OutboxMessage.objects.get()
+            self.assertEqual((message.status, message.attempts), (OutboxMessage.STATUS_PENDING, 1))
+            self.assertIn('smtp down', message.last_error)
+            self.assertEqual(deliver_batch()['failed'], 1)
+
+        self.assertEqual(OutboxMessage.objects.get().status, OutboxMessage.STATUS_FAILED)
+
+    def test_worker_command(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Like.objects.create(post=self.post, user=self.reader)
+        out = StringIO()
+        call_command('send_notifications', '--once', stdout=out)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('готово к отправке 0', out.getvalue())
+
+
+class NewPostFanOutTests(TestCase):
+    """Пачечная рассылка о новом посте"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.followers = [
+            User.objects.create_user(f'follower{i}', f'follower{i}@example.com', 'password')
+            for i in range(7)
+        ]
+        Subscribe.objects.bulk_create([Subscribe(user=user, author=self.author) for user in self.followers])
+        UserSettings.objects.filter(user=self.followers[0]).update(email_notifications=False)
+        User.objects.filter(pk=self.followers[1].pk).update(email='')
+        self.post = Post.objects.create(title='Пост', content='текст', author=self.author)
+
+    def test_chunked_parallel_fan_out(self):
+        with self.assertNumQueries(4):
+            sent = fan_out_new_post(self.post, chunk_size=2, workers=3)
+        self.assertEqual(sent, 5)
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            [f'follower{i}@example.com' for i in range(2, 7)],
+        )
+        html, _ = mail.outbox[0].alternatives[0]
+        self.assertIn(f'Привет, {mail.outbox[0].to[0].split("@")[0]}!', html)
+
+    def test_pool_threads_close_connections(self):
+        with mock.patch('users.email_utils.connections.close_all') as close_all:
+            fan_out_new_post(self.post, chunk_size=2, workers=3)
+        # По одному закрытию на пачку: 5 получателей по 2
+        self.assertEqual(close_all.call_count, 3)
+
+    def test_parallel_progress_reported_during_fan_out(self):
+        from . import email_utils
+        send = email_utils._send_new_post_chunk
+        progress = []
+        seen_progress = []
+
+        def send_chunk(post, subject, rows):
+            seen_progress.append(len(progress))
+            return send(post, subject, rows)
+
+        with mock.patch('users.email_utils._send_new_post_chunk', side_effect=send_chunk):
+            sent = fan_out_new_post(self.post, chunk_size=1, workers=2, on_progress=progress.append)
+        self.assertEqual(sent, 5)
+        self.assertEqual(progress, sorted(progress))
+        self.assertEqual(len(progress), 5)
+        # Последние пачки отправлялись, когда прогресс первых уже сохранен
+        self.assertGreater(max(seen_progress), 0)
+
+    def test_parallel_fan_out_stops_after_failure(self):
+        from . import email_utils
+        send = email_utils._send_new_post_chunk
+        progress = []
+
+        def send_chunk(post, subject, rows):
+            if rows[0][2] == 'follower3@example.com':
+                raise ConnectionError('smtp down')
+            return send(post, subject, rows)
+
+        with mock.patch('users.email_utils._send_new_post_chunk', side_effect=send_chunk), \
+                self.assertRaises(ConnectionError):
+            fan_out_new_post(self.post, chunk_size=1, workers=2, on_progress=progress.append)
+        self.assertEqual(len(progress), 1)
+        # В работе было не больше двух пачек: после ошибки новые не отправлялись
+        self.assertEqual(
+            sorted(message.to[0] for message in mail.outbox),
+            ['follower2@example.com', 'follower4@example.com'],
+        )
+
+    def test_resume_after_progress(self):
+        progress = []
+        fan_out_new_post(self.post, chunk_size=2, workers=1, on_progress=progress.append)
+        mail.outbox = []
+        self.assertEqual(fan_out_new_post(self.post, after=progress[0], chunk_size=2, workers=1), 3)
+
+
+class AuthorStatsTests(TestCase):
+    """Хранимая статистика авторов"""
+
+    def setUp(self):
+        self.author = User.objects.create_user('author', 'author@example.com', 'password')
+        self.reader = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.other = User.objects.create_user('other', 'other@example.com', 'password')
+
+    def live(self, user):
+        """Статистика по фактическим данным"""
+        return {
+            'posts_count': user.posts.count(),
+            'followers_count': user.subscribers.count(),
+            'following_count': user.subscribes.count(),
+            'likes_received': Like.objects.filter(post__author=user).count(),
+            'total_views': user.posts.aggregate(total=Sum('views'))['total'] or 0,
+        }
+
+    def assertConsistent(self):
+        for user in User.objects.all():
+            stored = AuthorStats.objects.filter(user=user).values(*self.live(user)).get()
+            self.assertEqual(stored, self.live(user), user.username)
+
+    def test_write_paths_keep_stats_consistent(self):
+        first = Post.objects.create(title='Первый', content='текст', author=self.author)
+        second = Post.objects.create(title='Второй', content='текст', author=self.author)
+        Like.objects.create(post=first, user=self.reader)
+        Like.objects.create(post=second, user=self.reader)
+        Like.objects.create(post=second, user=self.other)
+        Subscribe.objects.create(user=self.reader, author=self.author)
+        Subscribe.objects.create(user=self.other, author=self.author)
+        self.assertConsistent()
+
+        Like.objects.filter(user=self.other).delete()
+        Subscribe.objects.filter(user=self.other).delete()
+        self.assertConsistent()
+
+        # Каскадные удаления: пост с лайками и пользователь с лайками и подписками
+        second.delete()
+        self.reader.delete()
+        self.assertConsistent()
+        self.assertEqual(AuthorStats.objects.get(user=self.author).posts_count, 1)
+
+    def test_flushed_views_reach_author(self):
+        post = Post.objects.create(title='Пост', content='текст', author=self.author)
+        counter = ViewCounter(threshold=1000, interval=3600)
+        for _ in range(3):
+            counter.incr(post.pk)
+        counter.flush()
+        self.assertEqual(AuthorStats.objects.get(user=self.author).total_views, 3)
+        self.assertConsistent()
+
+    def test_repair_command(self):
+        post = Post.objects.create(title='Пост', content='текст', author=self.author)
+        Like.objects.create(post=post, user=self.reader)
+        AuthorStats.objects.update(posts_count=99, likes_received=0)
+        AuthorStats.objects.filter(user=self.other).delete()
+        call_command('repair_author_stats', stdout=StringIO())
+        self.assertConsistent()
+
+    def test_profile_reads_stored_stats(self):
+        post = Post.objects.create(title='Пост', content='текст', author=self.author)
+        Like.objects.create(post=post, user=self.reader)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('users:profile', args=['author']))
+        self.assertEqual(response.context['stats'].likes_received, 1)
+        self.assertFalse([query for query in queries if 'blog_like' in query['sql']])
+
+    def test_profile_post_count_without_count_query(self):
+        Post.objects.bulk_create([Post(title=f'Пост {i}', content='текст', author=self.author) for i in range(7)])
+        call_command('repair_author_stats', stdout=StringIO())
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('users:profile', args=['author']))
+        self.assertContains(response, 'Постов: 7')
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+
+
+class UserStateTests(TestCase):
+    """Пользователь сессии загружается вместе с профилем и настройками"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('reader', 'reader@example.com', 'password')
+        self.client.force_login(self.user)
+        UserSettings.objects.filter(user=self.user).update(theme='dark')
+        cache.clear()
+
+    def user_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('blog:index'))
+        tables = ('"auth_user"', '"users_profile"', '"users_usersettings"')
+        return response, [query['sql'] for query in queries if any(f'FROM {table}' in query['sql'] for table in tables)]
+
+    def test_single_joined_query(self):
+        response, queries = self.user_queries()
+        self.assertContains(response, 'data-theme="dark"')
+        self.assertEqual(len(queries), 1)
+        self.assertIn('users_profile', queries[0])
+
+    def test_model_backend_session_still_valid(self):
+        # Сессия, созданная до появления UserStateBackend
+        self.client.logout()
+        self.client.force_login(self.user, backend='django.contrib.auth.backends.ModelBackend')
+        response = self.client.get(reverse('users:settings'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_register_logs_in(self):
+        self.client.logout()
+        response = self.client.post(reverse('users:register'), {
+            'username': 'newcomer', 'email': 'newcomer@example.com',
+            'password1': 'S3cure-pass-123', 'password2': 'S3cure-pass-123',
+        })
+        self.assertRedirects(response, reverse('blog:index'))
+        self.assertEqual(self.client.session['_auth_user_backend'], 'users.backends.UserStateBackend')
+
+    @override_settings(USER_STATE_CACHE_TIMEOUT=60)
+    def test_cache_invalidated_on_settings_save(self):
+        self.user_queries()
+        response, queries = self.user_queries()
+        self.assertContains(response, 'data-theme="dark"')
+        self.assertEqual(queries, [])
+
+        self.client.post(reverse('users:settings'), {
+            'username': 'reader', 'email': 'reader@example.com', 'theme': 'cyber',
+        })
+        response, queries = self.user_queries()
+        self.assertContains(response, 'data-theme="cyber"')
+        self.assertEqual(len(queries), 1)
+
+
+class ProfileWriteTests(TestCase):
+    """Профиль и настройки не перезаписываются при сохранении User"""
+
+    def profile_writes(self, queries):
+        return [
+            query['sql'] for query in queries
+            if query['sql'].startswith(('INSERT', 'UPDATE'))
+            and ('"users_profile"' in query['sql'] or '"users_usersettings"' in query['sql'])
+        ]
+
+    def test_login(self):
+        User.objects.create_user('reader', 'reader@example.com', 'password')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('users:login'), {'username': 'reader', 'password': 'password'})
+        self.assertRedirects(response, reverse('blog:index'), fetch_redirect_response=False)
+        self.assertEqual(self.profile_writes(queries), [])
+        # SELECT пользователя, UPDATE last_login и три запроса сессии
+        self.assertEqual(len([query for query in queries if 'SAVEPOINT' not in query['sql']]), 5)
+
+    def test_registration(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('users:register'), {
+                'username': 'newbie', 'email': 'newbie@example.com',
+                'password1': 'Sup3r-secret!', 'password2': 'Sup3r-secret!',
+            })
+        writes = self.profile_writes(queries)
+        self.assertEqual(len(writes), 2)
+        self.assertTrue(all(sql.startswith('INSERT') for sql in writes))
+
+    def test_missing_rows_created_lazily(self):
+        user = User.objects.create_user('legacy', 'legacy@example.com', 'password')
+        Profile.objects.filter(user=user).delete()
+        UserSettings.objects.filter(user=user).delete()
+        self.client.force_login(user)
+        self.assertEqual(self.client.get(reverse('users:settings')).status_code, 200)
+        self.assertTrue(Profile.objects.filter(user=user).exists())
+        self.assertTrue(UserSettings.objects.filter(user=user).exists())
+
+    def test_backfill_command(self):
+        users = [User.objects.create_user(f'user{i}', f'user{i}@example.com', 'password') for i in range(3)]
+        Profile.objects.filter(user__in=users[:2]).delete()
+        UserSettings.objects.filter(user=users[0]).delete()
+        call_command('backfill_user_profiles', stdout=StringIO())
+        self.assertEqual(Profile.objects.count(), 3)
+        self.assertEqual(UserSettings.objects.count(), 3)
+
+
+class AvatarThumbnailTests(TestCase):
+    """Миниатюры аватаров"""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root, AVATAR_THUMBNAIL_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user('author', 'author@example.com', 'password')
+
+    def upload(self, name='photo.jpg', color='red'):
+        buffer = BytesIO()
+        Image.new('RGB', (600, 400), color).save(buffer, 'JPEG')
+        profile = Profile.objects.get(user=self.user)
+        profile.avatar = SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        return Profile.objects.get(pk=profile.pk)
+
+    def test_thumbnails_created_after_upload(self):
+        profile = self.upload()
+        self.assertEqual(profile.avatar_thumbnails['source'], profile.avatar.name)
+        self.assertEqual(set(profile.avatar_thumbnails['sizes']), set(AVATAR_SIZES))
+        for size, (pixels, _) in AVATAR_SIZES.items():
+            for extension, image_format in (('webp', 'WEBP'), ('jpeg', 'JPEG')):
+                with default_storage.open(profile.avatar_thumbnails['sizes'][size][extension]) as file:
+                    image = Image.open(file)
+                    self.assertEqual(image.format, image_format)
+                    self.assertEqual(image.size, (pixels * SCALE, pixels * SCALE))
+
+    def test_template_tag_picks_size(self):
+        self.user.profile = self.upload()
+        html = Template("{% load avatars %}{% avatar user 'md' %}").render(Context({'user': self.user}))
+        self.assertIn('type="image/webp"', html)
+        self.assertIn(default_storage.url(self.user.profile.avatar_thumbnails['sizes']['md']['jpeg']), html)
+        self.assertIn('class="avatar-md"', html)
+
+    def test_replaced_and_removed_avatar(self):
+        old_files = self.upload().avatar_thumbnails['files']
+        profile = self.upload('second.jpg', 'blue')
+        self.assertFalse(any(default_storage.exists(name) for name in old_files))
+        self.assertTrue(all(default_storage.exists(name) for name in profile.avatar_thumbnails['files']))
+
+        profile.avatar = None
+        with self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        self.assertEqual(Profile.objects.get(pk=profile.pk).avatar_thumbnails, {})
+
+    @override_settings(USER_STATE_CACHE_TIMEOUT=60, PAGE_CACHE_TIMEOUT=60)
+    def test_caches_dropped_after_thumbnails(self):
+        cache.clear()
+        Post.objects.create(title='Пост', content='текст', author=self.user)
+        with mock.patch('users.thumbnails.schedule_thumbnails'):
+            profile = self.upload()
+        url = reverse('blog:posts_list')
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'MISS')
+        self.assertEqual(load_user_state(self.user.pk).profile.avatar_thumbnails, {})
+
+        self.assertTrue(generate_avatar_thumbnails(profile.pk))
+        self.assertEqual(load_user_state(self.user.pk).profile.avatar_thumbnails['source'], profile.avatar.name)
+        response = self.client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'MISS')
+        self.assertContains(response, 'type="image/webp"')
+
+    def test_unreadable_avatar_recorded_once(self):
+        profile = Profile.objects.get(user=self.user)
+        profile.avatar = SimpleUploadedFile('broken.jpg', b'not an image', content_type='image/jpeg')
+        with self.assertLogs('users.thumbnails', 'WARNING'), self.captureOnCommitCallbacks(execute=True):
+            profile.save()
+        profile = Profile.objects.get(pk=profile.pk)
+        self.assertEqual(profile.avatar_thumbnails['source'], profile.avatar.name)
+        self.assertEqual(profile.avatar_thumbnails['sizes'], {})
+        self.assertIn('error', profile.avatar_thumbnails)
+        self.assertEqual(thumbnail_url(profile, 'md'), profile.avatar.url)
+
+        # Тот же файл не отправляется на повторную обработку
+        with mock.patch('users.thumbnails.schedule_thumbnails') as scheduled:
+            profile.bio = 'Новое описание'
+            profile.save()
+        scheduled.assert_not_called()
+
+    def test_regenerate_command(self):
+        profile = self.upload()
+        Profile.objects.filter(pk=profile.pk).update(avatar_thumbnails={})
+        call_command('regenerate_avatars', stdout=StringIO())
+        self.assertEqual(set(Profile.objects.get(pk=profile.pk).avatar_thumbnails['sizes']), set(AVATAR_SIZES))
+
+    def test_cards_load_profiles_with_posts(self):
+        self.upload()
+        for i in range(3):
+            author = User.objects.create_user(f'writer{i}', f'writer{i}@example.com', 'password')
+            Post.objects.create(title=f'Пост {i}', content='текст', author=author)
+        Post.objects.create(title='Пост с аватаром', content='текст', author=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('blog:posts_list'))
+        self.assertContains(response, 'class="avatar-md"')
+        self.assertFalse([query for query in queries if 'FROM "users_profile"' in query['sql']])
@@ -0,0 +1,203 @@
+"""
+Миниатюры аватаров
+
+Для каждого размера из AVATAR_SIZES создаются квадратные WebP и JPEG
+(с двойной плотностью для HiDPI экранов). Генерация идет вне запроса:
+после коммита сохранения профиля задача передается в пул потоков
+(AVATAR_THUMBNAIL_WORKERS, 0 - выполнять сразу). Пути хранятся в
+Profile.avatar_thumbnails вместе с именем исходного файла, по которому
+определяется, что миниатюры устарели.
+"""
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .models import Profile
+
+
+logger = logging.getLogger(__name__)
+
+# Размер (CSS пиксели) и CSS класс изображения
+AVATAR_SIZES = {
+    'sm': (32, 'avatar-sm'),
+    'md': (48, 'avatar-md'),
+    'lg': (64, 'avatar-lg'),
+    'user': (80, 'user-avatar'),
+    'preview': (100, 'avatar-preview'),
+    'profile': (150, 'profile-avatar'),
+}
+
+# Плотность пикселей миниатюр (2 - четкие аватары на HiDPI экранах)
+SCALE = 2
+
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 6},
+    'jpeg': {'format': 'JPEG', 'quality': 85, 'optimize': True, 'progressive': True},
+}
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def is_stale(profile):
+    """Миниатюры не соответствуют текущему аватару"""
+    return (profile.avatar.name or '') != profile.avatar_thumbnails.get('source', '')
+
+
+def _thumbnail_name(user_id, source, size, extension):
+    # Хэш исходника в имени: новый аватар получает новые URL (кэш браузера не мешает)
+    digest = hashlib.md5(source.encode()).hexdigest()[:10]
+    return f'avatars/thumbs/{user_id}/{digest}-{size}.{extension}'
+
+
+def _delete_files(thumbnails):
+    for name in thumbnails.get('files', []):
+        try:
+            default_storage.delete(name)
+        except OSError:
+            logger.warning('Не удалось удалить миниатюру %s', name)
+
+
+def render_thumbnails(profile):
+    """
+    Создает файлы миниатюр текущего аватара
+
+    Returns:
+        Словарь для Profile.avatar_thumbnails (пустой, если аватара нет;
+        без размеров и с описанием ошибки, если файл не удалось прочитать)
+    """
+    source = profile.avatar.name
+    if not source:
+        return {}
+
+    try:
+        with profile.avatar.open('rb') as avatar:
+            image = Image.open(avatar)
+            image = ImageOps.exif_transpose(image)
+            image = image.convert('RGB')
+    except (OSError, UnidentifiedImageError) as e:
+        logger.warning('Аватар %s не удалось прочитать', source)
+        # Ошибка запоминается для этого файла: иначе миниатюры оставались бы
+        # устаревшими и задача повторялась бы при каждом сохранении профиля
+        return {'source': source, 'sizes': {}, 'files': [], 'error': repr(e)}
+
+    thumbnails = {'source': source, 'sizes': {}, 'files': []}
+    for size, (pixels, _) in AVATAR_SIZES.items():
+        fitted = ImageOps.fit(image, (pixels * SCALE, pixels * SCALE), Image.Resampling.LANCZOS)
+        urls = {}
+        for extension, options in FORMATS.items():
+            buffer = BytesIO()
+            fitted.save(buffer, **options)
+            name = _thumbnail_name(profile.user_id, source, size, extension)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            name = default_storage.save(name, ContentFile(buffer.getvalue()))
+            urls[extension] = name
+            thumbnails['files'].append(name)
+        thumbnails['sizes'][size] = urls
+    return thumbnails
+
+
+def generate_avatar_thumbnails(profile_id, force=False):
+    """
+    Создает миниатюры аватара профиля и удаляет устаревшие
+
+    Запись идет условным UPDATE: если аватар успели сменить еще раз,
+    результат отбрасывается (новые миниатюры создаст следующая задача).
+
+    Returns:
+        True, если миниатюры обновлены
+    """
+    profile = Profile.objects.filter(pk=profile_id).only('user_id', 'avatar', 'avatar_thumbnails').first()
+    if profile is None or not (force or is_stale(profile)):
+        return False
+
+    old = profile.avatar_thumbnails
+    thumbnails = render_thumbnails(profile)
+    updated = Profile.objects.filter(pk=profile_id, avatar=profile.avatar.name or '').update(
+        avatar_thumbnails=thumbnails, updated_at=timezone.now(),
+    )
+    if not updated:
+        _delete_files(thumbnails)
+        return False
+
+    kept = set(thumbnails.get('files', []))
+    _delete_files({'files': [name for name in old.get('files', []) if name not in kept]})
+    _thumbnails_published(profile.user_id)
+    return True
+
+
+def _thumbnails_published(user_id):
+    """
+    Сброс кэшей, в которых остался полноразмерный аватар
+
+    Условный UPDATE не вызывает post_save профиля, поэтому здесь сбрасывается
+    то же, что сбросили бы его обработчики: пользователь сессии, ETag списков
+    и кэш страниц.
+    """
+    from blog import page_cache
+    from blog.conditional import bump_listing_version
+    from .backends import forget_user_state
+
+    forget_user_state(user_id)
+    bump_listing_version()
+    page_cache.purge(page_cache.ALL_PAGES)
+
+
+def _run(profile_id):
+    try:
+        generate_avatar_thumbnails(profile_id)
+    except Exception:
+        logger.exception('Ошибка создания миниатюр профиля %s', profile_id)
+    finally:
+        close_old_connections()
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=_setting('AVATAR_THUMBNAIL_WORKERS', 2),
+                thread_name_prefix='avatar-thumbnails',
+            )
+        return _executor
+
+
+def schedule_thumbnails(profile_id):
+    """Создание миниатюр после коммита текущей транзакции"""
+    def submit():
+        if _setting('AVATAR_THUMBNAIL_WORKERS', 2):
+            _get_executor().submit(_run, profile_id)
+        else:
+            generate_avatar_thumbnails(profile_id)
+
+    transaction.on_commit(submit)
+
+
+def thumbnail_url(profile, size, extension='jpeg'):
+    """
+    URL миниатюры нужного размера
+
+    Пока миниатюры не созданы (или устарели), возвращается исходный аватар.
+    """
+    if not profile.avatar:
+        return ''
+    if not is_stale(profile):
+        name = profile.avatar_thumbnails.get('sizes', {}).get(size, {}).get(extension)
+        if name:
+            return default_storage.url(name)
+    return profile.avatar.url
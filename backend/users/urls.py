@@ -1,8 +1,12 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
 
 app_name = 'users'
 
+# Страницы чтения: асинхронные представления под ASGI (ASYNC_VIEWS)
+read_views = async_views if settings.ASYNC_VIEWS else views
+
 urlpatterns = [
     # Аутентификация
     path('register/', views.register, name='register'),
@@ -10,7 +14,7 @@ urlpatterns = [
     path('logout/', views.user_logout, name='logout'),
     
     # Профиль
-    path('profile/<str:username>/', views.profile, name='profile'),
+    path('profile/<str:username>/', read_views.profile, name='profile'),
     
     # Настройки
     path('settings/', views.settings, name='settings'),
@@ -1,13 +1,14 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.contrib.auth import login, authenticate, logout
+from django.contrib.auth import login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.contrib import messages
-from django.core.paginator import Paginator
 
 from .forms import UserRegisterForm, UserLoginForm, UserUpdateForm, ProfileUpdateForm, UserSettingsForm
-from .models import Profile
+from .models import get_profile, get_user_settings
+from .stats import get_author_stats
 from blog.models import Post, Subscribe
+from blog.pagination import KeysetPaginator
 
 
 def register(request):
@@ -21,7 +22,8 @@ def register(request):
             user = form.save()
             username = form.cleaned_data.get('username')
             messages.success(request, f'Аккаунт {username} успешно создан!')
-            login(request, user)
+            # Бэкендов несколько: пользователь без authenticate() входит через основной
+            login(request, user, backend='users.backends.UserStateBackend')
             return redirect('blog:index')
     else:
         form = UserRegisterForm()
@@ -40,14 +42,12 @@ def user_login(request):
     if request.method == 'POST':
         form = UserLoginForm(request, data=request.POST)
         if form.is_valid():
-            username = form.cleaned_data.get('username')
-            password = form.cleaned_data.get('password')
-            user = authenticate(username=username, password=password)
-            if user is not None:
-                login(request, user)
-                messages.success(request, f'Добро пожаловать, {username}!')
-                next_url = request.GET.get('next', 'blog:index')
-                return redirect(next_url)
+            # Пользователь уже проверен формой, повторный authenticate не нужен
+            user = form.get_user()
+            login(request, user)
+            messages.success(request, f'Добро пожаловать, {user.username}!')
+            next_url = request.GET.get('next', 'blog:index')
+            return redirect(next_url)
     else:
         form = UserLoginForm()
     
@@ -67,26 +67,34 @@ def user_logout(request):
 
 def profile(request, username):
     """Профиль пользователя"""
-    user = get_object_or_404(User, username=username)
-    profile = user.profile
-    posts = Post.objects.filter(author=user).select_related('author').prefetch_related('tags')
+    user = get_object_or_404(User.objects.select_related('profile', 'stats'), username=username)
+    profile = get_profile(user)
+    stats = get_author_stats(user)
+    posts = (
+        Post.objects.filter(author=user).select_related('author').prefetch_related('tags').defer('content')
+        .with_viewer_state(request.user)
+    )
+    
+    # Курсорная пагинация постов
+    paginator = KeysetPaginator(posts, 5, count=stats.posts_count)
+    page_obj = paginator.get_page(request.GET.get('cursor'))
     
     # Проверяем, подписан ли текущий пользователь
+    # (у всех постов автор один, поэтому флаг берется из первого поста)
     is_subscribed = False
     if request.user.is_authenticated and request.user != user:
-        is_subscribed = Subscribe.objects.filter(
-            user=request.user,
-            author=user
-        ).exists()
-    
-    # Пагинация постов
-    paginator = Paginator(posts, 5)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+        if page_obj:
+            is_subscribed = page_obj[0].viewer_follows_author
+        else:
+            is_subscribed = Subscribe.objects.filter(
+                user=request.user,
+                author=user
+            ).exists()
     
     context = {
         'profile_user': user,
         'profile': profile,
+        'stats': stats,
         'page_obj': page_obj,
         'is_subscribed': is_subscribed,
     }
@@ -96,16 +104,19 @@ def profile(request, username):
 @login_required
 def settings(request):
     """Настройки аккаунта"""
+    profile = get_profile(request.user)
+    user_settings = get_user_settings(request.user)
+
     if request.method == 'POST':
         user_form = UserUpdateForm(request.POST, instance=request.user)
         profile_form = ProfileUpdateForm(
             request.POST,
             request.FILES,
-            instance=request.user.profile
+            instance=profile
         )
         settings_form = UserSettingsForm(
             request.POST,
-            instance=request.user.settings
+            instance=user_settings
         )
         
         if user_form.is_valid() and profile_form.is_valid() and settings_form.is_valid():
@@ -116,8 +127,8 @@ def settings(request):
             return redirect('users:settings')
     else:
         user_form = UserUpdateForm(instance=request.user)
-        profile_form = ProfileUpdateForm(instance=request.user.profile)
-        settings_form = UserSettingsForm(instance=request.user.settings)
+        profile_form = ProfileUpdateForm(instance=profile)
+        settings_form = UserSettingsForm(instance=user_settings)
     
     context = {
         'user_form': user_form,
@@ -130,7 +141,7 @@ def settings(request):
 @login_required
 def my_subscriptions(request):
     """Мои подписки"""
-    subscriptions = Subscribe.objects.filter(user=request.user).select_related('author')
+    subscriptions = Subscribe.objects.filter(user=request.user).select_related('author__stats', 'author__profile')
     
     context = {
         'subscriptions': subscriptions,
@@ -141,7 +152,7 @@ def my_subscriptions(request):
 @login_required
 def my_subscribers(request):
     """Мои подписчики"""
-    subscribers = Subscribe.objects.filter(author=request.user).select_related('user')
+    subscribers = Subscribe.objects.filter(author=request.user).select_related('user__stats', 'user__profile')
     
     context = {
         'subscribers': subscribers,